@@ -0,0 +1,34 @@
+"""add content_hash to document_versions
+
+Revision ID: 0003_add_content_hash
+Revises: 0002_add_pw_hash
+Create Date: 2026-10-16
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0003_add_content_hash'
+down_revision = '0002_add_pw_hash'
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table, column):
+    insp = sa.inspect(op.get_bind())
+    return column in {c['name'] for c in insp.get_columns(table)}
+
+
+def upgrade():
+    # 0001 builds tables from the current models, so fresh DBs already have the column
+    if _has_column('document_versions', 'content_hash'):
+        return
+    with op.batch_alter_table('document_versions') as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64)))
+        batch_op.create_index('ix_document_versions_content_hash', ['content_hash'])
+
+
+def downgrade():
+    with op.batch_alter_table('document_versions') as batch_op:
+        batch_op.drop_index('ix_document_versions_content_hash')
+        batch_op.drop_column('content_hash')
@@ -0,0 +1,31 @@
+"""add content_hash to chunks
+
+Revision ID: 0004_add_chunk_hash
+Revises: 0003_add_content_hash
+Create Date: 2026-10-16
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0004_add_chunk_hash'
+down_revision = '0003_add_content_hash'
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table, column):
+    insp = sa.inspect(op.get_bind())
+    return column in {c['name'] for c in insp.get_columns(table)}
+
+
+def upgrade():
+    if _has_column('chunks', 'content_hash'):
+        return
+    with op.batch_alter_table('chunks') as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64)))
+
+
+def downgrade():
+    with op.batch_alter_table('chunks') as batch_op:
+        batch_op.drop_column('content_hash')
@@ -0,0 +1,32 @@
+"""add lexical (full-text) index over chunks
+
+Revision ID: 0005_chunk_lexical_index
+Revises: 0004_add_chunk_hash
+Create Date: 2026-10-16
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0005_chunk_lexical_index'
+down_revision = '0004_add_chunk_hash'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite: FTS5 table (chunk_id UNINDEXED, text) + chunk_id -> rowid map + sync triggers; Postgres: generated tsvector column + GIN index
+    from app.retrieval.lexical import ensure_index
+
+    ensure_index(op.get_bind())
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        from app.retrieval.lexical import drop_sqlite_index
+
+        drop_sqlite_index(bind)
+    elif bind.dialect.name == 'postgresql':
+        op.execute(sa.text('DROP INDEX IF EXISTS idx_chunks_text_tsv'))
+        op.execute(sa.text('ALTER TABLE chunks DROP COLUMN IF EXISTS text_tsv'))
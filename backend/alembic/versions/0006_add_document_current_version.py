@@ -0,0 +1,41 @@
+"""add current_version_id to documents
+
+Revision ID: 0006_doc_current_version
+Revises: 0005_chunk_lexical_index
+Create Date: 2026-10-16
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0006_doc_current_version'
+down_revision = '0005_chunk_lexical_index'
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table, column):
+    insp = sa.inspect(op.get_bind())
+    return column in {c['name'] for c in insp.get_columns(table)}
+
+
+def upgrade():
+    if not _has_column('documents', 'current_version_id'):
+        with op.batch_alter_table('documents') as batch_op:
+            batch_op.add_column(sa.Column('current_version_id', sa.String(length=36), nullable=True))
+            batch_op.create_foreign_key(
+                'fk_documents_current_version', 'document_versions', ['current_version_id'], ['id']
+            )
+    # backfill: the latest version of each document is the active one
+    op.execute(sa.text(
+        "UPDATE documents SET current_version_id = ("
+        " SELECT dv.id FROM document_versions dv WHERE dv.document_id = documents.id"
+        " ORDER BY dv.version_number DESC LIMIT 1)"
+        " WHERE current_version_id IS NULL"
+    ))
+
+
+def downgrade():
+    with op.batch_alter_table('documents') as batch_op:
+        batch_op.drop_constraint('fk_documents_current_version', type_='foreignkey')
+        batch_op.drop_column('current_version_id')
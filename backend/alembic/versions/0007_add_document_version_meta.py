@@ -0,0 +1,31 @@
+"""add meta to document_versions
+
+Revision ID: 0007_doc_version_meta
+Revises: 0006_doc_current_version
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0007_doc_version_meta'
+down_revision = '0006_doc_current_version'
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table, column):
+    insp = sa.inspect(op.get_bind())
+    return column in {c['name'] for c in insp.get_columns(table)}
+
+
+def upgrade():
+    # existing versions get NULL: they were chunked with fixed windows
+    if not _has_column('document_versions', 'meta'):
+        with op.batch_alter_table('document_versions') as batch_op:
+            batch_op.add_column(sa.Column('meta', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('document_versions') as batch_op:
+        batch_op.drop_column('meta')
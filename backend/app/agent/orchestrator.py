@@ -1,7 +1,8 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from math import ceil
+import os
 import re
 from typing import Any, Dict, List, Optional, Tuple
 
@@ -10,8 +11,15 @@ from sqlalchemy.orm import Session
 
 from app.agent.schemas import AgentCitation, AgentQueryRequest, AgentQueryResponse
 from app.agent.tools import AnswerTool, VectorSearchTool
-from app.db import models
+from app.db import catalog, models
 from app.embeddings.llm import chat
+from app.retrieval import pack_contexts, resolve_mode
+
+# "single_pass": one vector query filtered to the routed documents; "fanout": one query per document.
+AGENT_RETRIEVAL_MODE = os.environ.get("AGENT_RETRIEVAL_MODE", "single_pass").strip().lower()
+# Max hits per routed document in single-pass mode (0 = ceil(top_k / routed documents)).
+AGENT_PER_DOC_QUOTA = int(os.environ.get("AGENT_PER_DOC_QUOTA", "0"))
+MAX_ROUTED_DOCS = 8
 
 
 @dataclass(frozen=True)
@@ -28,6 +36,19 @@ class AgentScope:
         }
 
 
+@dataclass
+class PreparedRun:
+    """A run up to its synthesize step. `answer` is preset when no LLM call is needed."""
+
+    run: models.AgentRun
+    citations: List[AgentCitation]
+    next_idx: int
+    llm_contexts: List[Dict[str, Any]] = field(default_factory=list)
+    answer: Optional[str] = None
+    provider: Optional[str] = None
+    model: Optional[str] = None
+
+
 def _preview(text: str, n: int = 240) -> str:
     t = (text or "").replace("\n", " ").strip()
     return t[:n] + ("..." if len(t) > n else "")
@@ -39,6 +60,16 @@ class AgentOrchestrator:
         self.answer_tool = answer_tool or AnswerTool()
 
     def run(self, req: AgentQueryRequest, *, db: Session, user: Dict[str, Any]) -> AgentQueryResponse:
+        prep = self.prepare(req, db=db, user=user)
+        if prep.answer is None:
+            llm_resp = self.answer_tool.answer(req.message, prep.llm_contexts)
+            prep.answer = llm_resp.get("answer") or ""
+            prep.provider = llm_resp.get("provider")
+            prep.model = llm_resp.get("model")
+        return self.finish(prep, req, db=db)
+
+    def prepare(self, req: AgentQueryRequest, *, db: Session, user: Dict[str, Any]) -> PreparedRun:
+        """Create the run and do everything before the LLM call: interpret, route, retrieve."""
         scope = AgentScope(project_id=req.project_id, kb_id=req.kb_id, document_id=req.document_id)
         self._validate_scope(scope, db=db)
 
@@ -53,7 +84,6 @@ class AgentOrchestrator:
         db.commit()
         db.refresh(run)
 
-        steps_out: List[Dict[str, Any]] = []
         self._add_step(db, run_id=run.id, idx=0, kind="interpret", payload={"scope": scope.to_json(), "mode": req.mode})
 
         intent = self._detect_intent(req.message)
@@ -66,35 +96,7 @@ class AgentOrchestrator:
                 kind="tool_call",
                 payload={"tool": "list_documents", "input": {"scope": scope.to_json()}, "output": {"count": len(citations)}},
             )
-            self._add_step(
-                db,
-                run_id=run.id,
-                idx=2,
-                kind="synthesize",
-                payload={"provider": "db", "model": None, "answer_preview": _preview(answer_text, 320), "citations": len(citations)},
-            )
-            verified, verify_note = self._verify(answer_text, citations)
-            self._add_step(db, run_id=run.id, idx=3, kind="verify", payload={"ok": verified, "note": verify_note})
-
-            run.status = "completed" if verified else "needs_review"
-            run.final_answer = answer_text
-            run.provider = "db"
-            run.model = None
-            run.citations = [c.dict() for c in citations]
-            db.add(run)
-            db.commit()
-
-            if req.return_steps:
-                steps_out = self._read_steps(db, run_id=run.id)
-
-            return AgentQueryResponse(
-                run_id=run.id,
-                answer=answer_text,
-                provider="db",
-                model=None,
-                citations=citations,
-                steps=steps_out if req.return_steps else None,
-            )
+            return PreparedRun(run=run, citations=citations, next_idx=2, answer=answer_text, provider="db")
 
         # If user scoped to a KB but not a specific document, try selecting relevant documents
         selected_doc_ids: List[str] = []
@@ -125,7 +127,22 @@ class AgentOrchestrator:
             )
 
         top_k = max(1, int(req.top_k or 5))
-        contexts = self._retrieve(req.message, top_k=top_k, kb_id=scope.kb_id, document_id=scope.document_id, routed_doc_ids=selected_doc_ids)
+        contexts = self._retrieve(
+            req.message,
+            top_k=top_k,
+            kb_id=scope.kb_id,
+            document_id=scope.document_id,
+            routed_doc_ids=selected_doc_ids,
+            retrieval_mode=req.retrieval_mode,
+            rerank=req.rerank,
+            include_history=req.include_history,
+        )
+        llm_contexts, context_info = pack_contexts(
+            [
+                {"chunk_id": c.chunk_id, "text": c.text, "score": c.score, "metadata": c.metadata or {}}
+                for c in contexts[:top_k]
+            ]
+        )
         self._add_step(
             db,
             run_id=run.id,
@@ -139,8 +156,15 @@ class AgentOrchestrator:
                     "kb_id": scope.kb_id,
                     "document_id": scope.document_id,
                     "routed_document_ids": selected_doc_ids or None,
+                    "retrieval_mode": req.retrieval_mode,
+                    "rerank": req.rerank,
+                    "include_history": req.include_history,
+                },
+                "output": {
+                    "matches": len(contexts),
+                    "top": [{"chunk_id": c.chunk_id, "score": c.score} for c in contexts[:5]],
+                    "context": context_info,
                 },
-                "output": {"matches": len(contexts), "top": [{"chunk_id": c.chunk_id, "score": c.score} for c in contexts[:5]]},
             },
         )
 
@@ -159,47 +183,41 @@ class AgentOrchestrator:
                 "I couldn't find any matching chunks for your request in the current scope. "
                 "Try uploading relevant documents, increasing `top_k`, or widening the scope."
             )
-            provider = None
-            model = None
+            return PreparedRun(run=run, citations=citations, next_idx=3, answer=answer_text)
+        return PreparedRun(run=run, citations=citations, next_idx=3, llm_contexts=llm_contexts)
+
+    def finish(self, prep: PreparedRun, req: AgentQueryRequest, *, db: Session, aborted: bool = False) -> AgentQueryResponse:
+        """
+        Record the synthesize and verify steps for `prep.answer` and close the run.
+        `aborted`: the answer was cut short (streaming client disconnected).
+        """
+        run, citations, answer_text = prep.run, prep.citations, prep.answer or ""
+        synth = {"provider": prep.provider, "model": prep.model, "answer_preview": _preview(answer_text, 320), "citations": len(citations)}
+        if aborted:
+            synth["aborted"] = True
+        self._add_step(db, run_id=run.id, idx=prep.next_idx, kind="synthesize", payload=synth)
+
+        if aborted:
+            verified, verify_note = False, "answer incomplete: client disconnected"
         else:
-            llm_contexts = [
-                {"chunk_id": c.chunk_id, "text": c.text, "score": c.score, "metadata": c.metadata or {}}
-                for c in contexts[: max(1, int(req.top_k or 5))]
-            ]
-            llm_resp = self.answer_tool.answer(req.message, llm_contexts)
-            answer_text = llm_resp.get("answer") or ""
-            provider = llm_resp.get("provider")
-            model = llm_resp.get("model")
-
-        self._add_step(
-            db,
-            run_id=run.id,
-            idx=3,
-            kind="synthesize",
-            payload={"provider": provider, "model": model, "answer_preview": _preview(answer_text, 320), "citations": len(citations)},
-        )
-
-        verified, verify_note = self._verify(answer_text, citations)
-        self._add_step(db, run_id=run.id, idx=4, kind="verify", payload={"ok": verified, "note": verify_note})
+            verified, verify_note = self._verify(answer_text, citations)
+        self._add_step(db, run_id=run.id, idx=prep.next_idx + 1, kind="verify", payload={"ok": verified, "note": verify_note})
 
-        run.status = "completed" if verified else "needs_review"
+        run.status = "aborted" if aborted else "completed" if verified else "needs_review"
         run.final_answer = answer_text
-        run.provider = provider
-        run.model = model
+        run.provider = prep.provider
+        run.model = prep.model
         run.citations = [c.dict() for c in citations]
         db.add(run)
         db.commit()
 
-        if req.return_steps:
-            steps_out = self._read_steps(db, run_id=run.id)
-
         return AgentQueryResponse(
             run_id=run.id,
             answer=answer_text,
-            provider=provider,
-            model=model,
+            provider=prep.provider,
+            model=prep.model,
             citations=citations,
-            steps=steps_out if req.return_steps else None,
+            steps=self._read_steps(db, run_id=run.id) if req.return_steps else None,
         )
 
     def _detect_intent(self, message: str) -> str:
@@ -215,29 +233,15 @@ class AgentOrchestrator:
     def _answer_list_documents(self, message: str, *, scope: AgentScope, db: Session) -> Tuple[str, List[AgentCitation]]:
         # If a specific document is selected, return its profile.
         if scope.document_id:
-            doc = db.get(models.Document, scope.document_id)
-            if not doc:
+            entry = catalog.document_entry(db, scope.document_id)
+            if not entry:
                 return ("No document found for the selected scope.", [AgentCitation(chunk_id=None, metadata={"source": "db", "kind": "missing_document"})])
-            ver = (
-                db.query(models.DocumentVersion)
-                .filter(models.DocumentVersion.document_id == doc.id)
-                .order_by(models.DocumentVersion.version_number.desc())
-                .first()
-            )
-            prof = None
-            if ver:
-                prof = (
-                    db.query(models.DocumentProfile)
-                    .filter(models.DocumentProfile.version_id == ver.id)
-                    .order_by(models.DocumentProfile.created_at.desc())
-                    .first()
-                )
-            summary = (getattr(prof, "summary", None) or "").strip()
-            parts = [f"Selected document: {doc.title or '(untitled)'}", f"document_id: {doc.id}"]
-            if getattr(prof, "doc_type", None):
-                parts.append(f"type: {prof.doc_type}")
-            if getattr(prof, "year_start", None) or getattr(prof, "year_end", None):
-                parts.append(f"years: {prof.year_start or '?'}–{prof.year_end or '?'}")
+            summary = (entry.summary or "").strip()
+            parts = [f"Selected document: {entry.title or '(untitled)'}", f"document_id: {entry.document_id}"]
+            if entry.doc_type:
+                parts.append(f"type: {entry.doc_type}")
+            if entry.year_start or entry.year_end:
+                parts.append(f"years: {entry.year_start or '?'}–{entry.year_end or '?'}")
             if summary:
                 parts.append("")
                 parts.append("Summary:")
@@ -246,7 +250,7 @@ class AgentOrchestrator:
             cite = AgentCitation(
                 chunk_id=None,
                 score=None,
-                metadata={"source": "db", "kind": "document_profile", "document_id": doc.id, "version_id": getattr(ver, "id", None)},
+                metadata={"source": "db", "kind": "document_profile", "document_id": entry.document_id, "version_id": entry.version_id},
                 text_preview=_preview(summary) if summary else None,
             )
             return answer, [cite]
@@ -256,12 +260,7 @@ class AgentOrchestrator:
             cite = AgentCitation(chunk_id=None, metadata={"source": "db", "kind": "missing_kb"}, text_preview=None)
             return answer, [cite]
 
-        docs = (
-            db.query(models.Document)
-            .filter(models.Document.kb_id == scope.kb_id)
-            .order_by(models.Document.created_at.desc())
-            .all()
-        )
+        docs = catalog.kb_catalog(db, scope.kb_id)
         if not docs:
             answer = "No documents found in this KB yet."
             cite = AgentCitation(chunk_id=None, metadata={"source": "db", "kind": "document_list", "kb_id": scope.kb_id, "count": 0})
@@ -270,23 +269,9 @@ class AgentOrchestrator:
         lines = [f"Documents in KB {scope.kb_id} ({len(docs)}):"]
         cites: List[AgentCitation] = []
         for d in docs[:50]:
-            ver = (
-                db.query(models.DocumentVersion)
-                .filter(models.DocumentVersion.document_id == d.id)
-                .order_by(models.DocumentVersion.version_number.desc())
-                .first()
-            )
-            prof = None
-            if ver:
-                prof = (
-                    db.query(models.DocumentProfile)
-                    .filter(models.DocumentProfile.version_id == ver.id)
-                    .order_by(models.DocumentProfile.created_at.desc())
-                    .first()
-                )
-            doc_type = getattr(prof, "doc_type", None)
-            tags = getattr(prof, "tags", None) or []
-            summary = (getattr(prof, "summary", None) or "").strip()
+            doc_type = d.doc_type
+            tags = d.tags
+            summary = (d.summary or "").strip()
             label = d.title or "(untitled)"
             suffix = []
             if doc_type:
@@ -294,12 +279,12 @@ class AgentOrchestrator:
             if tags:
                 suffix.append(",".join([str(t) for t in tags[:3]]))
             extra = f" — {' · '.join(suffix)}" if suffix else ""
-            lines.append(f"- {label}{extra} (document_id={d.id})")
+            lines.append(f"- {label}{extra} (document_id={d.document_id})")
             cites.append(
                 AgentCitation(
                     chunk_id=None,
                     score=None,
-                    metadata={"source": "db", "kind": "document_profile", "document_id": d.id, "version_id": getattr(ver, "id", None)},
+                    metadata={"source": "db", "kind": "document_profile", "document_id": d.document_id, "version_id": d.version_id},
                     text_preview=_preview(summary) if summary else None,
                 )
             )
@@ -315,48 +300,43 @@ class AgentOrchestrator:
         kb_id: Optional[str],
         document_id: Optional[str],
         routed_doc_ids: List[str],
+        retrieval_mode: Optional[str] = None,
+        rerank: Optional[bool] = None,
+        include_history: bool = False,
     ):
+        opts = {"mode": retrieval_mode, "rerank": rerank, "include_history": include_history}
         if document_id:
-            return self.search_tool.search(query, top_k=top_k, kb_id=kb_id, document_id=document_id)
+            return self.search_tool.search(query, top_k=top_k, kb_id=kb_id, document_id=document_id, **opts)
         if routed_doc_ids:
-            per_doc_k = max(1, int(ceil(top_k / max(1, len(routed_doc_ids)))))
+            routed = routed_doc_ids[:MAX_ROUTED_DOCS]
+            per_doc_k = max(1, int(ceil(top_k / max(1, len(routed)))))
+            if AGENT_RETRIEVAL_MODE != "fanout":
+                quota = AGENT_PER_DOC_QUOTA or per_doc_k
+                return self.search_tool.search(query, top_k=top_k, kb_id=kb_id, document_ids=routed, per_doc_quota=quota, **opts)
             all_ctx = []
-            for doc_id in routed_doc_ids[:8]:
-                all_ctx.extend(self.search_tool.search(query, top_k=per_doc_k, kb_id=kb_id, document_id=doc_id))
-            all_ctx.sort(key=lambda c: (c.score is None, c.score))
+            for doc_id in routed:
+                all_ctx.extend(self.search_tool.search(query, top_k=per_doc_k, kb_id=kb_id, document_id=doc_id, **opts))
+            # vector scores are distances (lower is better), hybrid scores are RRF (higher is better)
+            sign = -1 if resolve_mode(retrieval_mode) == "hybrid" else 1
+            all_ctx.sort(key=lambda c: (c.score is None, sign * (c.score or 0)))
             return all_ctx[:top_k]
-        return self.search_tool.search(query, top_k=top_k, kb_id=kb_id, document_id=None)
+        return self.search_tool.search(query, top_k=top_k, kb_id=kb_id, document_id=None, **opts)
 
     def _route_documents(self, query: str, *, kb_id: str, db: Session) -> List[str]:
-        docs = db.query(models.Document).filter(models.Document.kb_id == kb_id).order_by(models.Document.created_at.desc()).all()
+        docs = catalog.kb_catalog(db, kb_id)
         if not docs:
             return []
 
-        candidates: List[Dict[str, Any]] = []
-        for d in docs[:30]:
-            ver = (
-                db.query(models.DocumentVersion)
-                .filter(models.DocumentVersion.document_id == d.id)
-                .order_by(models.DocumentVersion.version_number.desc())
-                .first()
-            )
-            prof = None
-            if ver:
-                prof = (
-                    db.query(models.DocumentProfile)
-                    .filter(models.DocumentProfile.version_id == ver.id)
-                    .order_by(models.DocumentProfile.created_at.desc())
-                    .first()
-                )
-            candidates.append(
-                {
-                    "document_id": d.id,
-                    "title": d.title or "",
-                    "doc_type": getattr(prof, "doc_type", None),
-                    "tags": getattr(prof, "tags", None) or [],
-                    "summary": _preview(getattr(prof, "summary", "") or "", 240),
-                }
-            )
+        candidates: List[Dict[str, Any]] = [
+            {
+                "document_id": d.document_id,
+                "title": d.title or "",
+                "doc_type": d.doc_type,
+                "tags": d.tags,
+                "summary": _preview(d.summary or "", 240),
+            }
+            for d in docs[:30]
+        ]
 
         # If we don't have any profiles yet, routing doesn't add much value.
         if not any(c.get("summary") for c in candidates):
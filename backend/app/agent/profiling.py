@@ -8,6 +8,9 @@ from typing import Any, Dict, List, Optional
 
 from app.embeddings.llm import chat
 
+# Leading characters of the document text the profile is built from.
+SNIPPET_CHARS = 6000
+
 
 @dataclass(frozen=True)
 class DocumentProfileResult:
@@ -65,7 +68,7 @@ def generate_document_profile(*, title: str, file_name: str, text: str) -> Docum
     Generate a compact, searchable profile for a document version.
     Uses the configured LLM provider when available; falls back to simple heuristics.
     """
-    snippet = (text or "")[:6000]
+    snippet = (text or "")[:SNIPPET_CHARS]
     messages = [
         {
             "role": "system",
@@ -92,7 +95,8 @@ def generate_document_profile(*, title: str, file_name: str, text: str) -> Docum
     ]
 
     try:
-        resp = chat(messages)
+        # same excerpt, same profile: re-uploads and re-ingests reuse the cached response
+        resp = chat(messages, cache=True)
         data = _extract_json_obj(resp.get("content") or "")
         if not isinstance(data, dict):
             return _fallback_profile(text)
@@ -1,11 +1,16 @@
 from __future__ import annotations
 
+import time
+from typing import Any, Dict
+
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
-from app.agent.orchestrator import AgentOrchestrator
+from app.agent.orchestrator import AgentOrchestrator, PreparedRun
 from app.agent.schemas import AgentQueryRequest, AgentQueryResponse, AgentRetryRequest, AgentRunRead, AgentCitation, AgentStepRead
 from app.api.auth import get_current_user
+from app.api.streaming import answer_events, event_stream, shielded, shielded_aclose, sse
 from app.db.session import get_session
 from app.db import models
 
@@ -19,6 +24,50 @@ def agent_query(payload: AgentQueryRequest, db: Session = Depends(get_session),
     return _orchestrator.run(payload, db=db, user=user)
 
 
+def _take_answer(prep: PreparedRun, result: Dict[str, Any]) -> None:
+    if prep.answer is None:
+        prep.answer, prep.provider, prep.model = result.get("answer") or "", result.get("provider"), result.get("model")
+
+
+@router.post("/query/stream")
+async def agent_query_stream(payload: AgentQueryRequest, db: Session = Depends(get_session), user=Depends(get_current_user)):
+    """
+    `/agent/query` as server-sent events: `sources` {run_id, citations}, the
+    answer as `token` events, then `done` with the full AgentQueryResponse.
+    The synthesize/verify steps and the run's final state are written after
+    the last token; a run whose client disconnects mid-answer is stored with
+    the partial answer and status "aborted".
+    """
+    started = time.perf_counter()
+    prep = await run_in_threadpool(_orchestrator.prepare, payload, db=db, user=user)
+
+    async def events():
+        yield sse("sources", {"run_id": prep.run.id, "citations": [c.dict() for c in prep.citations]})
+        result: Dict[str, Any] = {}
+        tokens = answer_events(
+            payload.message,
+            prep.llm_contexts,
+            started=started,
+            result=result,
+            text=prep.answer,
+            stream=_orchestrator.answer_tool.astream,
+        )
+        try:
+            async for event in tokens:
+                yield event
+        except BaseException:
+            # client disconnected: keep the partial answer and close the run as aborted
+            await shielded_aclose(tokens)
+            _take_answer(prep, result)
+            await shielded(_orchestrator.finish, prep, payload, db=db, aborted=True)
+            raise
+        _take_answer(prep, result)
+        resp = await run_in_threadpool(_orchestrator.finish, prep, payload, db=db)
+        yield sse("done", {**resp.dict(), "ttft_ms": result.get("ttft_ms")})
+
+    return event_stream(events())
+
+
 @router.get("/runs/{run_id}", response_model=AgentRunRead)
 def get_run(run_id: str, db: Session = Depends(get_session), user=Depends(get_current_user)):
     run = db.get(models.AgentRun, run_id)
@@ -63,6 +112,9 @@ def retry_run(run_id: str, payload: AgentRetryRequest, db: Session = Depends(get
         top_k=payload.top_k,
         max_steps=payload.max_steps,
         mode=payload.mode,
+        retrieval_mode=payload.retrieval_mode,
+        rerank=payload.rerank,
+        include_history=payload.include_history,
         return_steps=payload.return_steps,
     )
     return _orchestrator.run(req, db=db, user=user)
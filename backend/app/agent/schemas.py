@@ -7,6 +7,7 @@ from pydantic import BaseModel, Field
 
 
 AgentMode = Literal["auto", "answer", "summarize", "extract"]
+RetrievalMode = Literal["vector", "hybrid"]
 
 
 class AgentQueryRequest(BaseModel):
@@ -17,6 +18,9 @@ class AgentQueryRequest(BaseModel):
     top_k: int = 5
     max_steps: int = 4
     mode: AgentMode = "auto"
+    retrieval_mode: Optional[RetrievalMode] = None  # defaults to RETRIEVAL_MODE
+    rerank: Optional[bool] = None  # defaults to RERANK_ENABLED
+    include_history: bool = False  # also search superseded document versions
     return_steps: bool = True
 
 
@@ -63,5 +67,8 @@ class AgentRetryRequest(BaseModel):
     top_k: int = 5
     max_steps: int = 4
     mode: AgentMode = "auto"
+    retrieval_mode: Optional[RetrievalMode] = None
+    rerank: Optional[bool] = None
+    include_history: bool = False
     return_steps: bool = True
 
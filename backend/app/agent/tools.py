@@ -1,10 +1,11 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from dataclasses import dataclass, replace
+from typing import Any, AsyncIterator, Dict, List, Optional
 
 from app.embeddings import vector_store
-from app.embeddings.llm import generate_answer
+from app.embeddings.llm import astream_answer, generate_answer
+from app.retrieval import hybrid_search, resolve_mode, rerank as rerank_stage
 
 
 @dataclass(frozen=True)
@@ -13,6 +14,7 @@ class VectorSearchResult:
     text: str
     score: Optional[float]
     metadata: Dict[str, Any]
+    rerank_score: Optional[float] = None
 
 
 class VectorSearchTool:
@@ -23,14 +25,34 @@ class VectorSearchTool:
         top_k: int,
         kb_id: Optional[str] = None,
         document_id: Optional[str] = None,
+        document_ids: Optional[List[str]] = None,
+        per_doc_quota: Optional[int] = None,
+        mode: Optional[str] = None,
+        rerank: Optional[bool] = None,
+        include_history: bool = False,
     ) -> List[VectorSearchResult]:
-        raw = vector_store.query_documents(query, n_results=top_k, kb_id=kb_id, document_id=document_id)
+        """
+        `mode="hybrid"` fuses vector and lexical hits; scores are then RRF scores (higher is better).
+        `rerank` (default RERANK_ENABLED) over-fetches and keeps the cross-encoder's top_k.
+        `include_history` also searches superseded document versions.
+        """
+        use_rerank = rerank_stage.RERANK_ENABLED if rerank is None else rerank
+        search = hybrid_search if resolve_mode(mode) == "hybrid" else vector_store.query_documents
+        raw = search(
+            query,
+            n_results=rerank_stage.candidates_for(top_k) if use_rerank else top_k,
+            kb_id=kb_id,
+            document_id=document_id,
+            document_ids=document_ids,
+            per_doc_quota=per_doc_quota,
+            include_history=include_history,
+        )
         contexts: List[VectorSearchResult] = []
 
         metadatas = raw.get("metadatas") or []
         documents = raw.get("documents") or []
         ids = raw.get("ids") or []
-        distances = raw.get("distances") or []
+        distances = raw.get("scores") or raw.get("distances") or []
 
         for idx, doc_list in enumerate(documents):
             for j, text in enumerate(doc_list):
@@ -43,6 +65,9 @@ class VectorSearchTool:
                         metadata=meta or {},
                     )
                 )
+        if use_rerank:
+            order, scores, _ = rerank_stage.rerank(query, [c.chunk_id for c in contexts], [c.text for c in contexts], top_k)
+            contexts = [replace(contexts[i], rerank_score=scores[n] if scores else None) for n, i in enumerate(order)]
         return contexts
 
 
@@ -50,3 +75,7 @@ class AnswerTool:
     def answer(self, query: str, contexts: List[Dict[str, Any]]) -> Dict[str, Any]:
         return generate_answer(query, contexts)
 
+    def astream(self, query: str, contexts: List[Dict[str, Any]], meta: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """`answer` as text pieces; fills `meta` with provider/model."""
+        return astream_answer(query, contexts, meta)
+
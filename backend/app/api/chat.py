@@ -1,9 +1,13 @@
-from typing import List
+import time
+from typing import Any, Dict, List
 from fastapi import APIRouter, HTTPException, Depends
+from starlette.concurrency import run_in_threadpool
 
 from app.db import models
 from app.db.session import get_session
-from app.api.rag import rag_query
+from app.api.rag import _parse_query, _retrieve_contexts, rag_query
+from app.api.streaming import answer_events, event_stream, shielded, shielded_aclose, sse
+from app.retrieval import pack_contexts
 from app.api.auth import get_current_user
 
 router = APIRouter(prefix="/chat", tags=["chat"])
@@ -44,8 +48,11 @@ def list_sessions(db=Depends(get_session), user=Depends(get_current_user)):
     return [_serialize_session(s) for s in sessions]
 
 
-@router.post("/sessions/{session_id}/messages", response_model=dict)
-def post_message(session_id: str, payload: dict, db=Depends(get_session), user=Depends(get_current_user)):
+def _start_turn(session_id: str, payload: dict, db, user):
+    """
+    Check the session, store the user's message; returns (session, question,
+    rag payload) as plain dicts, read here because the commit expires the ORM rows.
+    """
     session = db.get(models.ChatSession, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="chat session not found")
@@ -68,18 +75,70 @@ def post_message(session_id: str, payload: dict, db=Depends(get_session), user=D
         "document_id": payload.get("document_id"),
         "top_k": payload.get("top_k") or 5,
     }
-    rag_resp = rag_query(rag_payload, db=db)
+    return _serialize_session(session), {"id": user_msg.id, "content": user_msg.content}, rag_payload
+
 
-    # store assistant message
-    answer_text = rag_resp.get("answer") or ""
-    asst_msg = models.ChatMessage(session_id=session.id, sender="assistant", role="assistant", content=answer_text)
+def _store_answer(db, session_id: str, answer_text: str) -> Dict[str, Any]:
+    asst_msg = models.ChatMessage(session_id=session_id, sender="assistant", role="assistant", content=answer_text)
     db.add(asst_msg)
     db.commit()
     db.refresh(asst_msg)
+    return {"id": asst_msg.id, "content": asst_msg.content}
+
+
+@router.post("/sessions/{session_id}/messages", response_model=dict)
+async def post_message(session_id: str, payload: dict, db=Depends(get_session), user=Depends(get_current_user)):
+    # the session is sync: keep its commits off the event loop
+    session, question, rag_payload = await run_in_threadpool(_start_turn, session_id, payload, db, user)
+    rag_resp = await rag_query(rag_payload, db=db)
+    answer = await run_in_threadpool(_store_answer, db, session["id"], rag_resp.get("answer") or "")
 
     return {
-        "session": _serialize_session(session),
-        "question": {"id": user_msg.id, "content": user_msg.content},
-        "answer": {"id": asst_msg.id, "content": asst_msg.content},
+        "session": session,
+        "question": question,
+        "answer": answer,
         "rag": rag_resp,
     }
+
+
+@router.post("/sessions/{session_id}/messages/stream")
+async def post_message_stream(session_id: str, payload: dict, db=Depends(get_session), user=Depends(get_current_user)):
+    """
+    `post_message` as server-sent events (see `app.api.streaming`). The
+    assistant message is stored once the answer has finished streaming and
+    its id is sent in the `done` event; if the client disconnects first, the
+    partial reply is stored.
+    """
+    started = time.perf_counter()
+    session, question, rag_payload = await run_in_threadpool(_start_turn, session_id, payload, db, user)
+    query, kb_id, doc_id, top_k, mode, use_rerank, include_history = _parse_query(rag_payload)
+    contexts, results, rerank_info = await run_in_threadpool(
+        _retrieve_contexts, db, query, kb_id, doc_id, top_k, mode, use_rerank, include_history
+    )
+
+    packed, context_info = pack_contexts(contexts)
+
+    async def events():
+        yield sse("sources", {
+            "session": session,
+            "question": question,
+            "timings_ms": results.get("timings_ms"),
+            "degraded": results.get("degraded"),
+            "context": context_info,
+            "sources": contexts,
+        })
+        result: Dict[str, Any] = {}
+        tokens = answer_events(query, packed, started=started, result=result)
+        try:
+            async for event in tokens:
+                yield event
+        except BaseException:
+            # client disconnected: keep the part of the reply that was generated
+            await shielded_aclose(tokens)
+            if result.get("answer"):
+                await shielded(_store_answer, db, session["id"], result["answer"])
+            raise
+        answer = await run_in_threadpool(_store_answer, db, session["id"], result.get("answer") or "")
+        yield sse("done", {**result, "answer": answer})
+
+    return event_stream(events())
@@ -1,13 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from typing import List
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
 
 from app.db.session import get_session
-from app.db import models
-from app.schemas import DocumentCreate, DocumentRead, DocumentUpdate
-from app.parsers.chunker import chunk_text
+from app.db import catalog, models
+from app.db.bulk import delete_documents, delete_versions
+from app.db.versions import ingested_version, latest_version_id, set_current_version
 from app.embeddings import vector_store
-from app.agent.profiling import generate_document_profile
+from app.schemas import DocumentCreate, DocumentRead, DocumentUpdate
+from app import ingestion
+from app.ingestion.pipeline import INGEST_INCREMENTAL
+from app.storage import BadUpload, StoredBlob, UploadTooLarge, receive_upload
+from app.storage.uploads import OPENAPI_UPLOAD_BODY
 
 router = APIRouter(prefix="/documents", tags=["documents"])
 
@@ -28,6 +34,7 @@ def create_document(payload: DocumentCreate, db: Session = Depends(get_session))
         db.add(doc)
         db.commit()
         db.refresh(doc)
+        catalog.invalidate(doc.kb_id)
     except Exception as exc:
         # provide better error message in dev when DB constraints fail
         raise HTTPException(status_code=400, detail=f"failed to create document: {exc}")
@@ -35,6 +42,7 @@ def create_document(payload: DocumentCreate, db: Session = Depends(get_session))
         "id": doc.id,
         "kb_id": doc.kb_id,
         "title": doc.title,
+        "current_version_id": doc.current_version_id,
         # Document currently has no instance-level 'metadata' column defined in models
         "metadata": None,
         "created_at": doc.created_at.isoformat() if doc.created_at else None,
@@ -53,6 +61,7 @@ def list_documents(kb_id: str = None, db: Session = Depends(get_session)):
             "id": d.id,
             "kb_id": d.kb_id,
             "title": d.title,
+            "current_version_id": d.current_version_id,
             "metadata": None,
             "created_at": d.created_at.isoformat() if d.created_at else None,
         })
@@ -68,6 +77,7 @@ def get_document(doc_id: str, db: Session = Depends(get_session)):
         "id": doc.id,
         "kb_id": doc.kb_id,
         "title": doc.title,
+        "current_version_id": doc.current_version_id,
         "metadata": None,
         "created_at": doc.created_at.isoformat() if doc.created_at else None,
     }
@@ -85,10 +95,12 @@ def update_document(doc_id: str, payload: DocumentUpdate, db: Session = Depends(
     db.add(doc)
     db.commit()
     db.refresh(doc)
+    catalog.invalidate(doc.kb_id)
     return {
         "id": doc.id,
         "kb_id": doc.kb_id,
         "title": doc.title,
+        "current_version_id": doc.current_version_id,
         "metadata": None,
         "created_at": doc.created_at.isoformat() if doc.created_at else None,
     }
@@ -96,112 +108,158 @@ def update_document(doc_id: str, payload: DocumentUpdate, db: Session = Depends(
 
 @router.delete("/{doc_id}")
 def delete_document(doc_id: str, db: Session = Depends(get_session)):
+    """Delete the document, its versions, chunks and profiles, then its vectors."""
     doc = db.get(models.Document, doc_id)
     if not doc:
         raise HTTPException(status_code=404, detail="document not found")
-    db.delete(doc)
+    kb_id = doc.kb_id
+    db.expunge(doc)
+    removed = delete_documents(db, [doc_id])
+    catalog.invalidate(kb_id)
+    try:
+        removed["vectors"] = vector_store.delete_vectors(document_id=doc_id, kb_id=kb_id)
+    except Exception:
+        # embedding subsystem is optional in dev mode; `python -m app.embeddings.gc vacuum` catches leftovers
+        removed["vectors"] = None
+    return {"status": "deleted", "removed": removed}
+
+
+@router.delete("/{doc_id}/versions/{version_id}")
+def delete_document_version(doc_id: str, version_id: str, db: Session = Depends(get_session)):
+    """Delete one version of a document with its chunks, profiles and vectors."""
+    ver = db.get(models.DocumentVersion, version_id)
+    if not ver or ver.document_id != doc_id:
+        raise HTTPException(status_code=404, detail="document version not found")
+    kb_id = ver.document.kb_id if ver.document else None
+    was_current = ver.document is not None and ver.document.current_version_id == version_id
+    removed = delete_versions(db, [version_id])
+    if was_current:
+        # fall back to the newest remaining version
+        set_current_version(db, doc_id, latest_version_id(db, doc_id))
     db.commit()
-    return {"status": "deleted"}
+    catalog.invalidate(kb_id)
+    try:
+        removed["vectors"] = vector_store.delete_vectors(version_id=version_id, kb_id=kb_id)
+    except Exception:
+        removed["vectors"] = None
+    return {"status": "deleted", "removed": removed}
 
 
-@router.post("/{doc_id}/upload")
-async def upload_document_file(doc_id: str, file: UploadFile = File(...), db: Session = Depends(get_session)):
-    """Upload a file for an existing document, parse it, create a new DocumentVersion and chunk entries."""
-    doc = db.get(models.Document, doc_id)
-    if not doc:
+@router.post("/{doc_id}/upload", status_code=202, openapi_extra=OPENAPI_UPLOAD_BODY)
+async def upload_document_file(
+    doc_id: str,
+    request: Request,
+    incremental: Optional[bool] = None,
+    db: Session = Depends(get_session),
+):
+    """
+    Accept a file (multipart field `file`) for an existing document and queue it for ingestion.
+    The body is streamed into the blob store; `MAX_UPLOAD_MB` is enforced before and while it is read.
+    Parsing, chunking, embedding and profiling run on the ingestion worker pool;
+    poll `GET /ingestion/jobs/{job_id}` for progress.
+    `incremental` (default `INGEST_INCREMENTAL`) re-embeds only chunks that changed since the previous version.
+    """
+    # the session is sync: every query and commit below runs in the threadpool
+    if await run_in_threadpool(db.get, models.Document, doc_id) is None:
         raise HTTPException(status_code=404, detail="document not found")
 
-    data = await file.read()
     try:
-        from app.parsers.pdf_parser import parse_file
+        upload = await receive_upload(request)
+    except UploadTooLarge as exc:
+        raise HTTPException(status_code=413, detail=str(exc))
+    except BadUpload as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
 
-        text = parse_file(file.filename, data)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"failed to parse file: {e}")
-
-    # determine next version number
-    try:
-        last_ver = db.query(models.DocumentVersion).filter(models.DocumentVersion.document_id == doc_id).order_by(models.DocumentVersion.version_number.desc()).first()
-        next_ver = 1 if not last_ver else (last_ver.version_number + 1)
-    except Exception:
-        next_ver = 1
+    return await run_in_threadpool(_queue_upload, db, doc_id, upload.filename, upload.blob, incremental)
 
-    version = models.DocumentVersion(document_id=doc_id, version_number=next_ver, file_name=file.filename)
-    db.add(version)
-    db.commit()
-    db.refresh(version)
 
-    # chunk and store
-    chunks = chunk_text(text)
-    chunk_models = []
-    for c in chunks:
-        ch = models.Chunk(version_id=version.id, text=c["text"], start_pos=c["start_pos"], end_pos=c["end_pos"], meta=None)
-        db.add(ch)
-        chunk_models.append(ch)
+def _queue_upload(db: Session, doc_id: str, file_name: str, blob: StoredBlob, incremental: Optional[bool]):
+    """Dedupe a stored upload against the document's versions and jobs, or queue it for ingestion."""
+    doc = db.get(models.Document, doc_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="document not found")
 
-    db.commit()
-    # ensure IDs populated
-    for ch in chunk_models:
-        db.refresh(ch)
+    # Byte-identical to the ingested version: link to it instead of re-ingesting.
+    last_ver = ingested_version(db, doc)
+    if last_ver and last_ver.content_hash == blob.sha256:
+        chunk_count = db.query(models.Chunk).filter(models.Chunk.version_id == last_ver.id).count()
+        return JSONResponse(
+            status_code=200,
+            content={
+                "status": "unchanged",
+                "deduplicated": True,
+                "version_id": last_ver.id,
+                "version_number": last_ver.version_number,
+                "content_hash": blob.sha256,
+                "chunks_created": 0,
+                "chunks_reused": chunk_count,
+            },
+        )
 
-    # push embeddings to vector store with metadata for filtering
-    try:
-        vector_store.add_documents([
-            {
-                "id": ch.id,
-                "text": ch.text,
-                "metadata": {
-                    "kb_id": doc.kb_id,
-                    "document_id": doc.id,
-                    "version_id": version.id,
-                    "start_pos": ch.start_pos,
-                    "end_pos": ch.end_pos,
-                },
+    # Same bytes already queued for this document: report the in-flight job.
+    in_flight = (
+        db.query(models.IngestionItem)
+        .filter(models.IngestionItem.document_id == doc_id)
+        .filter(models.IngestionItem.status.notin_(["completed", "failed"]))
+        .all()
+    )
+    for it in in_flight:
+        if (it.detail or {}).get("sha256") == blob.sha256:
+            return {
+                "job_id": it.ingestion_job_id,
+                "item_id": it.id,
+                "status": it.status,
+                "status_url": f"/ingestion/jobs/{it.ingestion_job_id}",
+                "deduplicated": True,
             }
-            for ch in chunk_models
-        ])
-    except Exception:
-        # embeddings are optional in dev; ignore failures
-        pass
 
-    # generate a lightweight searchable profile for this version
+    job = models.IngestionJob(kb_id=doc.kb_id, status="pending")
+    db.add(job)
+    db.flush()
+    item = models.IngestionItem(
+        ingestion_job_id=job.id,
+        document_id=doc.id,
+        status="pending",
+        detail={
+            "file_name": file_name,
+            "file_path": blob.path,
+            "sha256": blob.sha256,
+            "size": blob.size,
+            "incremental": INGEST_INCREMENTAL if incremental is None else incremental,
+        },
+    )
+    db.add(item)
+    db.commit()
+    job_id, item_id, status = job.id, item.id, job.status
+
     try:
-        prof = generate_document_profile(title=doc.title or "", file_name=file.filename, text=text)
-        db.add(
-            models.DocumentProfile(
-                document_id=doc.id,
-                version_id=version.id,
-                title=doc.title,
-                file_name=file.filename,
-                doc_type=prof.doc_type,
-                year_start=prof.year_start,
-                year_end=prof.year_end,
-                summary=prof.summary,
-                tags=prof.tags,
-                meta=prof.meta,
-            )
-        )
+        ingestion.submit(ingestion.run_ingestion_item, item_id, file_name=file_name, file_path=blob.path)
+    except ingestion.IngestionQueueFull as exc:
+        job.status = "failed"
+        item.status = "failed"
+        item.detail = {**(item.detail or {}), "error": str(exc)}
         db.commit()
-    except Exception:
-        # profiling is best-effort in dev
-        pass
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "5"})
 
-    return {"version_id": version.id, "chunks_created": len(chunks)}
+    return {
+        "job_id": job_id,
+        "item_id": item_id,
+        "status": status,
+        "status_url": f"/ingestion/jobs/{job_id}",
+        "deduplicated": False,
+    }
 
 
 @router.get("/{doc_id}/profile")
 def get_document_profile(doc_id: str, db: Session = Depends(get_session)):
-    """Return the latest profile for the document (if available)."""
+    """Return the profile of the version searches serve (current, else newest), if available."""
     doc = db.get(models.Document, doc_id)
     if not doc:
         raise HTTPException(status_code=404, detail="document not found")
 
-    ver = (
-        db.query(models.DocumentVersion)
-        .filter(models.DocumentVersion.document_id == doc_id)
-        .order_by(models.DocumentVersion.version_number.desc())
-        .first()
-    )
+    # like the catalog: a newer version still being ingested must not replace the served profile
+    version_id = doc.current_version_id or latest_version_id(db, doc_id)
+    ver = db.get(models.DocumentVersion, version_id) if version_id else None
     if not ver:
         raise HTTPException(status_code=404, detail="document has no versions")
 
@@ -0,0 +1,42 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from app.db.session import get_session
+from app.db import models
+from app.ingestion import worker
+
+router = APIRouter(prefix="/ingestion", tags=["ingestion"])
+
+
+def _serialize_item(it: models.IngestionItem) -> dict:
+    detail = it.detail or {}
+    return {
+        "id": it.id,
+        "document_id": it.document_id,
+        "status": it.status,
+        "stage": detail.get("stage"),
+        "version_id": detail.get("version_id"),
+        "chunks_created": detail.get("chunks_created"),
+        "detail": detail,
+    }
+
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str, db: Session = Depends(get_session)):
+    job = db.get(models.IngestionJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="ingestion job not found")
+    return {
+        "id": job.id,
+        "kb_id": job.kb_id,
+        "status": job.status,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "items": [_serialize_item(it) for it in job.items],
+    }
+
+
+@router.get("/stats")
+def get_stats():
+    """Worker pool occupancy (running/queued jobs and configured caps)."""
+    return worker.stats()
@@ -3,7 +3,9 @@ from sqlalchemy.orm import Session
 from typing import List
 
 from app.db.session import get_session
-from app.db import models
+from app.db import catalog, models
+from app.db.bulk import delete_documents
+from app.embeddings import vector_store
 from app.schemas import KnowledgeBaseCreate, KnowledgeBaseRead, KnowledgeBaseUpdate
 
 router = APIRouter(prefix="/kb", tags=["knowledge_bases"])
@@ -98,9 +100,21 @@ def update_kb(kb_id: str, payload: KnowledgeBaseUpdate, db: Session = Depends(ge
 
 @router.delete("/{kb_id}")
 def delete_kb(kb_id: str, db: Session = Depends(get_session)):
+    """Delete the KB with its documents (versions, chunks, profiles) and drop its vectors."""
     kb = db.get(models.KnowledgeBase, kb_id)
     if not kb:
         raise HTTPException(status_code=404, detail="knowledge base not found")
-    db.delete(kb)
+    db.expunge(kb)
+    removed = delete_documents(db, [], kb_id=kb_id)
+    # jobs and chat sessions are history; keep them, unlinked
+    db.query(models.IngestionJob).filter(models.IngestionJob.kb_id == kb_id).update({"kb_id": None}, synchronize_session=False)
+    db.query(models.ChatSession).filter(models.ChatSession.kb_id == kb_id).update({"kb_id": None}, synchronize_session=False)
+    db.query(models.KnowledgeBase).filter(models.KnowledgeBase.id == kb_id).delete(synchronize_session=False)
     db.commit()
-    return {"status": "deleted"}
+    catalog.invalidate(kb_id)
+    try:
+        vector_store.drop_kb(kb_id)
+    except Exception:
+        # embedding subsystem is optional in dev mode
+        pass
+    return {"status": "deleted", "removed": removed}
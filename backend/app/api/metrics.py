@@ -0,0 +1,30 @@
+from fastapi import APIRouter
+
+from app.api import streaming
+from app.db import catalog
+from app.embeddings import batching, embedding_cache, llm_cache, llm_clients, query_cache
+from app.ingestion import worker
+from app.retrieval import hybrid, rerank
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("/")
+def get_metrics():
+    """In-process performance counters (caches, worker pools)."""
+    cache = embedding_cache.get_cache()
+    service = batching.current_service()
+    qcache = query_cache.get_cache()
+    lcache = llm_cache.get_cache()
+    return {
+        "query_embedding_cache": qcache.stats() if qcache is not None else {"enabled": False},
+        "embedding_cache": cache.stats() if cache is not None else {"enabled": False},
+        "embedding_service": service.stats() if service is not None else {"enabled": batching.EMBED_SERVICE_ENABLED, "started": False},
+        "ingestion": worker.stats(),
+        "retrieval": hybrid.stats(),
+        "document_catalog": catalog.stats(),
+        "rerank": rerank.stats(),
+        "llm_clients": llm_clients.stats(),
+        "llm_cache": lcache.stats() if lcache is not None else {"enabled": False},
+        "streaming": streaming.stats(),
+    }
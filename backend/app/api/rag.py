@@ -1,8 +1,12 @@
-from typing import List, Optional
+import time
+from typing import Any, Dict, List, Optional, Tuple
 from fastapi import APIRouter, HTTPException, Depends
+from starlette.concurrency import run_in_threadpool
 
+from app.api.streaming import answer_events, event_stream, sse
 from app.embeddings import vector_store
-from app.embeddings.llm import generate_answer
+from app.embeddings.llm import agenerate_answer
+from app.retrieval import hybrid_search, pack_contexts, resolve_mode, rerank
 from app.db import models
 from app.db.session import get_session
 
@@ -10,17 +14,97 @@ router = APIRouter(prefix="/rag", tags=["rag"])
 
 
 @router.post("/query")
-def rag_query(payload: dict, db=Depends(get_session)):
+async def rag_query(payload: dict, db=Depends(get_session)):
     """
     Minimal RAG endpoint.
-    body: {"query": "...", "kb_id": "...", "document_id": "...", "top_k": 5}
+    body: {"query": "...", "kb_id": "...", "document_id": "...", "top_k": 5, "mode": "vector|hybrid", "rerank": bool,
+           "include_history": bool}
+    In hybrid mode source scores are RRF scores (higher is better) instead of vector distances.
+    With rerank, RERANK_CANDIDATES hits are fetched and a cross-encoder keeps the best top_k.
+    The LLM prompt gets the hits merged, deduplicated and packed to CONTEXT_TOKEN_BUDGET ("context" has the stats).
+    Only current document versions are searched unless include_history is true.
+    Retrieval runs on the threadpool; the LLM call awaits the pooled async client.
     """
+    query, kb_id, doc_id, top_k, mode, use_rerank, include_history = _parse_query(payload)
+    contexts, results, rerank_info = await run_in_threadpool(
+        _retrieve_contexts, db, query, kb_id, doc_id, top_k, mode, use_rerank, include_history
+    )
+    packed, context_info = pack_contexts(contexts)
+    llm_resp = await agenerate_answer(query, packed)
+
+    return {
+        "query": query,
+        "kb_id": kb_id,
+        "document_id": doc_id,
+        "top_k": top_k,
+        "mode": mode,
+        "timings_ms": results.get("timings_ms"),
+        "degraded": results.get("degraded"),
+        "rerank": rerank_info,
+        "context": context_info,
+        "answer": llm_resp.get("answer"),
+        "provider": llm_resp.get("provider"),
+        "sources": contexts,
+    }
+
+
+@router.post("/query/stream")
+async def rag_query_stream(payload: dict, db=Depends(get_session)):
+    """
+    `/rag/query` as server-sent events: `sources` (everything but the answer),
+    then one `token` event per chunk of LLM output, then
+    `done` {answer, provider, model, ttft_ms}.
+    """
+    started = time.perf_counter()
+    query, kb_id, doc_id, top_k, mode, use_rerank, include_history = _parse_query(payload)
+    contexts, results, rerank_info = await run_in_threadpool(
+        _retrieve_contexts, db, query, kb_id, doc_id, top_k, mode, use_rerank, include_history
+    )
+
+    packed, context_info = pack_contexts(contexts)
+
+    async def events():
+        yield sse("sources", {
+            "query": query,
+            "kb_id": kb_id,
+            "document_id": doc_id,
+            "top_k": top_k,
+            "mode": mode,
+            "timings_ms": results.get("timings_ms"),
+            "degraded": results.get("degraded"),
+            "rerank": rerank_info,
+            "context": context_info,
+            "sources": contexts,
+        })
+        result: Dict[str, Any] = {}
+        async for event in answer_events(query, packed, started=started, result=result):
+            yield event
+        yield sse("done", result)
+
+    return event_stream(events())
+
+
+def _parse_query(payload: dict) -> Tuple[str, Optional[str], Optional[str], int, str, bool, bool]:
+    """(query, kb_id, document_id, top_k, mode, rerank, include_history) from a query body."""
     query = payload.get("query")
     if not query:
         raise HTTPException(status_code=400, detail="query is required")
     kb_id: Optional[str] = payload.get("kb_id")
     doc_id: Optional[str] = payload.get("document_id")
     top_k: int = int(payload.get("top_k") or 5)
+    try:
+        mode = resolve_mode(payload.get("mode"))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    use_rerank = rerank.RERANK_ENABLED if payload.get("rerank") is None else bool(payload.get("rerank"))
+    return query, kb_id, doc_id, top_k, mode, use_rerank, bool(payload.get("include_history"))
+
+
+def _retrieve_contexts(
+    db, query: str, kb_id: Optional[str], doc_id: Optional[str], top_k: int, mode: str, use_rerank: bool, include_history: bool
+) -> Tuple[List[dict], Dict[str, Any], Optional[Dict[str, Any]]]:
+    """Validate scope, search and (optionally) rerank; returns (contexts, raw results, rerank info)."""
+    fetch_k = rerank.candidates_for(top_k) if use_rerank else top_k
 
     # optionally validate kb/doc existence
     if kb_id:
@@ -33,7 +117,12 @@ def rag_query(payload: dict, db=Depends(get_session)):
             raise HTTPException(status_code=404, detail="document not found")
 
     try:
-        results = vector_store.query_documents(query, n_results=top_k, kb_id=kb_id, document_id=doc_id)
+        if mode == "hybrid":
+            results = hybrid_search(query, n_results=fetch_k, kb_id=kb_id, document_id=doc_id, include_history=include_history)
+        else:
+            results = vector_store.query_documents(
+                query, n_results=fetch_k, kb_id=kb_id, document_id=doc_id, include_history=include_history
+            )
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"vector search failed: {exc}")
 
@@ -42,7 +131,7 @@ def rag_query(payload: dict, db=Depends(get_session)):
     metadatas = results.get("metadatas") or []
     documents = results.get("documents") or []
     ids = results.get("ids") or []
-    distances = results.get("distances") or []
+    distances = results.get("scores") or results.get("distances") or []
     for idx, doc_list in enumerate(documents):
         # chroma returns lists within lists
         for j, text in enumerate(doc_list):
@@ -54,14 +143,11 @@ def rag_query(payload: dict, db=Depends(get_session)):
                 "metadata": meta,
             })
 
-    llm_resp = generate_answer(query, contexts)
-
-    return {
-        "query": query,
-        "kb_id": kb_id,
-        "document_id": doc_id,
-        "top_k": top_k,
-        "answer": llm_resp.get("answer"),
-        "provider": llm_resp.get("provider"),
-        "sources": contexts,
-    }
+    rerank_info = None
+    if use_rerank:
+        order, scores, rerank_info = rerank.rerank(query, [c["chunk_id"] for c in contexts], [c["text"] for c in contexts], top_k)
+        contexts = [
+            {**contexts[i], "rerank_score": scores[n] if scores else None}
+            for n, i in enumerate(order)
+        ]
+    return contexts, results, rerank_info
@@ -0,0 +1,100 @@
+"""Server-sent events for the streaming query endpoints.
+
+A stream sends one `sources` event with the retrieval results, then `token`
+events as the LLM produces text, then a final `done` event. Event data is JSON.
+Retrieval runs, and scope errors are raised, before the response starts, so
+a bad request still gets a plain 4xx.
+
+If the client disconnects mid-answer, the generator is cancelled or closed;
+`answer_events` then leaves the partial answer in `result` and the endpoints
+store it (see `shielded`) before the stream ends.
+
+Time to first token is measured from request arrival, so it includes
+retrieval. It is recorded in `ttft_ms` and exposed via `GET /metrics`.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+import anyio
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.embeddings.llm import astream_answer
+from app.metrics import Histogram
+
+ttft_ms = Histogram([50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000])
+_counts = {"streams": 0, "completed": 0, "aborted": 0}
+
+
+def sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def event_stream(events: AsyncIterator[str]) -> StreamingResponse:
+    # X-Accel-Buffering stops nginx from holding tokens back until the stream ends
+    return StreamingResponse(
+        events, media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def shielded(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run sync `func` in the threadpool even while the stream is being cancelled by a disconnect."""
+    with anyio.CancelScope(shield=True):
+        return await run_in_threadpool(func, *args, **kwargs)
+
+
+async def shielded_aclose(gen: AsyncIterator[Any]) -> None:
+    close = getattr(gen, "aclose", None)
+    if close is not None:
+        with anyio.CancelScope(shield=True):
+            await close()
+
+
+async def _once(text: str) -> AsyncIterator[str]:
+    yield text
+
+
+async def answer_events(
+    query: str,
+    contexts: List[Dict[str, Any]],
+    *,
+    started: float,
+    result: Dict[str, Any],
+    text: Optional[str] = None,
+    stream: Optional[Callable[..., AsyncIterator[str]]] = None,
+) -> AsyncIterator[str]:
+    """
+    `token` events for the answer to `query`, or for a precomputed `text`.
+    `stream(query, contexts, meta)` produces the answer (default `astream_answer`).
+    When exhausted, `result` holds answer, provider, model and ttft_ms. When
+    closed early, `result["answer"]` is the text sent so far and `aborted` is set.
+    """
+    _counts["streams"] += 1
+    parts: List[str] = []
+    pieces = _once(text) if text is not None else (stream or astream_answer)(query, contexts, result)
+    done = False
+    try:
+        async for piece in pieces:
+            if not parts:
+                result["ttft_ms"] = round((time.perf_counter() - started) * 1000, 3)
+                ttft_ms.observe(result["ttft_ms"])
+            parts.append(piece)
+            yield sse("token", {"text": piece})
+        done = True
+    finally:
+        result["answer"] = "".join(parts)
+        if done:
+            _counts["completed"] += 1
+        else:
+            result["aborted"] = True
+            _counts["aborted"] += 1
+            # release the provider connection now rather than when the generator is collected
+            await shielded_aclose(pieces)
+
+
+def stats() -> Dict[str, object]:
+    return {**_counts, "ttft_ms": ttft_ms.snapshot()}
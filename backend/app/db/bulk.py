@@ -0,0 +1,78 @@
+"""Bulk row persistence helpers.
+
+IDs are generated client-side, so rows never need a refresh round-trip after
+insert. Postgres gets multi-row `INSERT ... VALUES (...), (...)` statements;
+other dialects (SQLite) use a single executemany.
+
+Deletes go the other way. The ORM relationships don't cascade, so
+`delete_documents` removes a document's dependent rows (profiles, chunks,
+versions) with one set-based DELETE per table instead of loading them.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.db import models
+
+# Postgres caps bind parameters per statement at 65535; chunks have <10 columns.
+PG_ROWS_PER_STATEMENT = 1000
+
+
+def bulk_insert_chunks(db: Session, rows: List[Dict[str, Any]]) -> List[str]:
+    """Insert chunk rows (dicts of Chunk columns) and commit; returns their ids in order."""
+    if not rows:
+        return []
+    for r in rows:
+        if not r.get("id"):
+            r["id"] = models.gen_uuid()
+    table = models.Chunk.__table__
+    if db.get_bind().dialect.name == "postgresql":
+        for i in range(0, len(rows), PG_ROWS_PER_STATEMENT):
+            db.execute(insert(table).values(rows[i : i + PG_ROWS_PER_STATEMENT]))
+    else:
+        db.execute(insert(table), rows)
+    db.commit()
+    return [r["id"] for r in rows]
+
+
+def delete_versions(db: Session, version_ids: Sequence[str]) -> Dict[str, int]:
+    """Delete versions with their chunks and profiles (no commit); returns rows removed per table."""
+    if not version_ids:
+        return {"chunks": 0, "document_profiles": 0, "document_versions": 0}
+    ids = list(version_ids)
+    # documents.current_version_id references versions; unpoint it first
+    db.execute(
+        update(models.Document).where(models.Document.current_version_id.in_(ids)).values(current_version_id=None)
+    )
+    out = {
+        "chunks": db.execute(delete(models.Chunk).where(models.Chunk.version_id.in_(ids))).rowcount,
+        "document_profiles": db.execute(
+            delete(models.DocumentProfile).where(models.DocumentProfile.version_id.in_(ids))
+        ).rowcount,
+    }
+    out["document_versions"] = db.execute(delete(models.DocumentVersion).where(models.DocumentVersion.id.in_(ids))).rowcount
+    return out
+
+
+def delete_documents(db: Session, document_ids: Sequence[str], kb_id: Optional[str] = None) -> Dict[str, int]:
+    """
+    Delete documents and everything hanging off them, then commit.
+    Ingestion items keep their job history but lose the document link.
+    Pass `kb_id` instead of ids to delete every document of a KB.
+    """
+    docs = select(models.Document.id)
+    docs = docs.where(models.Document.kb_id == kb_id) if kb_id else docs.where(models.Document.id.in_(list(document_ids)))
+    versions = [v for (v,) in db.execute(select(models.DocumentVersion.id).where(models.DocumentVersion.document_id.in_(docs)))]
+    out = delete_versions(db, versions)
+    # profiles reference the document too; catch any whose version was already gone
+    out["document_profiles"] += db.execute(
+        delete(models.DocumentProfile).where(models.DocumentProfile.document_id.in_(docs))
+    ).rowcount
+    db.execute(
+        update(models.IngestionItem).where(models.IngestionItem.document_id.in_(docs)).values(document_id=None)
+    )
+    out["documents"] = db.execute(delete(models.Document).where(models.Document.id.in_(docs))).rowcount
+    db.commit()
+    return out
@@ -0,0 +1,157 @@
+"""Document catalog read model.
+
+Each document with its current version (`Document.current_version_id`, else
+the newest version) and that version's latest profile. The agent lists and
+routes documents from it. `kb_catalog` loads a whole KB in one query:
+`row_number()` windows pick the newest version per document and the newest
+profile per version. Previously that took two queries per document.
+
+Entries are frozen and `kb_catalog` returns a tuple, so callers cannot
+modify the cached rows.
+
+Results are cached per KB for `CATALOG_CACHE_TTL_S`. Writers call
+`invalidate(kb_id)` after creating, uploading (new version / new profile),
+renaming or deleting documents. A generation counter keeps a load that
+raced with an invalidation from caching stale rows. The TTL bounds
+staleness when another process writes.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session
+
+from app.db import models
+
+CATALOG_CACHE_TTL_S = float(os.environ.get("CATALOG_CACHE_TTL_S", "300"))
+CATALOG_CACHE_SIZE = max(0, int(os.environ.get("CATALOG_CACHE_SIZE", "256")))
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    document_id: str
+    title: Optional[str]
+    created_at: Optional[datetime]
+    version_id: Optional[str] = None
+    doc_type: Optional[str] = None
+    year_start: Optional[int] = None
+    year_end: Optional[int] = None
+    summary: Optional[str] = None
+    tags: Tuple[Any, ...] = ()
+
+
+_cache: "OrderedDict[str, Tuple[float, Tuple[CatalogEntry, ...]]]" = OrderedDict()
+_generation: Dict[str, int] = {}
+_lock = threading.Lock()
+_counts = {"hits": 0, "misses": 0, "invalidations": 0}
+
+
+def _load(db: Session, *, kb_id: Optional[str] = None, document_id: Optional[str] = None) -> Tuple[CatalogEntry, ...]:
+    D, V, P = models.Document, models.DocumentVersion, models.DocumentProfile
+    scope = D.kb_id == kb_id if document_id is None else D.id == document_id
+    in_scope = select(D.id).where(scope)
+
+    latest_ver = (
+        select(
+            V.id.label("version_id"),
+            V.document_id,
+            func.row_number().over(partition_by=V.document_id, order_by=V.version_number.desc()).label("rn"),
+        )
+        .where(V.document_id.in_(in_scope))
+        .subquery()
+    )
+    latest_prof = (
+        select(
+            P.version_id,
+            P.doc_type,
+            P.year_start,
+            P.year_end,
+            P.summary,
+            P.tags,
+            func.row_number().over(partition_by=P.version_id, order_by=(P.created_at.desc(), P.id.desc())).label("rn"),
+        )
+        .where(P.document_id.in_(in_scope))
+        .subquery()
+    )
+    # the version searches serve; documents ingested before current_version_id fall back to the newest
+    version_id = func.coalesce(D.current_version_id, latest_ver.c.version_id)
+    stmt = (
+        select(
+            D.id,
+            D.title,
+            D.created_at,
+            version_id.label("version_id"),
+            latest_prof.c.doc_type,
+            latest_prof.c.year_start,
+            latest_prof.c.year_end,
+            latest_prof.c.summary,
+            latest_prof.c.tags,
+        )
+        .outerjoin(latest_ver, and_(latest_ver.c.document_id == D.id, latest_ver.c.rn == 1))
+        .outerjoin(latest_prof, and_(latest_prof.c.version_id == version_id, latest_prof.c.rn == 1))
+        .where(scope)
+        .order_by(D.created_at.desc())
+    )
+    return tuple(
+        CatalogEntry(
+            document_id=r.id,
+            title=r.title,
+            created_at=r.created_at,
+            version_id=r.version_id,
+            doc_type=r.doc_type,
+            year_start=r.year_start,
+            year_end=r.year_end,
+            summary=r.summary,
+            tags=tuple(r.tags or ()),
+        )
+        for r in db.execute(stmt)
+    )
+
+
+def kb_catalog(db: Session, kb_id: str) -> Tuple[CatalogEntry, ...]:
+    """The KB's documents, newest first, each with its current version's profile (cached)."""
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(kb_id)
+        if entry is not None and (CATALOG_CACHE_TTL_S <= 0 or now - entry[0] < CATALOG_CACHE_TTL_S):
+            _cache.move_to_end(kb_id)
+            _counts["hits"] += 1
+            return entry[1]
+        _counts["misses"] += 1
+        generation = _generation.get(kb_id, 0)
+    rows = _load(db, kb_id=kb_id)
+    with _lock:
+        if CATALOG_CACHE_SIZE and _generation.get(kb_id, 0) == generation:
+            _cache[kb_id] = (now, rows)
+            _cache.move_to_end(kb_id)
+            while len(_cache) > CATALOG_CACHE_SIZE:
+                _cache.popitem(last=False)
+    return rows
+
+
+def document_entry(db: Session, document_id: str) -> Optional[CatalogEntry]:
+    """One document's catalog entry (uncached, one query)."""
+    rows = _load(db, document_id=document_id)
+    return rows[0] if rows else None
+
+
+def invalidate(kb_id: Optional[str]) -> None:
+    if not kb_id:
+        return
+    with _lock:
+        _generation[kb_id] = _generation.get(kb_id, 0) + 1
+        _cache.pop(kb_id, None)
+        _counts["invalidations"] += 1
+
+
+def stats() -> Dict[str, object]:
+    with _lock:
+        return {**_counts, "cached_kbs": len(_cache), "ttl_s": CATALOG_CACHE_TTL_S}
@@ -62,9 +62,11 @@ class Document(Base):
     id = Column(String(36), primary_key=True, default=gen_uuid)
     title = Column(String(1024))
     kb_id = Column(String(36), ForeignKey('knowledge_bases.id'), nullable=True)
+    # version that searches serve; set once a new version is indexed (see app/db/versions.py)
+    current_version_id = Column(String(36), ForeignKey('document_versions.id', use_alter=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     knowledge_base = relationship('KnowledgeBase', back_populates='documents')
-    versions = relationship('DocumentVersion', back_populates='document')
+    versions = relationship('DocumentVersion', back_populates='document', foreign_keys='DocumentVersion.document_id')
 
 
 class DocumentVersion(Base):
@@ -74,8 +76,12 @@ class DocumentVersion(Base):
     version_number = Column(Integer, default=1)
     file_name = Column(String(1024))
     file_path = Column(String(2048))
+    # sha256 of the uploaded bytes; identical re-uploads reuse the existing version
+    content_hash = Column(String(64), index=True)
+    # how the version was chunked, e.g. {"snap_window": 200}
+    meta = Column(JSON)
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
-    document = relationship('Document', back_populates='versions')
+    document = relationship('Document', back_populates='versions', foreign_keys=[document_id])
     chunks = relationship('Chunk', back_populates='version')
     profiles = relationship('DocumentProfile', back_populates='version')
 
@@ -87,6 +93,8 @@ class Chunk(Base):
     text = Column(Text)
     start_pos = Column(Integer)
     end_pos = Column(Integer)
+    # sha256 of `text`; lets a new version reuse vectors of unchanged chunks
+    content_hash = Column(String(64))
     meta = Column(JSON)
     version = relationship('DocumentVersion', back_populates='chunks')
 
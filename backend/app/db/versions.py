@@ -0,0 +1,75 @@
+"""Active document versions.
+
+`Document.current_version_id` points at the version that searches serve. An
+ingest sets it only after the new version's chunks are indexed, so queries
+keep answering from the previous version until then. Documents without one
+(never ingested, or created before the column existed and not backfilled)
+count every version as active.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.db import models
+
+
+def current_versions(db: Session, document_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+    """document_id -> current_version_id (None: all versions active) for the given documents."""
+    ids = list(dict.fromkeys(d for d in document_ids if d))
+    if not ids:
+        return {}
+    rows = db.execute(select(models.Document.id, models.Document.current_version_id).where(models.Document.id.in_(ids)))
+    return {doc_id: ver_id for doc_id, ver_id in rows}
+
+
+def set_current_version(db: Session, document_id: str, version_id: Optional[str]) -> List[str]:
+    """Point the document at `version_id` (no commit); returns ids of its other, superseded versions."""
+    doc = db.get(models.Document, document_id)
+    if doc is None:
+        return []
+    doc.current_version_id = version_id
+    return [
+        v
+        for (v,) in db.execute(
+            select(models.DocumentVersion.id).where(
+                models.DocumentVersion.document_id == document_id, models.DocumentVersion.id != version_id
+            )
+        )
+    ]
+
+
+def latest_version_id(db: Session, document_id: str) -> Optional[str]:
+    return db.execute(
+        select(models.DocumentVersion.id)
+        .where(models.DocumentVersion.document_id == document_id)
+        .order_by(models.DocumentVersion.version_number.desc())
+        .limit(1)
+    ).scalar()
+
+
+def ingested_version(db: Session, doc: models.Document) -> Optional[models.DocumentVersion]:
+    """
+    The version uploads are deduplicated and diffed against: the current one, else (documents
+    from before `current_version_id`) the newest version whose ingestion completed.
+    A version left behind by a failed or unfinished ingestion never counts.
+    """
+    if doc.current_version_id:
+        return db.get(models.DocumentVersion, doc.current_version_id)
+    items = (
+        db.query(models.IngestionItem)
+        .filter(models.IngestionItem.document_id == doc.id, models.IngestionItem.status == "completed")
+        .all()
+    )
+    done = {(it.detail or {}).get("version_id") for it in items} - {None}
+    if not done:
+        return None
+    return (
+        db.query(models.DocumentVersion)
+        .filter(models.DocumentVersion.document_id == doc.id, models.DocumentVersion.id.in_(done))
+        .order_by(models.DocumentVersion.version_number.desc())
+        .first()
+    )
@@ -0,0 +1,145 @@
+"""Micro-batching embedding service for query-time encodes.
+
+Concurrent `/rag/query`, chat and agent requests each need one query vector.
+Instead of every request calling `encode([query])` with batch size 1, callers
+enqueue their text and get a Future back; a dispatcher thread coalesces queued
+texts into one batch (bounded by `EMBED_BATCH_MAX` and a `EMBED_BATCH_WINDOW_MS`
+wait) and runs it on a dedicated inference executor. Callers wait at most
+`EMBED_RESULT_TIMEOUT_S` for their vector; texts whose caller gave up before
+their batch started are dropped from it.
+"""
+
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.metrics import Histogram
+
+EMBED_SERVICE_ENABLED = os.environ.get("EMBED_SERVICE_ENABLED", "true").strip().lower() not in {"0", "false", "no"}
+EMBED_BATCH_MAX = max(1, int(os.environ.get("EMBED_BATCH_MAX", "32")))
+EMBED_BATCH_WINDOW_MS = max(0.0, float(os.environ.get("EMBED_BATCH_WINDOW_MS", "5")))
+EMBED_INFERENCE_THREADS = max(1, int(os.environ.get("EMBED_INFERENCE_THREADS", "1")))
+# How long `encode` waits for its vectors (0 = no limit).
+EMBED_RESULT_TIMEOUT_S = max(0.0, float(os.environ.get("EMBED_RESULT_TIMEOUT_S", "30")))
+
+EncodeFn = Callable[[List[str]], Sequence[Sequence[float]]]
+
+_service: Optional["EmbeddingService"] = None
+_service_lock = threading.Lock()
+
+
+class EmbeddingService:
+    def __init__(self, encode_fn: EncodeFn, *, max_batch: int, window_ms: float, threads: int):
+        self._encode_fn = encode_fn
+        self.max_batch = max_batch
+        self.window_s = window_ms / 1000.0
+        self._queue: "queue.Queue[Tuple[str, float, Future]]" = queue.Queue()
+        self._slots = threading.Semaphore(threads)
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="embed-infer")
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="embed-dispatch", daemon=True)
+        self._dispatcher.start()
+        self.batch_size = Histogram([1, 2, 4, 8, 16, 32, 64, 128])
+        self.queue_wait_ms = Histogram([0.5, 1, 2, 5, 10, 25, 50, 100, 250, 1000])
+        self.inference_ms = Histogram([1, 2, 5, 10, 25, 50, 100, 250, 1000])
+        self.timeouts = 0
+
+    def submit(self, text: str) -> Future:
+        fut: Future = Future()
+        self._queue.put((text, time.perf_counter(), fut))
+        return fut
+
+    def encode(self, texts: Sequence[str], timeout: Optional[float] = None) -> List[List[float]]:
+        """
+        Blocking convenience wrapper: enqueue every text and wait for all vectors.
+        Raises TimeoutError after `timeout` seconds (default EMBED_RESULT_TIMEOUT_S, 0 = no limit).
+        """
+        futures = [self.submit(t) for t in texts]
+        wait = EMBED_RESULT_TIMEOUT_S if timeout is None else timeout
+        deadline = time.monotonic() + wait if wait else None
+        try:
+            return [f.result(None if deadline is None else max(0.0, deadline - time.monotonic())) for f in futures]
+        except FutureTimeout:
+            self.timeouts += 1
+            for f in futures:
+                f.cancel()
+            raise TimeoutError(f"no embedding within {wait:g}s ({self._queue.qsize()} queued)") from None
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            first = self._queue.get()
+            # wait for a free inference slot; requests arriving meanwhile join this batch
+            self._slots.acquire()
+            batch = [first]
+            deadline = time.perf_counter() + self.window_s
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._executor.submit(self._run_batch, batch)
+            except Exception as exc:
+                self._slots.release()
+                for _, _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(exc)
+
+    def _run_batch(self, batch: List[Tuple[str, float, Future]]) -> None:
+        try:
+            # callers that timed out have cancelled their futures; don't encode for them
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                return
+            started = time.perf_counter()
+            for _, enqueued, _ in batch:
+                self.queue_wait_ms.observe((started - enqueued) * 1000)
+            self.batch_size.observe(len(batch))
+            vectors = self._encode_fn([text for text, _, _ in batch])
+            self.inference_ms.observe((time.perf_counter() - started) * 1000)
+            if len(vectors) != len(batch):
+                raise ValueError(f"encoder returned {len(vectors)} vectors for {len(batch)} texts")
+            for (_, _, fut), vec in zip(batch, vectors):
+                fut.set_result(list(vec))
+        except Exception as exc:
+            for _, _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(exc)
+        finally:
+            self._slots.release()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "max_batch": self.max_batch,
+            "window_ms": self.window_s * 1000,
+            "queued": self._queue.qsize(),
+            "timeouts": self.timeouts,
+            "batch_size": self.batch_size.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+            "inference_ms": self.inference_ms.snapshot(),
+        }
+
+
+def get_service(encode_fn: EncodeFn) -> Optional[EmbeddingService]:
+    """Process-wide service (created on first use), or None when disabled."""
+    global _service
+    if not EMBED_SERVICE_ENABLED:
+        return None
+    with _service_lock:
+        if _service is None:
+            _service = EmbeddingService(
+                encode_fn,
+                max_batch=EMBED_BATCH_MAX,
+                window_ms=EMBED_BATCH_WINDOW_MS,
+                threads=EMBED_INFERENCE_THREADS,
+            )
+        return _service
+
+
+def current_service() -> Optional[EmbeddingService]:
+    return _service
@@ -0,0 +1,160 @@
+"""Per-KB Chroma collections (`VECTOR_SHARDING=kb`).
+
+Instead of one global `documents` collection filtered by `kb_id`, each KB gets
+its own collection (`kb_<kb_id>`), created on first write. Queries pinned to a
+KB search only that collection's HNSW graph; unscoped queries fan out over all
+collections and merge by distance. Vectors without a `kb_id` stay in the
+legacy `documents` collection. Open collection handles are kept in an LRU of
+`CHROMA_SHARD_CACHE_SIZE` entries, and dropping a KB deletes its collection
+outright instead of filtering rows out of a shared index.
+
+`ShardedChromaCollection` mimics the subset of the Chroma collection API that
+`vector_store` uses (`add`, `get`, `query`, `delete`).
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.embeddings.numpy_index import kb_from_where
+
+CHROMA_SHARD_CACHE_SIZE = max(1, int(os.environ.get("CHROMA_SHARD_CACHE_SIZE", "64")))
+
+LEGACY_COLLECTION = "documents"
+_SAFE = re.compile(r"[^A-Za-z0-9_-]")
+
+
+def collection_name(kb_id: Optional[str]) -> str:
+    if not kb_id:
+        return LEGACY_COLLECTION
+    # Chroma names: 3-63 chars of [A-Za-z0-9._-], alphanumeric at both ends
+    return f"kb_{_SAFE.sub('_', kb_id)}"[:63].rstrip("_-")
+
+
+class ShardedChromaCollection:
+    def __init__(self, client):
+        self.client = client
+        self._handles: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _handle(self, name: str, *, create: bool):
+        with self._lock:
+            handle = self._handles.get(name)
+            if handle is not None:
+                self._handles.move_to_end(name)
+                return handle
+        if create:
+            handle = self.client.get_or_create_collection(name)
+        else:
+            try:
+                handle = self.client.get_collection(name)
+            except ValueError:  # does not exist (yet)
+                return None
+        with self._lock:
+            self._handles[name] = handle
+            self._handles.move_to_end(name)
+            while len(self._handles) > CHROMA_SHARD_CACHE_SIZE:
+                self._handles.popitem(last=False)
+        return handle
+
+    def _targets(self, where: Optional[Dict[str, Any]]) -> List[Any]:
+        kb = kb_from_where(where)
+        if kb is not None:
+            handle = self._handle(collection_name(kb), create=False)
+            return [handle] if handle is not None else []
+        return [self._handle(c.name, create=False) for c in self.client.list_collections()]
+
+    def add(self, ids: Sequence[str], documents: Sequence[str], embeddings, metadatas: Sequence[Dict[str, Any]]) -> None:
+        groups: Dict[str, List[int]] = {}
+        for i, meta in enumerate(metadatas):
+            groups.setdefault(collection_name((meta or {}).get("kb_id")), []).append(i)
+        for name, rows in groups.items():
+            self._handle(name, create=True).add(
+                ids=[ids[i] for i in rows],
+                documents=[documents[i] for i in rows],
+                embeddings=[embeddings[i] for i in rows],
+                metadatas=[metadatas[i] for i in rows],
+            )
+
+    def get(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict[str, Any]] = None, include: Optional[List[str]] = None) -> Dict[str, Any]:
+        include = include or ["documents", "metadatas"]
+        out: Dict[str, List[Any]] = {"ids": [], **{k: [] for k in include}}
+        for handle in self._targets(where):
+            if handle is None:
+                continue
+            got = handle.get(ids=list(ids) if ids is not None else None, where=where or None, include=include)
+            out["ids"].extend(got.get("ids") or [])
+            for k in include:
+                out[k].extend(got.get(k) or [])
+        return out
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[Dict[str, Any]] = None, **_: Any) -> Dict[str, Any]:
+        keys = ("ids", "documents", "metadatas", "distances")
+        partials = []
+        for handle in self._targets(where):
+            if handle is None:
+                continue
+            n = min(n_results, handle.count())
+            if n:
+                partials.append(handle.query(query_embeddings=query_embeddings, n_results=n, where=where or None))
+        results: Dict[str, List[List[Any]]] = {k: [] for k in keys}
+        for qi in range(len(query_embeddings)):
+            hits = []
+            for part in partials:
+                rows = zip(*(part[k][qi] for k in keys))
+                hits.extend(rows)
+            hits.sort(key=lambda h: h[3])
+            for pos, k in enumerate(keys):
+                results[k].append([h[pos] for h in hits[:n_results]])
+        return results
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict[str, Any]] = None) -> None:
+        if ids is None and where is None:
+            return
+        for handle in self._targets(where):
+            if handle is not None:
+                handle.delete(ids=list(ids) if ids is not None else None, where=where or None)
+
+    def drop_kb(self, kb_id: str) -> None:
+        name = collection_name(kb_id)
+        with self._lock:
+            self._handles.pop(name, None)
+        try:
+            self.client.delete_collection(name)
+        except ValueError:
+            pass
+
+    def count(self) -> int:
+        return sum(h.count() for h in self._targets(None) if h is not None)
+
+    def migrate_legacy(self, batch_size: int = 500) -> int:
+        """Move vectors that carry a kb_id out of the legacy `documents` collection into per-KB collections."""
+        legacy = self._handle(LEGACY_COLLECTION, create=False)
+        if legacy is None:
+            return 0
+        moved = 0
+        while True:
+            got = legacy.get(where={"kb_id": {"$ne": ""}}, limit=batch_size, include=["documents", "metadatas", "embeddings"])
+            if not got["ids"]:
+                return moved
+            self.add(got["ids"], got["documents"], got["embeddings"], got["metadatas"])
+            legacy.delete(ids=got["ids"])
+            moved += len(got["ids"])
+
+
+if __name__ == "__main__":
+    # python -m app.embeddings.chroma_shards migrate
+    import sys
+
+    from app.embeddings import vector_store
+
+    if sys.argv[1:] != ["migrate"]:
+        sys.exit("usage: python -m app.embeddings.chroma_shards migrate")
+    collection = vector_store._get_collection()
+    if not isinstance(collection, ShardedChromaCollection):
+        sys.exit("set VECTOR_SHARDING=kb (with VECTOR_BACKEND=chroma) first")
+    print(f"moved {collection.migrate_legacy()} vectors into per-KB collections")
@@ -0,0 +1,100 @@
+"""Persistent embedding cache.
+
+Vectors are stored in a small SQLite database keyed by
+`(embedder identity, sha256(text))`, so boilerplate paragraphs, templates and
+re-uploads are encoded once. The cache keeps a byte budget and evicts the
+least recently used rows when it is exceeded (see sqlite_lru.py).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.embeddings.sqlite_lru import BATCH, SqliteLRU
+
+EMBED_CACHE_ENABLED = os.environ.get("EMBED_CACHE_ENABLED", "true").strip().lower() not in {"0", "false", "no"}
+EMBED_CACHE_PATH = os.environ.get("EMBED_CACHE_PATH", "./embed_cache.sqlite3")
+EMBED_CACHE_MAX_BYTES = int(float(os.environ.get("EMBED_CACHE_MAX_MB", "512")) * 1024 * 1024)
+
+_cache: Optional["EmbeddingCache"] = None
+_cache_lock = threading.Lock()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache(SqliteLRU):
+    table = "embeddings"
+    key_columns = ("model", "text_hash")
+    size_sql = "LENGTH(vec)"
+
+    def _create(self) -> None:
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " text_hash TEXT NOT NULL,"
+            " vec BLOB NOT NULL,"
+            " last_access REAL NOT NULL,"
+            " PRIMARY KEY (model, text_hash))"
+        )
+
+    def get_many(self, model: str, hashes: Sequence[str]) -> Dict[str, List[float]]:
+        """Return {text_hash: vector} for the hashes present; refreshes their LRU position."""
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            for i in range(0, len(unique), BATCH):
+                batch = unique[i : i + BATCH]
+                marks = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vec FROM embeddings WHERE model = ? AND text_hash IN ({marks})",
+                    [model, *batch],
+                ).fetchall()
+                for h, blob in rows:
+                    vec = array("f")
+                    vec.frombytes(blob)
+                    found[h] = vec.tolist()
+            if found:
+                self._touch(((model, h) for h in found), time.time())
+            self.hits += sum(1 for h in hashes if h in found)
+            self.misses += sum(1 for h in hashes if h not in found)
+        return found
+
+    def put_many(self, model: str, items: Iterable[Tuple[str, Sequence[float]]]) -> None:
+        now = time.time()
+        rows = [(model, h, array("f", vec).tobytes(), now) for h, vec in items]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for row in rows:
+                    self._upsert(row[:2], row, len(row[2]))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self.writes += len(rows)
+            self._make_room()
+
+
+def get_cache() -> Optional[EmbeddingCache]:
+    """Process-wide cache, or None when disabled / the cache file can't be opened."""
+    global _cache, EMBED_CACHE_ENABLED
+    if not EMBED_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            try:
+                _cache = EmbeddingCache(EMBED_CACHE_PATH, EMBED_CACHE_MAX_BYTES)
+            except Exception:
+                # an unusable cache must never break embedding
+                EMBED_CACHE_ENABLED = False
+                return None
+        return _cache
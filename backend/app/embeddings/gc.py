@@ -0,0 +1,69 @@
+"""Vector store garbage collection.
+
+Deletes in the API remove vectors right after the SQL rows. A few can still
+outlive their chunk, for example when the vector store was down during a
+delete, or an ingest was still embedding a document that had just been
+deleted. `vacuum` finds vector ids with no row in `chunks` and deletes them
+in batches. It then compacts the index when the backend supports it (numpy
+segments; Chroma 0.4 has no compaction call).
+
+    python -m app.embeddings.gc vacuum [--dry-run] [--batch-size N]
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Dict, Iterator, List
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.embeddings import vector_store
+
+GC_BATCH_SIZE = int(os.environ.get("GC_BATCH_SIZE", "1000"))
+
+
+def _batches(ids: List[str], size: int) -> Iterator[List[str]]:
+    for i in range(0, len(ids), size):
+        yield ids[i : i + size]
+
+
+def find_orphans(db: Session, batch_size: int = GC_BATCH_SIZE) -> List[str]:
+    """Ids in the vector store without a matching `chunks` row."""
+    ids = vector_store._get_collection().get(include=[]).get("ids") or []
+    orphans: List[str] = []
+    for batch in _batches(ids, batch_size):
+        known = set(db.execute(select(models.Chunk.id).where(models.Chunk.id.in_(batch))).scalars())
+        orphans.extend(vid for vid in batch if vid not in known)
+    return orphans
+
+
+def vacuum(db: Session, *, dry_run: bool = False, batch_size: int = GC_BATCH_SIZE) -> Dict[str, object]:
+    collection = vector_store._get_collection()
+    before = collection.count()
+    orphans = find_orphans(db, batch_size)
+    out: Dict[str, object] = {"vectors": before, "orphans": len(orphans), "dry_run": dry_run}
+    if dry_run:
+        out["sample"] = orphans[:20]
+        return out
+    out["deleted"] = vector_store.delete_ids(orphans, batch_size=batch_size)
+    if hasattr(collection, "compact"):
+        out["compaction"] = collection.compact()
+    out["vectors_after"] = collection.count()
+    return out
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from app.db.session import SessionLocal
+
+    parser = argparse.ArgumentParser(prog="python -m app.embeddings.gc")
+    parser.add_argument("command", choices=["vacuum"])
+    parser.add_argument("--dry-run", action="store_true", help="only count orphaned vectors")
+    parser.add_argument("--batch-size", type=int, default=GC_BATCH_SIZE)
+    args = parser.parse_args()
+    with SessionLocal() as session:
+        print(json.dumps(vacuum(session, dry_run=args.dry_run, batch_size=args.batch_size), indent=2, default=str))
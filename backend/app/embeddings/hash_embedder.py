@@ -0,0 +1,100 @@
+"""Deterministic hash embedder (`EMBED_PROVIDER=hash`).
+
+Each text maps to a vector derived from chained SHA-256 digests:
+`seed = sha256(text)`, block k = `sha256(seed + k as 4-byte little-endian)`,
+every 4 bytes of the blocks is a little-endian int32 scaled by 2**-31.
+
+`hash_embed_batch` builds all digests of a batch into one buffer and decodes it
+with a single `np.frombuffer`; values are bit-for-bit those of the scalar
+reference `_hash_embed` (float32 output equals the reference cast to float32,
+which is what the vector store keeps).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import multiprocessing
+import os
+import struct
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+# >0 enables a process pool for batches of at least HASH_EMBED_MP_MIN_BATCH texts.
+HASH_EMBED_PROCESSES = max(0, int(os.environ.get("HASH_EMBED_PROCESSES", "0")))
+HASH_EMBED_MP_MIN_BATCH = max(1, int(os.environ.get("HASH_EMBED_MP_MIN_BATCH", "4096")))
+
+_SCALE = 2147483648.0
+_BLOCK_INTS = 8  # a sha256 digest holds eight int32 values
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _hash_embed(text: str, dim: int) -> List[float]:
+    """Scalar reference implementation (one vector, Python floats)."""
+    if dim <= 0:
+        raise ValueError("EMBED_DIM must be > 0")
+    seed = hashlib.sha256(text.encode("utf-8")).digest()
+    out: List[float] = []
+    counter = 0
+    while len(out) < dim:
+        block = hashlib.sha256(seed + counter.to_bytes(4, "little")).digest()
+        counter += 1
+        for i in range(0, len(block), 4):
+            if len(out) >= dim:
+                break
+            (val,) = struct.unpack("<i", block[i : i + 4])
+            out.append(val / 2147483648.0)
+    return out
+
+
+def _digests(texts: Sequence[str], n_blocks: int) -> bytes:
+    counters = [k.to_bytes(4, "little") for k in range(n_blocks)]
+    sha = hashlib.sha256
+    parts = []
+    for t in texts:
+        seed = sha(t.encode("utf-8")).digest()
+        parts.extend(sha(seed + c).digest() for c in counters)
+    return b"".join(parts)
+
+
+def _hash_embed_local(texts: Sequence[str], dim: int, dtype) -> np.ndarray:
+    n_blocks = -(-dim // _BLOCK_INTS)
+    ints = np.frombuffer(_digests(texts, n_blocks), dtype="<i4").reshape(len(texts), n_blocks * _BLOCK_INTS)[:, :dim]
+    # int32 -> float64 is exact and /2**31 is exact, matching the reference bit for bit
+    out = ints.astype(np.float64) / _SCALE
+    return out if np.dtype(dtype) == np.float64 else out.astype(dtype)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=HASH_EMBED_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def hash_embed_batch(texts: Sequence[str], dim: int, dtype=np.float32) -> np.ndarray:
+    """Embed a batch; returns an (n, dim) array."""
+    if dim <= 0:
+        raise ValueError("EMBED_DIM must be > 0")
+    texts = list(texts)
+    if not texts:
+        return np.zeros((0, dim), dtype=dtype)
+    if HASH_EMBED_PROCESSES > 1 and len(texts) >= HASH_EMBED_MP_MIN_BATCH:
+        step = -(-len(texts) // HASH_EMBED_PROCESSES)
+        slices = [texts[i : i + step] for i in range(0, len(texts), step)]
+        parts = list(_get_pool().map(_hash_embed_local, slices, [dim] * len(slices), [dtype] * len(slices)))
+        return np.concatenate(parts, axis=0)
+    return _hash_embed_local(texts, dim, dtype)
+
+
+class _HashEmbedder:
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def encode(self, texts: List[str], show_progress_bar: bool = False):  # noqa: ARG002
+        return hash_embed_batch(texts, self.dim)
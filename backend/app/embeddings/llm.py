@@ -1,15 +1,21 @@
 import os
+import re
 from pathlib import Path
-from typing import Any, Dict, List, Optional
-import requests
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
-try:
-    from cerebras.cloud.sdk import Cerebras  # type: ignore
-except Exception:
-    Cerebras = None
+from starlette.concurrency import run_in_threadpool
 
+from app.embeddings import llm_cache, llm_clients
+
+# "stub", "cerebras", or "openai" (any OpenAI-compatible server at LLM_BASE_URL, e.g. a local vLLM/llama.cpp)
 DEFAULT_PROVIDER = os.environ.get("LLM_PROVIDER", "stub")
 DEFAULT_CEREBRAS_MODEL = os.environ.get("CEREBRAS_MODEL", "qwen-3-235b-a22b-instruct-2507")
+CEREBRAS_BASE_URL = os.environ.get("CEREBRAS_BASE_URL", "https://api.cerebras.ai/v1")
+LLM_BASE_URL = os.environ.get("LLM_BASE_URL", "https://api.openai.com/v1")
+LLM_MODEL = os.environ.get("LLM_MODEL", "gpt-4o-mini")
+ANSWER_TEMPERATURE = 0.2
+# Cache RAG/agent answers although they are sampled at temperature > 0 (repeated questions get the stored answer).
+LLM_CACHE_ANSWERS = os.environ.get("LLM_CACHE_ANSWERS", "false").strip().lower() in {"1", "true", "yes"}
 
 
 def _load_api_key_from_file(path: Path) -> str:
@@ -59,89 +65,217 @@ def _get_cerebras_api_key() -> str:
     return ""
 
 
+def _provider_client(provider: str) -> Tuple[llm_clients.ProviderClient, str]:
+    """(pooled client, default model) for a provider."""
+    if provider == "cerebras":
+        api_key = _get_cerebras_api_key()
+        if not api_key:
+            raise RuntimeError("missing API key (set CEREBRAS_API_KEY or provide APIKEY file)")
+        return llm_clients.get_client(provider, CEREBRAS_BASE_URL, api_key), DEFAULT_CEREBRAS_MODEL
+    if provider == "openai":
+        # local OpenAI-compatible servers usually need no key
+        return llm_clients.get_client(provider, LLM_BASE_URL, (os.environ.get("LLM_API_KEY") or "").strip()), LLM_MODEL
+    raise RuntimeError(f"unsupported provider {provider}")
+
+
+def _stub_chat(messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    joined = "\n\n".join([m.get("content", "") for m in messages if m.get("role") != "system"])
+    return {"provider": "stub", "model": None, "content": f"[stubbed chat]\n{joined}"}
+
+
+def _completion_payload(messages, model, temperature, max_tokens) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {"model": model, "messages": messages, "temperature": temperature}
+    if max_tokens is not None:
+        payload["max_tokens"] = max_tokens
+    return payload
+
+
+def _content(data: Dict[str, Any]) -> str:
+    choices = data.get("choices") or []
+    return ((choices[0].get("message") or {}).get("content") or "") if choices else ""
+
+
+def _delta(chunk: Dict[str, Any]) -> str:
+    choices = chunk.get("choices") or []
+    return ((choices[0].get("delta") or {}).get("content") or "") if choices else ""
+
+
+def _pieces(text: str) -> List[str]:
+    # the stub "streams" word by word so clients exercise the same path
+    return re.findall(r"\s*\S+|\s+$", text) or [text]
+
+
+def _cache_slot(
+    cache: Optional[bool], client: llm_clients.ProviderClient, messages, temperature: float, max_tokens: Optional[int]
+) -> Tuple[Optional[llm_cache.LLMResponseCache], Optional[str]]:
+    """(cache, prompt hash) when this call should go through the response cache, else (None, None)."""
+    if cache is False or (cache is None and temperature != 0):
+        return None, None
+    store = llm_cache.get_cache()
+    if store is None:
+        return None, None
+    return store, llm_cache.prompt_hash(messages, max_tokens=max_tokens, base_url=client.base_url)
+
+
 def chat(
     messages: List[Dict[str, str]],
     *,
     model: Optional[str] = None,
     temperature: float = 0.2,
     max_tokens: Optional[int] = None,
+    cache: Optional[bool] = None,
 ) -> Dict[str, Any]:
     """
     Minimal chat interface used by the agent.
-    Returns: {provider, model, content}
+    Returns: {provider, model, content, cached}
+    `cache`: None caches only temperature-0 calls; True/False force it (see `llm_cache`).
     """
     provider = DEFAULT_PROVIDER
     if provider == "stub":
-        joined = "\n\n".join([m.get("content", "") for m in messages if m.get("role") != "system"])
-        return {"provider": provider, "model": None, "content": f"[stubbed chat]\n{joined}"}
-
-    if provider != "cerebras":
-        raise RuntimeError(f"unsupported provider {provider}")
-
-    api_key = _get_cerebras_api_key()
-    if not api_key:
-        raise RuntimeError("missing API key (set CEREBRAS_API_KEY or provide APIKEY file)")
-
-    chosen_model = model or DEFAULT_CEREBRAS_MODEL
-
-    # Prefer official SDK; fall back to raw HTTP if not installed
-    if Cerebras:
-        client = Cerebras(api_key=api_key)
-        kwargs: Dict[str, Any] = {"model": chosen_model, "messages": messages, "temperature": temperature}
-        if max_tokens is not None:
-            kwargs["max_tokens"] = max_tokens
-        resp = client.chat.completions.create(**kwargs)
-        choices = getattr(resp, "choices", []) or []
-        if choices and getattr(choices[0], "message", None):
-            msg = choices[0].message
-            content = msg.get("content") if isinstance(msg, dict) else msg.content
-        else:
-            content = ""
-        return {"provider": provider, "model": chosen_model, "content": content}
-
-    payload: Dict[str, Any] = {"model": chosen_model, "messages": messages, "temperature": temperature}
-    if max_tokens is not None:
-        payload["max_tokens"] = max_tokens
-    resp = requests.post(
-        "https://api.cerebras.ai/v1/chat/completions",
-        json=payload,
-        headers={"Authorization": f"Bearer {api_key}"},
-        timeout=30,
-    )
-    resp.raise_for_status()
-    data = resp.json()
-    choices = data.get("choices") or []
-    content = choices[0]["message"]["content"] if choices else ""
-    return {"provider": provider, "model": chosen_model, "content": content}
+        return _stub_chat(messages)
+    client, default_model = _provider_client(provider)
+    chosen_model = model or default_model
+    store, key = _cache_slot(cache, client, messages, temperature, max_tokens)
+    if store is not None:
+        hit = store.get(provider, chosen_model, temperature, key)
+        if hit is not None:
+            return {"provider": provider, "model": chosen_model, "content": hit, "cached": True}
+    data = client.post("/chat/completions", _completion_payload(messages, chosen_model, temperature, max_tokens))
+    content = _content(data)
+    if store is not None and content:
+        store.put(provider, chosen_model, temperature, key, content)
+    return {"provider": provider, "model": chosen_model, "content": content, "cached": False}
 
 
-def generate_answer(query: str, contexts: List[Dict]) -> Dict:
+async def achat(
+    messages: List[Dict[str, str]],
+    *,
+    model: Optional[str] = None,
+    temperature: float = 0.2,
+    max_tokens: Optional[int] = None,
+    cache: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """`chat` for async callers; waits on the provider without holding a worker thread."""
+    provider = DEFAULT_PROVIDER
+    if provider == "stub":
+        return _stub_chat(messages)
+    client, default_model = _provider_client(provider)
+    chosen_model = model or default_model
+    store, key = _cache_slot(cache, client, messages, temperature, max_tokens)
+    # the cache is a blocking SQLite file: keep it off the event loop
+    if store is not None:
+        hit = await run_in_threadpool(store.get, provider, chosen_model, temperature, key)
+        if hit is not None:
+            return {"provider": provider, "model": chosen_model, "content": hit, "cached": True}
+    data = await client.apost("/chat/completions", _completion_payload(messages, chosen_model, temperature, max_tokens))
+    content = _content(data)
+    if store is not None and content:
+        await run_in_threadpool(store.put, provider, chosen_model, temperature, key, content)
+    return {"provider": provider, "model": chosen_model, "content": content, "cached": False}
+
+
+async def astream_chat(
+    messages: List[Dict[str, str]],
+    *,
+    model: Optional[str] = None,
+    temperature: float = 0.2,
+    max_tokens: Optional[int] = None,
+) -> AsyncIterator[str]:
+    """`achat` with `"stream": true`; yields content deltas as the provider sends them."""
+    provider = DEFAULT_PROVIDER
+    if provider == "stub":
+        for piece in _pieces(_stub_chat(messages)["content"]):
+            yield piece
+        return
+    client, default_model = _provider_client(provider)
+    payload = _completion_payload(messages, model or default_model, temperature, max_tokens)
+    async for chunk in client.astream("/chat/completions", payload):
+        delta = _delta(chunk)
+        if delta:
+            yield delta
+
+
+def _answer_messages(query: str, contexts: List[Dict]) -> List[Dict[str, str]]:
+    prompt_context = "\n\n".join([c.get("text", "") for c in contexts])
+    return [
+        {"role": "system", "content": "You are a helpful assistant. Use the provided context to answer."},
+        {"role": "user", "content": f"Question: {query}\n\nContext:\n{prompt_context}"},
+    ]
+
+
+def _answer_cache(cache: Optional[bool]) -> Optional[bool]:
+    return cache if cache is not None else (True if LLM_CACHE_ANSWERS else None)
+
+
+def _stub_answer(query: str, contexts: List[Dict]) -> Dict:
+    joined = "\n\n".join([c.get("text", "") for c in contexts])
+    return {"answer": f"[stubbed answer] Query: {query}\nContext:\n{joined}", "provider": "stub"}
+
+
+def generate_answer(query: str, contexts: List[Dict], *, cache: Optional[bool] = None) -> Dict:
     """
     Minimal LLM abstraction.
     - provider 'stub' just echoes the context.
-    - provider 'cerebras' calls Cerebras (OpenAI-compatible) chat completions.
+    - other providers call their (OpenAI-compatible) chat completions endpoint.
+    Answers are cached when `cache` (default LLM_CACHE_ANSWERS) is true.
+    """
+    provider = DEFAULT_PROVIDER
+    if provider == "stub":
+        return _stub_answer(query, contexts)
+    try:
+        resp = chat(_answer_messages(query, contexts), temperature=ANSWER_TEMPERATURE, cache=_answer_cache(cache))
+    except Exception as exc:
+        return {"answer": f"[{provider}] request failed: {exc}", "provider": provider, "model": None}
+    return {"answer": resp.get("content") or f"[{provider}] no content returned", "provider": provider, "model": resp.get("model")}
+
+
+async def agenerate_answer(query: str, contexts: List[Dict], *, cache: Optional[bool] = None) -> Dict:
+    """`generate_answer` on the async client."""
+    provider = DEFAULT_PROVIDER
+    if provider == "stub":
+        return _stub_answer(query, contexts)
+    try:
+        resp = await achat(_answer_messages(query, contexts), temperature=ANSWER_TEMPERATURE, cache=_answer_cache(cache))
+    except Exception as exc:
+        return {"answer": f"[{provider}] request failed: {exc}", "provider": provider, "model": None}
+    return {"answer": resp.get("content") or f"[{provider}] no content returned", "provider": provider, "model": resp.get("model")}
+
+
+async def astream_answer(
+    query: str, contexts: List[Dict], meta: Optional[Dict[str, Any]] = None, *, cache: Optional[bool] = None
+) -> AsyncIterator[str]:
+    """
+    `agenerate_answer` token by token. Fills `meta` with provider/model before
+    the first token. Like `generate_answer` it does not raise: a failed request
+    ends the stream with an error message instead. A cached answer is sent as
+    one piece.
     """
     provider = DEFAULT_PROVIDER
+    meta = meta if meta is not None else {}
+    meta.update(provider=provider, model=None)
     if provider == "stub":
-        joined = "\n\n".join([c.get("text", "") for c in contexts])
-        answer = f"[stubbed answer] Query: {query}\nContext:\n{joined}"
-        return {"answer": answer, "provider": provider}
-    elif provider == "cerebras":
-        model = DEFAULT_CEREBRAS_MODEL
-        prompt_context = "\n\n".join([c.get("text", "") for c in contexts])
-        messages = [
-            {"role": "system", "content": "You are a helpful assistant. Use the provided context to answer."},
-            {"role": "user", "content": f"Question: {query}\n\nContext:\n{prompt_context}"},
-        ]
-        try:
-            resp = chat(messages, model=model)
-            content = resp.get("content") or ""
-            if not content:
-                content = "[cerebras] no content returned"
-            return {"answer": content, "provider": provider, "model": resp.get("model")}
-        except Exception as exc:
-            return {"answer": f"[cerebras] request failed: {exc}", "provider": provider, "model": model}
-    else:
-        # Placeholder for future providers
-        joined = "\n\n".join([c.get("text", "") for c in contexts])
-        return {"answer": f"[unsupported provider {provider}] Context:\n{joined}", "provider": provider}
+        for piece in _pieces(_stub_answer(query, contexts)["answer"]):
+            yield piece
+        return
+    messages = _answer_messages(query, contexts)
+    parts: List[str] = []
+    try:
+        client, meta["model"] = _provider_client(provider)
+        store, key = _cache_slot(_answer_cache(cache), client, messages, ANSWER_TEMPERATURE, None)
+        hit = await run_in_threadpool(store.get, provider, meta["model"], ANSWER_TEMPERATURE, key) if store is not None else None
+        if hit is not None:
+            meta["cached"] = True
+            yield hit
+            return
+        async for delta in astream_chat(messages, model=meta["model"], temperature=ANSWER_TEMPERATURE):
+            parts.append(delta)
+            yield delta
+    except Exception as exc:
+        meta["error"] = str(exc)
+        prefix = "\n" if parts else ""
+        yield f"{prefix}[{provider}] request failed: {exc}"
+        return
+    if not parts:
+        yield f"[{provider}] no content returned"
+    elif store is not None:
+        await run_in_threadpool(store.put, provider, meta["model"], ANSWER_TEMPERATURE, key, "".join(parts))
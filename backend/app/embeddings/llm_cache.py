@@ -0,0 +1,122 @@
+"""Persistent cache of LLM chat completions.
+
+Responses are stored in SQLite and keyed by `(provider, model, temperature,
+sha256(messages, max_tokens, base URL))`. Repeated prompts skip the provider:
+re-uploaded documents re-profiled, agent retries re-routing the same
+question, dashboards asking the same thing again. Entries expire after
+`LLM_CACHE_TTL_S`. When the store exceeds `LLM_CACHE_MAX_MB`, expired and
+then least recently used rows are evicted (see sqlite_lru.py).
+
+`llm.chat` decides per call whether to cache: `cache=None` caches only
+deterministic calls (temperature 0); `True`/`False` force it on or off.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from app.embeddings.sqlite_lru import SqliteLRU
+
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "true").strip().lower() not in {"0", "false", "no"}
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "./llm_cache.sqlite3")
+LLM_CACHE_MAX_BYTES = int(float(os.environ.get("LLM_CACHE_MAX_MB", "64")) * 1024 * 1024)
+LLM_CACHE_TTL_S = float(os.environ.get("LLM_CACHE_TTL_S", "604800"))
+
+_cache: Optional["LLMResponseCache"] = None
+_cache_lock = threading.Lock()
+
+
+def prompt_hash(messages: List[Dict[str, str]], *, max_tokens: Optional[int] = None, base_url: str = "") -> str:
+    blob = json.dumps({"messages": messages, "max_tokens": max_tokens, "base_url": base_url}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache(SqliteLRU):
+    table = "responses"
+    key_columns = ("provider", "model", "temperature", "prompt_hash")
+    size_sql = "LENGTH(CAST(content AS BLOB))"
+
+    def __init__(self, path: str, max_bytes: int, ttl_s: float):
+        self.ttl_s = ttl_s
+        self.expired = 0
+        super().__init__(path, max_bytes)
+
+    def _create(self) -> None:
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " provider TEXT NOT NULL,"
+            " model TEXT NOT NULL,"
+            " temperature REAL NOT NULL,"
+            " prompt_hash TEXT NOT NULL,"
+            " content TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL,"
+            " PRIMARY KEY (provider, model, temperature, prompt_hash))"
+        )
+
+    def get(self, provider: str, model: str, temperature: float, key: str) -> Optional[str]:
+        ident = (provider, model, float(temperature), key)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, created_at FROM responses"
+                " WHERE provider = ? AND model = ? AND temperature = ? AND prompt_hash = ?",
+                ident,
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            content, created_at = row
+            if self.ttl_s > 0 and now - created_at >= self.ttl_s:
+                self._delete(ident, len(content.encode("utf-8")))
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._touch([ident], now)
+            self.hits += 1
+            return content
+
+    def put(self, provider: str, model: str, temperature: float, key: str, content: str) -> None:
+        ident = (provider, model, float(temperature), key)
+        now = time.time()
+        with self._lock:
+            self._upsert(ident, (*ident, content, now, now), len(content.encode("utf-8")))
+            self.writes += 1
+            self._make_room()
+
+    def _evict(self, *, target: int) -> None:
+        # caller holds self._lock; expired rows go first, then least recently used
+        if self.ttl_s > 0:
+            cutoff = time.time() - self.ttl_s
+            freed = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(CAST(content AS BLOB))), 0) FROM responses WHERE created_at < ?", (cutoff,)
+            ).fetchone()
+            if freed[0]:
+                self._conn.execute("DELETE FROM responses WHERE created_at < ?", (cutoff,))
+                self._bytes -= int(freed[1])
+                self.expired += int(freed[0])
+        super()._evict(target=target)
+
+    def stats(self) -> Dict[str, object]:
+        return {**super().stats(), "ttl_s": self.ttl_s, "expired": self.expired}
+
+
+def get_cache() -> Optional[LLMResponseCache]:
+    """Process-wide cache, or None when disabled / the cache file can't be opened."""
+    global _cache, LLM_CACHE_ENABLED
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            try:
+                _cache = LLMResponseCache(LLM_CACHE_PATH, LLM_CACHE_MAX_BYTES, LLM_CACHE_TTL_S)
+            except Exception:
+                # an unusable cache must never break chat
+                LLM_CACHE_ENABLED = False
+                return None
+        return _cache
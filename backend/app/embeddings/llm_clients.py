@@ -0,0 +1,283 @@
+"""Long-lived HTTP clients for OpenAI-compatible chat completion endpoints.
+
+`get_client(name, base_url, api_key)` returns one `ProviderClient` per
+(provider, base URL), reused for the life of the process. A changed `api_key`
+(a rotated key file) is swapped into the existing client's headers, so the
+pool and the concurrency limit carry over. Each client owns:
+
+- a pooled keep-alive `httpx.Client` for sync callers (agent, profiling) and
+  an `httpx.AsyncClient` for async callers (`/rag/query`). Repeated calls
+  reuse the TLS connection instead of paying a handshake every time;
+- a concurrency limit (`LLM_MAX_CONCURRENCY`) shared by sync and async
+  callers, so a burst queues locally instead of tripping provider rate limits.
+  Async callers first queue, in order, on an `asyncio.Semaphore` of the same
+  size. Then they take the shared slot, waiting in the executor only while
+  sync callers hold it;
+- retries for connection errors, timeouts, 429 and 5xx responses. Waits use
+  full-jitter exponential backoff, or honour `Retry-After` when present.
+
+`astream` posts with `"stream": true` and yields the parsed server-sent
+chunks. It retries only until the response starts; a stream that breaks
+halfway raises, since the caller has already forwarded part of it.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import httpx
+
+LLM_TIMEOUT_S = float(os.environ.get("LLM_TIMEOUT_S", "30"))
+LLM_CONNECT_TIMEOUT_S = float(os.environ.get("LLM_CONNECT_TIMEOUT_S", "5"))
+LLM_MAX_RETRIES = max(0, int(os.environ.get("LLM_MAX_RETRIES", "2")))
+LLM_BACKOFF_BASE_S = float(os.environ.get("LLM_BACKOFF_BASE_S", "0.5"))
+LLM_BACKOFF_MAX_S = float(os.environ.get("LLM_BACKOFF_MAX_S", "8"))
+# In-flight requests per provider across all threads and the event loop.
+LLM_MAX_CONCURRENCY = max(1, int(os.environ.get("LLM_MAX_CONCURRENCY", "8")))
+LLM_POOL_MAX_CONNECTIONS = int(os.environ.get("LLM_POOL_MAX_CONNECTIONS", "20"))
+LLM_POOL_KEEPALIVE = int(os.environ.get("LLM_POOL_KEEPALIVE", "10"))
+
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMRequestError(RuntimeError):
+    pass
+
+
+def _backoff(attempt: int, retry_after: Optional[str] = None) -> float:
+    if retry_after:
+        try:
+            return min(LLM_BACKOFF_MAX_S, max(0.0, float(retry_after)))
+        except ValueError:
+            pass
+    return random.uniform(0, min(LLM_BACKOFF_MAX_S, LLM_BACKOFF_BASE_S * (2 ** attempt)))
+
+
+class ProviderClient:
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        api_key: str = "",
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        transport: Optional[Any] = None,
+    ):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self._api_key = api_key
+        self._headers = self._auth_headers(api_key)
+        self._timeout = httpx.Timeout(LLM_TIMEOUT_S, connect=LLM_CONNECT_TIMEOUT_S)
+        self._limits = httpx.Limits(max_connections=LLM_POOL_MAX_CONNECTIONS, max_keepalive_connections=LLM_POOL_KEEPALIVE)
+        self._max_concurrency = max_concurrency
+        # tests pass an httpx.MockTransport
+        self._transport = transport
+        # shared by sync and async callers
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._client: Optional[httpx.Client] = None
+        self._aclient: Optional[httpx.AsyncClient] = None
+        self._aclient_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._aslots: Optional[asyncio.Semaphore] = None
+        self._stats = {"requests": 0, "retries": 0, "errors": 0, "streams": 0}
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def _auth_headers(api_key: str) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {api_key}"} if api_key else {}
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _count(self, name: str) -> None:
+        # bumped from worker threads and the event loop alike
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def set_api_key(self, api_key: str) -> None:
+        """Use `api_key` for requests from now on; in-flight requests keep the old one."""
+        with self._lock:
+            if api_key == self._api_key:
+                return
+            self._api_key = api_key
+            self._headers = self._auth_headers(api_key)
+            for client in (self._client, self._aclient):
+                if client is not None:
+                    # assigning swaps the whole headers object; concurrent requests see old or new
+                    client.headers = self._headers
+
+    def _sync_client(self) -> httpx.Client:
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(
+                    base_url=self.base_url, headers=self._headers, timeout=self._timeout, limits=self._limits, transport=self._transport
+                )
+            return self._client
+
+    async def _async_state(self) -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        # an AsyncClient's pool (and an asyncio.Semaphore) belongs to the loop that first used it
+        loop = asyncio.get_running_loop()
+        stale = None
+        with self._lock:
+            if self._aclient is None or self._aclient_loop is not loop:
+                stale = self._aclient
+                self._aclient = httpx.AsyncClient(
+                    base_url=self.base_url, headers=self._headers, timeout=self._timeout, limits=self._limits, transport=self._transport
+                )
+                self._aslots = asyncio.Semaphore(self._max_concurrency)
+                self._aclient_loop = loop
+            client, aslots = self._aclient, self._aslots
+        if stale is not None:
+            try:
+                await stale.aclose()
+            except Exception:
+                # its loop is gone, and its sockets with it
+                pass
+        return client, aslots
+
+    async def _acquire(self, aslots: asyncio.Semaphore) -> None:
+        await aslots.acquire()
+        try:
+            if self._slots.acquire(blocking=False):
+                return
+            # sync callers hold the shared slots; wait for one off the loop
+            waiter = asyncio.get_running_loop().run_in_executor(None, self._slots.acquire)
+            try:
+                await asyncio.shield(waiter)
+            except asyncio.CancelledError:
+                # the executor still takes the slot eventually; hand it straight back
+                waiter.add_done_callback(lambda f: self._slots.release())
+                raise
+        except BaseException:
+            aslots.release()
+            raise
+
+    def _release(self, aslots: asyncio.Semaphore) -> None:
+        self._slots.release()
+        aslots.release()
+
+    def _check(self, resp: httpx.Response) -> Dict[str, Any]:
+        if resp.status_code >= 400:
+            raise httpx.HTTPStatusError(f"{self.name} returned {resp.status_code}: {resp.text[:300]}", request=resp.request, response=resp)
+        return resp.json()
+
+    @staticmethod
+    def _retryable(exc: Exception) -> Tuple[bool, Optional[str]]:
+        if isinstance(exc, httpx.HTTPStatusError):
+            return exc.response.status_code in RETRY_STATUS, exc.response.headers.get("retry-after")
+        return isinstance(exc, httpx.TransportError), None
+
+    def post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        client = self._sync_client()
+        with self._slots:
+            for attempt in range(LLM_MAX_RETRIES + 1):
+                self._count("requests")
+                try:
+                    return self._check(client.post(path, json=payload))
+                except Exception as exc:
+                    retry, after = self._retryable(exc)
+                    if not retry or attempt == LLM_MAX_RETRIES:
+                        self._count("errors")
+                        raise LLMRequestError(str(exc)) from exc
+                    self._count("retries")
+                    time.sleep(_backoff(attempt, after))
+        raise LLMRequestError("unreachable")  # pragma: no cover
+
+    async def apost(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        client, aslots = await self._async_state()
+        await self._acquire(aslots)
+        try:
+            for attempt in range(LLM_MAX_RETRIES + 1):
+                self._count("requests")
+                try:
+                    return self._check(await client.post(path, json=payload))
+                except Exception as exc:
+                    retry, after = self._retryable(exc)
+                    if not retry or attempt == LLM_MAX_RETRIES:
+                        self._count("errors")
+                        raise LLMRequestError(str(exc)) from exc
+                    self._count("retries")
+                    await asyncio.sleep(_backoff(attempt, after))
+        finally:
+            self._release(aslots)
+        raise LLMRequestError("unreachable")  # pragma: no cover
+
+    async def astream(self, path: str, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        client, aslots = await self._async_state()
+        await self._acquire(aslots)
+        try:
+            started = False
+            for attempt in range(LLM_MAX_RETRIES + 1):
+                self._count("requests")
+                try:
+                    async with client.stream("POST", path, json={**payload, "stream": True}) as resp:
+                        if resp.status_code >= 400:
+                            await resp.aread()
+                            self._check(resp)
+                        started = True
+                        self._count("streams")
+                        async for line in resp.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[5:].strip()
+                            if data == "[DONE]":
+                                return
+                            yield json.loads(data)
+                    return
+                except Exception as exc:
+                    retry, after = self._retryable(exc)
+                    # once the response has started a retry would repeat what was already yielded
+                    if not retry or started or attempt == LLM_MAX_RETRIES:
+                        self._count("errors")
+                        raise LLMRequestError(str(exc)) from exc
+                    self._count("retries")
+                    await asyncio.sleep(_backoff(attempt, after))
+        finally:
+            self._release(aslots)
+
+    async def aclose(self) -> None:
+        with self._lock:
+            client, self._client = self._client, None
+            aclient, self._aclient = self._aclient, None
+            self._aclient_loop = None
+            self._aslots = None
+        if client is not None:
+            client.close()
+        if aclient is not None:
+            await aclient.aclose()
+
+
+_clients: Dict[Tuple[str, str], ProviderClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name: str, base_url: str, api_key: str = "") -> ProviderClient:
+    key = (name, base_url.rstrip("/"))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = ProviderClient(name, base_url, api_key)
+        else:
+            client.set_api_key(api_key)
+        return client
+
+
+async def aclose_all() -> None:
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+def stats() -> Dict[str, Any]:
+    with _clients_lock:
+        clients = list(_clients.items())
+    return {f"{name} {url}": {**c.stats, "max_concurrency": c._max_concurrency} for (name, url), c in clients}
@@ -0,0 +1,555 @@
+"""In-process exact vector index (`VECTOR_BACKEND=numpy`).
+
+Layout under `NUMPY_INDEX_DIR`, one directory per KB:
+
+    <kb>/manifest.json        segment list + tombstoned ids per segment (replaced atomically)
+    <kb>/seg-000001.f32       float32 matrix (rows x dim), opened with np.memmap
+    <kb>/seg-000001.json      sidecar: ids, documents, metadatas of those rows
+
+Writes append a new immutable segment; deletes add tombstones. Once a KB has
+more than `NUMPY_MAX_SEGMENTS` segments (or too many tombstones) its segments
+are rewritten into one. Search is exact: squared L2 distances (the metric of
+the Chroma collections) from one matrix product per segment, then
+`argpartition` for the top k. Segment files are read-only memory maps, so
+several workers share them through the OS page cache. Writers (append,
+delete, compaction) take an exclusive `flock` on `<kb>/.writer.lock` and
+reload the manifest under it, so concurrent worker processes never write
+the same segment number or replace each other's manifest. Readers take no
+lock: a compaction may unlink the segments of a manifest a reader has just
+read, so a reader that then misses a segment file reloads the new manifest.
+Segments it has already opened stay readable, since their memory maps keep the
+unlinked files alive.
+
+With `NUMPY_QUANTIZATION=int8|pq` every segment also gets compressed codes
+(`seg-000001.sq8` / `.pq` plus the fitted parameters in a `.npz`, see
+quantization.py). A query scans only the codes, keeps the
+`k * NUMPY_RESCORE_FACTOR` best rows per segment and computes their exact
+distances from the float32 rows, so only the shortlist's pages of the full
+matrix are touched. Segments written before quantization was switched on
+are encoded the first time they are loaded, under the writer lock so two
+processes never write the same code files.
+
+`NumpyIndex` mimics the subset of the Chroma collection API that
+`vector_store` uses (`add`, `get`, `query`, `delete`).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import shutil
+import threading
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, Callable, ContextManager, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: only one writer process per index
+    fcntl = None
+
+from app.embeddings.quantization import MODES as QUANTIZATION_MODES, QUANTIZERS
+
+NUMPY_INDEX_DIR = os.environ.get("NUMPY_INDEX_DIR", "./vector_index")
+NUMPY_MAX_SEGMENTS = max(1, int(os.environ.get("NUMPY_MAX_SEGMENTS", "8")))
+# Compact once this fraction of a KB's rows is tombstoned.
+NUMPY_COMPACT_DEAD_RATIO = float(os.environ.get("NUMPY_COMPACT_DEAD_RATIO", "0.2"))
+# "none" (exact scan of float32 rows), "int8" or "pq" (scan compressed codes, rescore a shortlist)
+NUMPY_QUANTIZATION = os.environ.get("NUMPY_QUANTIZATION", "none").strip().lower()
+# Shortlisted rows per requested result that get rescored against full precision.
+NUMPY_RESCORE_FACTOR = max(1, int(os.environ.get("NUMPY_RESCORE_FACTOR", "4")))
+# PQ subspaces (bytes per vector).
+NUMPY_PQ_M = max(1, int(os.environ.get("NUMPY_PQ_M", "32")))
+
+DEFAULT_SHARD = "_default"
+_SAFE = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def _shard_name(kb_id: Optional[str]) -> str:
+    return _SAFE.sub("_", kb_id) if kb_id else DEFAULT_SHARD
+
+
+def _write_json(path: Path, obj: Any) -> None:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(obj))
+    os.replace(tmp, path)
+
+
+_SEGMENT_SUFFIXES = (".f32", ".json") + tuple(
+    ext for q in QUANTIZERS.values() for ext in (q.suffix, q.suffix + ".npz")
+)
+
+
+class _Segment:
+    def __init__(
+        self,
+        directory: Path,
+        name: str,
+        dim: int,
+        quantization: str = "none",
+        encode_lock: Optional[Callable[[], ContextManager[Any]]] = None,
+    ):
+        side = json.loads((directory / f"{name}.json").read_text())
+        self.name = name
+        self.ids: List[str] = side["ids"]
+        self.documents: List[str] = side["documents"]
+        self.metadatas: List[Dict[str, Any]] = side["metadatas"]
+        n = len(self.ids)
+        self.matrix = np.memmap(directory / f"{name}.f32", dtype=np.float32, mode="r", shape=(n, dim)) if n else np.zeros((0, dim), np.float32)
+        self._sq_norms: Optional[np.ndarray] = None
+        self.row = {vid: i for i, vid in enumerate(self.ids)}
+        self._columns: Dict[str, np.ndarray] = {}
+        self.quantizer = None
+        self.codes: Optional[np.ndarray] = None
+        self.code_norms: Optional[np.ndarray] = None
+        if quantization != "none" and n:
+            self._load_codes(directory, quantization, encode_lock or nullcontext)
+
+    @property
+    def sq_norms(self) -> np.ndarray:
+        # only the exact scan needs these; computing them reads the whole matrix
+        if self._sq_norms is None:
+            self._sq_norms = np.einsum("ij,ij->i", self.matrix, self.matrix) if len(self.ids) else np.zeros(0, np.float32)
+        return self._sq_norms
+
+    def _load_codes(self, directory: Path, quantization: str, encode_lock: Callable[[], ContextManager[Any]]) -> None:
+        cls = QUANTIZERS[quantization]
+        codes_path = directory / f"{self.name}{cls.suffix}"
+        params_path = directory / f"{self.name}{cls.suffix}.npz"
+        if not (codes_path.exists() and params_path.exists()):
+            # fitting is randomised: only one process may write a segment's codes and parameters
+            with encode_lock():
+                if not (codes_path.exists() and params_path.exists()):
+                    quantizer = cls.fit(self.matrix, m=NUMPY_PQ_M)
+                    codes = quantizer.encode(self.matrix)
+                    tmp = codes_path.with_suffix(codes_path.suffix + ".tmp")
+                    codes.tofile(tmp)
+                    os.replace(tmp, codes_path)
+                    tmp = params_path.with_suffix(".tmp")
+                    with open(tmp, "wb") as fh:
+                        quantizer.save(fh, quantizer.sq_norms(codes))
+                    os.replace(tmp, params_path)
+        with np.load(params_path) as data:
+            self.quantizer = cls.load(data)
+            self.code_norms = data["sq_norms"] if "sq_norms" in data.files else None
+        width = self.quantizer.code_width(self.matrix.shape[1])
+        self.codes = np.memmap(codes_path, dtype=np.uint8, mode="r", shape=(len(self.ids), width))
+
+    def nearest(self, q: np.ndarray, q_sq: float, rows: np.ndarray, k: int, rescore: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(squared distances, row numbers) of the k nearest of `rows`, unordered."""
+        if self.quantizer is None:
+            if len(rows) == len(self.ids):
+                dist = self.sq_norms - 2.0 * (self.matrix @ q) + q_sq
+            else:
+                dist = self.sq_norms[rows] - 2.0 * (self.matrix[rows] @ q) + q_sq
+        else:
+            whole = len(rows) == len(self.ids)
+            codes = self.codes if whole else self.codes[rows]
+            norms = self.code_norms if whole or self.code_norms is None else self.code_norms[rows]
+            approx = self.quantizer.distances(q, codes, norms)
+            short = min(len(rows), k * rescore)
+            if short < len(rows):
+                rows = np.sort(rows[np.argpartition(approx, short - 1)[:short]])
+            diff = np.asarray(self.matrix[rows]) - q
+            dist = np.einsum("ij,ij->i", diff, diff)
+        k = min(k, len(rows))
+        top = np.argpartition(dist, k - 1)[:k] if k < len(rows) else np.arange(len(rows))
+        return dist[top], rows[top]
+
+    def column(self, key: str) -> np.ndarray:
+        col = self._columns.get(key)
+        if col is None:
+            col = np.empty(len(self.ids), dtype=object)
+            col[:] = [m.get(key) if m else None for m in self.metadatas]
+            self._columns[key] = col
+        return col
+
+
+def _isin(col: np.ndarray, values: Iterable[Any]) -> np.ndarray:
+    # metadata columns are object arrays that may hold None, which np.isin can't sort
+    wanted = set(values)
+    return np.fromiter((c in wanted for c in col), dtype=bool, count=len(col))
+
+
+_OPS = {
+    "$eq": lambda col, v: col == v,
+    "$ne": lambda col, v: col != v,
+    "$in": lambda col, v: _isin(col, v),
+    "$nin": lambda col, v: ~_isin(col, v),
+}
+_CMP = {"$gt": np.greater, "$gte": np.greater_equal, "$lt": np.less, "$lte": np.less_equal}
+
+
+def _compare(col: np.ndarray, op: str, value: Any) -> np.ndarray:
+    if op in _OPS:
+        return np.asarray(_OPS[op](col, value), dtype=bool)
+    if op in _CMP:
+        present = np.array([c is not None for c in col], dtype=bool)
+        out = np.zeros(len(col), dtype=bool)
+        if present.any():
+            out[present] = _CMP[op](col[present].astype(float), value)
+        return out
+    raise ValueError(f"unsupported where operator: {op}")
+
+
+def where_mask(where: Optional[Dict[str, Any]], seg: _Segment) -> np.ndarray:
+    """Evaluate a Chroma-style `where` filter against a segment's metadata columns."""
+    n = len(seg.ids)
+    if not where:
+        return np.ones(n, dtype=bool)
+    mask = np.ones(n, dtype=bool)
+    for key, cond in where.items():
+        if key == "$and":
+            for sub in cond:
+                mask &= where_mask(sub, seg)
+        elif key == "$or":
+            acc = np.zeros(n, dtype=bool)
+            for sub in cond:
+                acc |= where_mask(sub, seg)
+            mask &= acc
+        elif isinstance(cond, dict):
+            for op, value in cond.items():
+                mask &= _compare(seg.column(key), op, value)
+        else:
+            mask &= _compare(seg.column(key), "$eq", cond)
+    return mask
+
+
+def kb_from_where(where: Optional[Dict[str, Any]]) -> Optional[str]:
+    """The kb_id a filter pins (top level or inside `$and`), if any."""
+    if not where:
+        return None
+    kb = where.get("kb_id")
+    if isinstance(kb, dict):
+        kb = kb.get("$eq")
+    if isinstance(kb, str):
+        return kb
+    for sub in where.get("$and") or []:
+        found = kb_from_where(sub)
+        if found:
+            return found
+    return None
+
+
+class _Shard:
+    """All segments of one KB."""
+
+    def __init__(self, directory: Path, quantization: str = "none"):
+        self.dir = directory
+        self.quantization = quantization
+        self.lock = threading.RLock()
+        self._writers = 0
+        self._stamp: Optional[Tuple[int, int]] = None
+        self.dim: Optional[int] = None
+        self.segments: List[_Segment] = []
+        self.tombstones: Dict[str, Set[str]] = {}
+        self.next_seq = 1
+        self._alive: Dict[str, np.ndarray] = {}
+
+    @property
+    def manifest(self) -> Path:
+        return self.dir / "manifest.json"
+
+    def _manifest_stamp(self) -> Tuple[int, int]:
+        # the manifest is always replaced, so a new inode means a new version
+        st = self.manifest.stat()
+        return st.st_ino, st.st_mtime_ns
+
+    def _current_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            return self._manifest_stamp()
+        except FileNotFoundError:
+            return None
+
+    def refresh(self) -> None:
+        """(Re)load the manifest when another writer or process changed it."""
+        stamp = self._current_stamp()
+        if stamp == self._stamp:
+            return
+        with self.lock:
+            while True:
+                try:
+                    self._load(stamp)
+                    return
+                except FileNotFoundError:
+                    # a compaction replaced the manifest and unlinked segments it listed: load the new one
+                    newer = self._current_stamp()
+                    if newer == stamp:
+                        raise
+                    stamp = newer
+
+    def _load(self, stamp: Optional[Tuple[int, int]]) -> None:
+        if stamp is None:
+            self.dim, self.segments, self.tombstones, self.next_seq = None, [], {}, 1
+        else:
+            man = json.loads(self.manifest.read_text())
+            old = {s.name: s for s in self.segments}
+            segments = [old.get(name) or self._open_segment(name, man.get("dim")) for name in man["segments"]]
+            # assign only once every segment opened, so a failed load leaves the previous state intact
+            self.dim = man.get("dim")
+            self.segments = segments
+            self.tombstones = {name: set(v) for name, v in (man.get("tombstones") or {}).items()}
+            self.next_seq = man.get("next_seq", 1)
+        self._alive = {}
+        self._stamp = stamp
+
+    def _open_segment(self, name: str, dim: Optional[int]) -> _Segment:
+        return _Segment(self.dir, name, dim, self.quantization, encode_lock=self._exclusive)
+
+    @contextmanager
+    def writing(self) -> Iterator[None]:
+        """Exclusive write access across threads and processes, with the manifest freshly loaded."""
+        with self._exclusive():
+            self.refresh()
+            yield
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        with self.lock:
+            fh = None
+            if self._writers == 0 and fcntl is not None:
+                self.dir.mkdir(parents=True, exist_ok=True)
+                fh = open(self.dir / ".writer.lock", "a+")
+                fcntl.flock(fh, fcntl.LOCK_EX)
+            self._writers += 1
+            try:
+                yield
+            finally:
+                self._writers -= 1
+                if fh is not None:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+                    fh.close()
+
+    def _save_manifest(self) -> None:
+        self.dir.mkdir(parents=True, exist_ok=True)
+        _write_json(
+            self.manifest,
+            {
+                "dim": self.dim,
+                "segments": [s.name for s in self.segments],
+                "tombstones": {name: sorted(v) for name, v in self.tombstones.items() if v},
+                "next_seq": self.next_seq,
+            },
+        )
+        self._stamp = self._manifest_stamp()
+        self._alive = {}
+
+    def alive(self, seg: _Segment) -> np.ndarray:
+        mask = self._alive.get(seg.name)
+        if mask is None:
+            mask = np.ones(len(seg.ids), dtype=bool)
+            for vid in self.tombstones.get(seg.name, ()):
+                mask[seg.row[vid]] = False
+            self._alive[seg.name] = mask
+        return mask
+
+    def _write_segment(self, ids, documents, metadatas, matrix: np.ndarray) -> _Segment:
+        self.dir.mkdir(parents=True, exist_ok=True)
+        name = f"seg-{self.next_seq:06d}"
+        self.next_seq += 1
+        np.ascontiguousarray(matrix, dtype=np.float32).tofile(self.dir / f"{name}.f32")
+        _write_json(self.dir / f"{name}.json", {"ids": list(ids), "documents": list(documents), "metadatas": list(metadatas)})
+        return self._open_segment(name, self.dim)
+
+    def append(self, ids, documents, metadatas, embeddings) -> None:
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        with self.writing():
+            if self.dim is None:
+                self.dim = int(matrix.shape[1])
+            elif matrix.shape[1] != self.dim:
+                raise ValueError(f"embedding dimension {matrix.shape[1]} does not match index dimension {self.dim}")
+            # re-adding an id supersedes its previous rows
+            self._tombstone(ids)
+            self.segments.append(self._write_segment(ids, documents, metadatas, matrix))
+            self._save_manifest()
+            if self.needs_compaction():
+                self.compact()
+
+    def delete(self, ids: Iterable[str]) -> int:
+        with self.writing():
+            hits = self._tombstone(ids)
+            if not hits:
+                return 0
+            self._save_manifest()
+            if self.needs_compaction():
+                self.compact()
+            return hits
+
+    def _tombstone(self, ids: Iterable[str]) -> int:
+        """Mark live rows holding `ids` dead; returns how many ids had a live row."""
+        hit = 0
+        for vid in set(ids):
+            found = False
+            for seg in self.segments:
+                if vid in seg.row:
+                    dead = self.tombstones.setdefault(seg.name, set())
+                    if vid not in dead:
+                        dead.add(vid)
+                        found = True
+            hit += found
+        return hit
+
+    def rows(self) -> int:
+        return sum(len(s.ids) for s in self.segments)
+
+    def dead(self) -> int:
+        return sum(len(v) for v in self.tombstones.values())
+
+    def needs_compaction(self) -> bool:
+        total = self.rows()
+        return len(self.segments) > NUMPY_MAX_SEGMENTS or (total > 0 and self.dead() / total > NUMPY_COMPACT_DEAD_RATIO)
+
+    def compact(self) -> Dict[str, int]:
+        """Rewrite live rows of all segments into one segment and drop tombstones."""
+        with self.writing():
+            before = len(self.segments)
+            ids: List[str] = []
+            documents: List[str] = []
+            metadatas: List[Dict[str, Any]] = []
+            parts: List[np.ndarray] = []
+            for seg in self.segments:
+                keep = np.flatnonzero(self.alive(seg))
+                ids.extend(seg.ids[i] for i in keep)
+                documents.extend(seg.documents[i] for i in keep)
+                metadatas.extend(seg.metadatas[i] for i in keep)
+                parts.append(np.asarray(seg.matrix[keep]))
+            dropped = self.rows() - len(ids)
+            old = self.segments
+            matrix = np.concatenate(parts, axis=0) if parts else np.zeros((0, self.dim or 0), np.float32)
+            self.segments = [self._write_segment(ids, documents, metadatas, matrix)] if ids else []
+            self.tombstones = {}
+            self._save_manifest()
+            for seg in old:
+                for suffix in _SEGMENT_SUFFIXES:
+                    try:
+                        (self.dir / f"{seg.name}{suffix}").unlink()
+                    except FileNotFoundError:
+                        pass
+            return {"segments_before": before, "segments_after": len(self.segments), "rows_dropped": dropped}
+
+
+class NumpyIndex:
+    """Chroma-collection-like facade over per-KB shards."""
+
+    def __init__(self, root: str, quantization: Optional[str] = None, rescore_factor: Optional[int] = None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.quantization = (quantization or NUMPY_QUANTIZATION).strip().lower()
+        if self.quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"unknown quantization: {self.quantization} (expected one of {', '.join(QUANTIZATION_MODES)})")
+        self.rescore_factor = rescore_factor or NUMPY_RESCORE_FACTOR
+        self._shards: Dict[str, _Shard] = {}
+        self._lock = threading.Lock()
+
+    def _shard(self, name: str) -> _Shard:
+        with self._lock:
+            shard = self._shards.get(name)
+            if shard is None:
+                shard = self._shards[name] = _Shard(self.root / name, self.quantization)
+        shard.refresh()
+        return shard
+
+    def _shards_for(self, where: Optional[Dict[str, Any]]) -> List[_Shard]:
+        kb = kb_from_where(where)
+        if kb is not None:
+            return [self._shard(_shard_name(kb))]
+        return [self._shard(p.name) for p in sorted(self.root.iterdir()) if (p / "manifest.json").exists()]
+
+    def add(self, ids: Sequence[str], documents: Sequence[str], embeddings, metadatas: Sequence[Dict[str, Any]]) -> None:
+        groups: Dict[str, List[int]] = {}
+        for i, meta in enumerate(metadatas):
+            groups.setdefault(_shard_name((meta or {}).get("kb_id")), []).append(i)
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        for name, rows in groups.items():
+            self._shard(name).append(
+                [ids[i] for i in rows],
+                [documents[i] for i in rows],
+                [metadatas[i] or {} for i in rows],
+                matrix[rows],
+            )
+
+    def get(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict[str, Any]] = None, include: Optional[List[str]] = None) -> Dict[str, Any]:
+        include = include or ["documents", "metadatas"]
+        wanted = set(ids) if ids is not None else None
+        out: Dict[str, List[Any]] = {"ids": [], "embeddings": [], "documents": [], "metadatas": []}
+        for shard in self._shards_for(where):
+            for seg in reversed(shard.segments):
+                mask = shard.alive(seg) & where_mask(where, seg)
+                rows = [seg.row[v] for v in wanted.intersection(seg.row)] if wanted is not None else np.flatnonzero(mask).tolist()
+                for r in rows:
+                    if not mask[r]:
+                        continue
+                    out["ids"].append(seg.ids[r])
+                    out["embeddings"].append(seg.matrix[r].tolist())
+                    out["documents"].append(seg.documents[r])
+                    out["metadatas"].append(seg.metadatas[r])
+        return {k: v for k, v in out.items() if k == "ids" or k in include}
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[Dict[str, Any]] = None, **_: Any) -> Dict[str, Any]:
+        results: Dict[str, List[List[Any]]] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        shards = self._shards_for(where)
+        for q in np.asarray(query_embeddings, dtype=np.float32):
+            cands: List[Tuple[np.ndarray, _Segment, np.ndarray]] = []
+            q_sq = float(q @ q)
+            for shard in shards:
+                for seg in shard.segments:
+                    if not len(seg.ids):
+                        continue
+                    rows = np.flatnonzero(shard.alive(seg) & where_mask(where, seg))
+                    if not len(rows):
+                        continue
+                    dist, top = seg.nearest(q, q_sq, rows, n_results, self.rescore_factor)
+                    cands.append((dist, seg, top))
+            if cands:
+                dists = np.concatenate([c[0] for c in cands])
+                owners = [(seg, r) for _, seg, rr in cands for r in rr]
+                order = np.argsort(dists, kind="stable")[:n_results]
+            else:
+                dists, owners, order = np.zeros(0), [], []
+            results["ids"].append([owners[i][0].ids[owners[i][1]] for i in order])
+            results["documents"].append([owners[i][0].documents[owners[i][1]] for i in order])
+            results["metadatas"].append([owners[i][0].metadatas[owners[i][1]] for i in order])
+            results["distances"].append([max(0.0, float(dists[i])) for i in order])
+        return results
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict[str, Any]] = None) -> int:
+        if ids is None and where is None:
+            return 0
+        victims = list(ids) if where is None else self.get(ids=ids, where=where, include=[])["ids"]
+        return sum(shard.delete(victims) for shard in self._shards_for(where))
+
+    def drop_kb(self, kb_id: str) -> None:
+        name = _shard_name(kb_id)
+        with self._lock:
+            shard = self._shards.pop(name, None)
+        if shard is None:
+            shard = _Shard(self.root / name, self.quantization)
+        if shard.dir.exists():
+            with shard.writing():
+                shutil.rmtree(shard.dir, ignore_errors=True)
+
+    def compact(self) -> Dict[str, Dict[str, int]]:
+        return {shard.dir.name: shard.compact() for shard in self._shards_for(None)}
+
+    def count(self) -> int:
+        return sum(shard.rows() - shard.dead() for shard in self._shards_for(None))
+
+    def memory(self) -> Dict[str, Any]:
+        """Bytes of the float32 rows vs. the codes a quantized query scans."""
+        rows = vector_bytes = code_bytes = 0
+        for shard in self._shards_for(None):
+            for seg in shard.segments:
+                rows += len(seg.ids)
+                vector_bytes += seg.matrix.nbytes
+                if seg.codes is not None:
+                    code_bytes += seg.codes.nbytes + (seg.code_norms.nbytes if seg.code_norms is not None else 0)
+        return {
+            "quantization": self.quantization,
+            "rows": rows,
+            "float32_bytes": int(vector_bytes),
+            "code_bytes": int(code_bytes),
+            "scanned_bytes": int(code_bytes if self.quantization != "none" else vector_bytes),
+        }
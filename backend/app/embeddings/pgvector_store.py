@@ -0,0 +1,288 @@
+"""pgvector-backed vector store (`VECTOR_BACKEND=pgvector`).
+
+Vectors live next to the relational data in the `chunks_vector` table
+(see `db/schemas/detailed_schema.sql`), which is created on first write
+because its `vector(dim)` type depends on the active embedder:
+
+- rows reference `knowledge_bases` / `document_versions` with
+  `ON DELETE CASCADE`, so deleting a KB, document or version removes its vectors;
+- metadata filters become SQL: `kb_id` / `version_id` are columns,
+  `document_id` is resolved by joining `document_versions`, anything else
+  compares `meta ->> key`;
+- writes are bulk-loaded with `COPY` into a temp table and upserted;
+- search orders by `embedding <-> query` (L2) so the HNSW (or ivfflat)
+  index is used; reported distances are squared L2, like Chroma's.
+
+`PgVectorIndex` mimics the subset of the Chroma collection API that
+`vector_store` uses (`add`, `get`, `query`, `delete`).
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+PGVECTOR_INDEX = os.environ.get("PGVECTOR_INDEX", "hnsw").strip().lower()  # hnsw | ivfflat | none
+PGVECTOR_HNSW_M = int(os.environ.get("PGVECTOR_HNSW_M", "16"))
+PGVECTOR_HNSW_EF_CONSTRUCTION = int(os.environ.get("PGVECTOR_HNSW_EF_CONSTRUCTION", "64"))
+PGVECTOR_EF_SEARCH = int(os.environ.get("PGVECTOR_EF_SEARCH", "100"))
+PGVECTOR_IVF_LISTS = int(os.environ.get("PGVECTOR_IVF_LISTS", "100"))
+PGVECTOR_IVF_PROBES = int(os.environ.get("PGVECTOR_IVF_PROBES", "10"))
+
+TABLE = "chunks_vector"
+_COLUMNS = {"kb_id": "cv.kb_id", "version_id": "cv.version_id", "document_id": "dv.document_id"}
+_CMP = {"$eq": "=", "$ne": "<>", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+def _vec_literal(vec: Sequence[float]) -> str:
+    return "[" + ",".join(f"{float(x):.9g}" for x in vec) + "]"
+
+
+def _meta_text(value: Any) -> str:
+    # `meta ->> key` renders JSON scalars as text
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def where_sql(where: Optional[Dict[str, Any]]) -> Tuple[str, List[Any], bool]:
+    """Translate a Chroma-style `where` into (SQL condition, params, needs document_versions join)."""
+    if not where:
+        return "TRUE", [], False
+    parts: List[str] = []
+    params: List[Any] = []
+    join = False
+    for key, cond in where.items():
+        if key in ("$and", "$or"):
+            subs = [where_sql(sub) for sub in cond]
+            glue = " AND " if key == "$and" else " OR "
+            parts.append("(" + glue.join(s for s, _, _ in subs) + ")" if subs else "TRUE")
+            for _, p, j in subs:
+                params.extend(p)
+                join = join or j
+            continue
+        join = join or key == "document_id"
+        for op, value in (cond if isinstance(cond, dict) else {"$eq": cond}).items():
+            numeric = op in ("$gt", "$gte", "$lt", "$lte")
+            if key in _COLUMNS:
+                field, key_params, conv = _COLUMNS[key], [], (lambda v: v)
+            else:
+                cast = "::double precision" if numeric else ""
+                field, key_params, conv = f"(cv.meta ->> %s){cast}", [key], (float if numeric else _meta_text)
+            if op in ("$in", "$nin"):
+                neg = "NOT " if op == "$nin" else ""
+                parts.append(f"{neg}({field} = ANY(%s))")
+                params.extend(key_params + [[conv(v) for v in value]])
+            elif op in _CMP:
+                parts.append(f"{field} {_CMP[op]} %s")
+                params.extend(key_params + [conv(value)])
+            else:
+                raise ValueError(f"unsupported where operator: {op}")
+    return " AND ".join(parts) or "TRUE", params, join
+
+
+def copy_payload(ids: Sequence[str], documents: Sequence[str], embeddings, metadatas: Sequence[Dict[str, Any]]) -> io.StringIO:
+    """CSV for `COPY chunks_vector_load (id, version_id, kb_id, text, embedding, meta)`; empty ids load as NULL."""
+    buf = io.StringIO()
+    writer = csv.writer(buf, quoting=csv.QUOTE_ALL, lineterminator="\n")
+    for vid, text, emb, meta in zip(ids, documents, embeddings, metadatas):
+        meta = meta or {}
+        writer.writerow([
+            vid,
+            meta.get("version_id") or "",
+            meta.get("kb_id") or "",
+            (text or "").replace("\x00", ""),
+            _vec_literal(emb),
+            json.dumps(meta),
+        ])
+    buf.seek(0)
+    return buf
+
+
+class PgVectorIndex:
+    def __init__(self, engine):
+        if engine.dialect.name != "postgresql":
+            raise RuntimeError("VECTOR_BACKEND=pgvector requires a PostgreSQL DATABASE_URL")
+        self.engine = engine
+        self.dim: Optional[int] = None
+        self._lock = threading.Lock()
+        self._load_dim()
+
+    def _conn(self):
+        return self.engine.raw_connection()
+
+    def _load_dim(self) -> None:
+        conn = self._conn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT a.atttypmod FROM pg_attribute a JOIN pg_class c ON c.oid = a.attrelid "
+                    "WHERE c.relname = %s AND a.attname = 'embedding' AND NOT a.attisdropped",
+                    (TABLE,),
+                )
+                row = cur.fetchone()
+            conn.commit()
+        finally:
+            conn.close()
+        self.dim = int(row[0]) if row and row[0] and row[0] > 0 else None
+
+    def _ensure_table(self, dim: int) -> None:
+        with self._lock:
+            if self.dim is not None:
+                if dim != self.dim:
+                    raise ValueError(f"embedding dimension {dim} does not match {TABLE}.embedding ({self.dim})")
+                return
+            if PGVECTOR_INDEX == "hnsw":
+                index = (
+                    f"CREATE INDEX IF NOT EXISTS idx_chunks_vector_embedding ON {TABLE} "
+                    f"USING hnsw (embedding vector_l2_ops) WITH (m = {PGVECTOR_HNSW_M}, ef_construction = {PGVECTOR_HNSW_EF_CONSTRUCTION})"
+                )
+            elif PGVECTOR_INDEX == "ivfflat":
+                index = (
+                    f"CREATE INDEX IF NOT EXISTS idx_chunks_vector_embedding ON {TABLE} "
+                    f"USING ivfflat (embedding vector_l2_ops) WITH (lists = {PGVECTOR_IVF_LISTS})"
+                )
+            else:
+                index = None
+            conn = self._conn()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+                    cur.execute(
+                        f"CREATE TABLE IF NOT EXISTS {TABLE} ("
+                        " id TEXT PRIMARY KEY,"
+                        " version_id VARCHAR(36) REFERENCES document_versions(id) ON DELETE CASCADE,"
+                        " kb_id VARCHAR(36) REFERENCES knowledge_bases(id) ON DELETE CASCADE,"
+                        " text TEXT NOT NULL,"
+                        f" embedding vector({int(dim)}) NOT NULL,"
+                        " meta JSONB NOT NULL DEFAULT '{}'::jsonb,"
+                        " created_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+                    )
+                    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_chunks_vector_kb ON {TABLE}(kb_id)")
+                    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_chunks_vector_version ON {TABLE}(version_id)")
+                    if index:
+                        cur.execute(index)
+                conn.commit()
+            finally:
+                conn.close()
+            self._load_dim()
+
+    def add(self, ids: Sequence[str], documents: Sequence[str], embeddings, metadatas: Sequence[Dict[str, Any]]) -> None:
+        if not ids:
+            return
+        self._ensure_table(len(embeddings[0]))
+        buf = copy_payload(ids, documents, embeddings, metadatas)
+        conn = self._conn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"CREATE TEMP TABLE chunks_vector_load (LIKE {TABLE} INCLUDING DEFAULTS) ON COMMIT DROP"
+                )
+                cur.copy_expert(
+                    "COPY chunks_vector_load (id, version_id, kb_id, text, embedding, meta) FROM STDIN "
+                    "WITH (FORMAT csv, FORCE_NULL (version_id, kb_id))",
+                    buf,
+                )
+                cur.execute(
+                    f"INSERT INTO {TABLE} (id, version_id, kb_id, text, embedding, meta) "
+                    "SELECT id, version_id, kb_id, text, embedding, meta FROM chunks_vector_load "
+                    "ON CONFLICT (id) DO UPDATE SET version_id = EXCLUDED.version_id, kb_id = EXCLUDED.kb_id, "
+                    "text = EXCLUDED.text, embedding = EXCLUDED.embedding, meta = EXCLUDED.meta"
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _select(self, sql: str, params: List[Any], *, ef_search: Optional[int] = None) -> List[tuple]:
+        conn = self._conn()
+        try:
+            with conn.cursor() as cur:
+                if ef_search is not None:
+                    # filtered HNSW scans stop after ef_search candidates; keep it >= k
+                    if PGVECTOR_INDEX == "hnsw":
+                        cur.execute("SET LOCAL hnsw.ef_search = %s", (ef_search,))
+                    elif PGVECTOR_INDEX == "ivfflat":
+                        cur.execute("SET LOCAL ivfflat.probes = %s", (PGVECTOR_IVF_PROBES,))
+                cur.execute(sql, params)
+                rows = cur.fetchall()
+            conn.commit()
+            return rows
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _from(join: bool) -> str:
+        return f"{TABLE} cv" + (" LEFT JOIN document_versions dv ON dv.id = cv.version_id" if join else "")
+
+    def get(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict[str, Any]] = None, include: Optional[List[str]] = None) -> Dict[str, Any]:
+        include = include or ["documents", "metadatas"]
+        out: Dict[str, List[Any]] = {"ids": [], "embeddings": [], "documents": [], "metadatas": []}
+        if self.dim is None:
+            return {k: v for k, v in out.items() if k == "ids" or k in include}
+        cond, params, join = where_sql(where)
+        if ids is not None:
+            cond = f"({cond}) AND cv.id = ANY(%s)"
+            params = params + [list(ids)]
+        # id-only scans (vacuum, delete by metadata) skip shipping the vectors
+        emb_col = "cv.embedding::text" if "embeddings" in include else "NULL"
+        rows = self._select(f"SELECT cv.id, {emb_col}, cv.text, cv.meta FROM {self._from(join)} WHERE {cond}", params)
+        for vid, emb, text, meta in rows:
+            out["ids"].append(vid)
+            out["embeddings"].append(json.loads(emb) if emb is not None else None)
+            out["documents"].append(text)
+            out["metadatas"].append(meta or {})
+        return {k: v for k, v in out.items() if k == "ids" or k in include}
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[Dict[str, Any]] = None, **_: Any) -> Dict[str, Any]:
+        results: Dict[str, List[List[Any]]] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        cond, params, join = where_sql(where)
+        for q in query_embeddings:
+            rows = []
+            if self.dim is not None:
+                lit = _vec_literal(q)
+                rows = self._select(
+                    f"SELECT cv.id, cv.text, cv.meta, cv.embedding <-> %s::vector AS dist FROM {self._from(join)} "
+                    f"WHERE {cond} ORDER BY cv.embedding <-> %s::vector LIMIT %s",
+                    [lit, *params, lit, int(n_results)],
+                    ef_search=max(PGVECTOR_EF_SEARCH, int(n_results)),
+                )
+            results["ids"].append([r[0] for r in rows])
+            results["documents"].append([r[1] for r in rows])
+            results["metadatas"].append([r[2] or {} for r in rows])
+            results["distances"].append([float(r[3]) ** 2 for r in rows])
+        return results
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict[str, Any]] = None) -> int:
+        if self.dim is None or (ids is None and where is None):
+            return 0
+        cond, params, join = where_sql(where)
+        if ids is not None:
+            cond = f"({cond}) AND cv.id = ANY(%s)"
+            params = params + [list(ids)]
+        using = " USING document_versions dv" if join else ""
+        if join:
+            cond = f"(dv.id = cv.version_id) AND {cond}"
+        conn = self._conn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f"DELETE FROM {TABLE} cv{using} WHERE {cond}", params)
+                removed = cur.rowcount
+            conn.commit()
+            return removed
+        finally:
+            conn.close()
+
+    def drop_kb(self, kb_id: str) -> None:
+        self.delete(where={"kb_id": kb_id})
+
+    def count(self) -> int:
+        if self.dim is None:
+            return 0
+        return int(self._select(f"SELECT count(*) FROM {TABLE}", [])[0][0])
@@ -0,0 +1,154 @@
+"""Compressed codes for the numpy vector index (`NUMPY_QUANTIZATION`).
+
+- `int8`: scalar quantization, one byte per dimension (4x smaller than float32).
+  Each segment gets a per-dimension offset/step fitted to its min/max.
+- `pq`: product quantization. The vector is split into `NUMPY_PQ_M`
+  subspaces, and each is coded as the nearest of up to 256 k-means centroids
+  (`m` bytes per vector).
+
+Both return approximate squared L2 distances: int8 via the dequantized
+vector, PQ via per-query lookup tables (ADC). The index only uses them to
+shortlist candidates; final distances come from the full-precision rows.
+"""
+
+from __future__ import annotations
+
+from typing import BinaryIO, List, Optional
+
+import numpy as np
+
+MODES = ("none", "int8", "pq")
+
+# Rows encoded/scanned per block, bounding the float32 temporaries.
+_BLOCK = 16384
+
+
+def _blocks(n: int):
+    for s in range(0, n, _BLOCK):
+        yield s, min(s + _BLOCK, n)
+
+
+class ScalarQuantizer:
+    kind = "int8"
+    suffix = ".sq8"
+
+    def __init__(self, offset: np.ndarray, step: np.ndarray):
+        self.offset = offset.astype(np.float32)
+        self.step = step.astype(np.float32)
+
+    @classmethod
+    def fit(cls, matrix: np.ndarray, **_) -> "ScalarQuantizer":
+        lo = matrix.min(axis=0)
+        hi = matrix.max(axis=0)
+        step = (hi - lo) / 255.0
+        step[step == 0] = 1.0
+        return cls(lo, step)
+
+    def code_width(self, dim: int) -> int:
+        return dim
+
+    def encode(self, matrix: np.ndarray) -> np.ndarray:
+        codes = np.empty(matrix.shape, dtype=np.uint8)
+        for s, e in _blocks(len(matrix)):
+            q = np.rint((np.asarray(matrix[s:e], dtype=np.float32) - self.offset) / self.step)
+            codes[s:e] = np.clip(q, 0, 255)
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return self.offset + codes.astype(np.float32) * self.step
+
+    def sq_norms(self, codes: np.ndarray) -> np.ndarray:
+        out = np.empty(len(codes), dtype=np.float32)
+        for s, e in _blocks(len(codes)):
+            x = self.decode(codes[s:e])
+            out[s:e] = np.einsum("ij,ij->i", x, x)
+        return out
+
+    def distances(self, q: np.ndarray, codes: np.ndarray, sq_norms: np.ndarray) -> np.ndarray:
+        # ||q - (offset + step*c)||^2 = ||q||^2 - 2(q.offset + (q*step).c) + ||x_hat||^2
+        qs = q * self.step
+        dot = np.empty(len(codes), dtype=np.float32)
+        for s, e in _blocks(len(codes)):
+            dot[s:e] = codes[s:e].astype(np.float32) @ qs
+        return sq_norms - 2.0 * (dot + float(q @ self.offset)) + float(q @ q)
+
+    def save(self, fh: BinaryIO, sq_norms: np.ndarray) -> None:
+        np.savez(fh, offset=self.offset, step=self.step, sq_norms=sq_norms)
+
+    @classmethod
+    def load(cls, data) -> "ScalarQuantizer":
+        return cls(data["offset"], data["step"])
+
+
+class ProductQuantizer:
+    kind = "pq"
+    suffix = ".pq"
+
+    def __init__(self, codebooks: List[np.ndarray], bounds: np.ndarray):
+        self.codebooks = [c.astype(np.float32) for c in codebooks]
+        # subspace j covers dimensions bounds[j]:bounds[j+1]; widths may differ by one
+        self.bounds = bounds
+
+    @classmethod
+    def fit(cls, matrix: np.ndarray, m: int = 32, iters: int = 10, sample: int = 16384, seed: int = 0) -> "ProductQuantizer":
+        n, dim = matrix.shape
+        m = max(1, min(m, dim))
+        bounds = np.array([0] + [len(a) for a in np.array_split(np.arange(dim), m)]).cumsum()
+        rng = np.random.default_rng(seed)
+        train_rows = np.sort(rng.choice(n, size=min(n, sample), replace=False))
+        train = np.asarray(matrix[train_rows], dtype=np.float32)
+        ksub = min(256, len(train))
+        codebooks = []
+        for j in range(m):
+            sub = train[:, bounds[j] : bounds[j + 1]]
+            cents = sub[rng.choice(len(sub), size=ksub, replace=False)].copy()
+            for _ in range(iters):
+                assign = _nearest(sub, cents)
+                sums = np.zeros_like(cents)
+                np.add.at(sums, assign, sub)
+                counts = np.bincount(assign, minlength=ksub)
+                filled = counts > 0
+                cents[filled] = sums[filled] / counts[filled, None]
+            codebooks.append(cents)
+        return cls(codebooks, bounds)
+
+    def code_width(self, dim: int) -> int:
+        return len(self.codebooks)
+
+    def encode(self, matrix: np.ndarray) -> np.ndarray:
+        codes = np.empty((len(matrix), len(self.codebooks)), dtype=np.uint8)
+        for s, e in _blocks(len(matrix)):
+            x = np.asarray(matrix[s:e], dtype=np.float32)
+            for j, cents in enumerate(self.codebooks):
+                codes[s:e, j] = _nearest(x[:, self.bounds[j] : self.bounds[j + 1]], cents)
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return np.concatenate([cents[codes[:, j]] for j, cents in enumerate(self.codebooks)], axis=1)
+
+    def sq_norms(self, codes: np.ndarray) -> Optional[np.ndarray]:
+        return None
+
+    def distances(self, q: np.ndarray, codes: np.ndarray, sq_norms: Optional[np.ndarray] = None) -> np.ndarray:
+        out = np.zeros(len(codes), dtype=np.float32)
+        for j, cents in enumerate(self.codebooks):
+            diff = cents - q[self.bounds[j] : self.bounds[j + 1]]
+            table = np.einsum("ij,ij->i", diff, diff)
+            out += table[codes[:, j]]
+        return out
+
+    def save(self, fh: BinaryIO, sq_norms: Optional[np.ndarray] = None) -> None:
+        np.savez(fh, bounds=self.bounds, **{f"c{j}": c for j, c in enumerate(self.codebooks)})
+
+    @classmethod
+    def load(cls, data) -> "ProductQuantizer":
+        bounds = data["bounds"]
+        return cls([data[f"c{j}"] for j in range(len(bounds) - 1)], bounds)
+
+
+def _nearest(x: np.ndarray, cents: np.ndarray) -> np.ndarray:
+    d = (x * x).sum(axis=1)[:, None] - 2.0 * (x @ cents.T) + (cents * cents).sum(axis=1)[None, :]
+    return d.argmin(axis=1)
+
+
+QUANTIZERS = {"int8": ScalarQuantizer, "pq": ProductQuantizer}
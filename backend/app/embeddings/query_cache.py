@@ -0,0 +1,106 @@
+"""Bounded in-memory LRU of query embeddings.
+
+Keyed by `(embedder identity, normalized query)` with a TTL. Repeated questions
+and the agent's per-document fan-out pay for one encode; concurrent misses on
+the same key wait for a single in-flight computation instead of encoding twice.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+QUERY_CACHE_SIZE = max(0, int(os.environ.get("QUERY_CACHE_SIZE", "1024")))
+QUERY_CACHE_TTL_S = float(os.environ.get("QUERY_CACHE_TTL_S", "600"))
+
+_WS = re.compile(r"\s+")
+
+Key = Tuple[str, str]
+
+
+def normalize_query(query: str) -> str:
+    return _WS.sub(" ", unicodedata.normalize("NFC", query or "")).strip()
+
+
+class QueryEmbeddingCache:
+    def __init__(self, max_entries: int, ttl_s: float):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._data: "OrderedDict[Key, Tuple[float, List[float]]]" = OrderedDict()
+        self._inflight: Dict[Key, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def get_or_compute(self, model: str, query: str, compute: Callable[[str], List[float]]) -> List[float]:
+        key = (model, normalize_query(query))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                stored_at, vec = entry
+                if self.ttl_s <= 0 or now - stored_at < self.ttl_s:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return vec
+                del self._data[key]
+                self.expired += 1
+            waiter = self._inflight.get(key)
+            if waiter is None:
+                self.misses += 1
+                owner = Future()
+                self._inflight[key] = owner
+        if waiter is not None:
+            with self._lock:
+                self.hits += 1
+            return waiter.result()
+
+        try:
+            vec = compute(query)
+        except BaseException as exc:
+            with self._lock:
+                self._inflight.pop(key, None)
+            owner.set_exception(exc)
+            raise
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._data[key] = (time.monotonic(), vec)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        owner.set_result(vec)
+        return vec
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "expired": self.expired,
+                "evictions": self.evictions,
+            }
+
+
+_cache: Optional[QueryEmbeddingCache] = QueryEmbeddingCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL_S) if QUERY_CACHE_SIZE else None
+
+
+def get_cache() -> Optional[QueryEmbeddingCache]:
+    return _cache
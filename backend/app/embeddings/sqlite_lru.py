@@ -0,0 +1,106 @@
+"""Byte-budgeted LRU cache table in SQLite, shared by the persistent caches.
+
+A subclass names its `table`, the `key_columns` of its primary key and the
+`size_sql` expression for a row's size in bytes, and creates the table in
+`_create` (it must have a `last_access REAL` column). The base class opens the
+database (WAL, one connection guarded by a lock), tracks the total size and
+evicts the least recently used rows down to 90% of `max_bytes` whenever a
+write pushes the total over it.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Iterable, Sequence, Tuple
+
+# SQLite limits bound parameters per statement; stay well below it.
+BATCH = 500
+
+
+class SqliteLRU(ABC):
+    table: str
+    key_columns: Tuple[str, ...]
+    size_sql: str
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._create()
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{self.table}_last_access ON {self.table}(last_access)")
+        row = self._conn.execute(f"SELECT COALESCE(SUM({self.size_sql}), 0) FROM {self.table}").fetchone()
+        self._bytes = int(row[0] or 0)
+        self._key_where = " AND ".join(f"{c} = ?" for c in self.key_columns)
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    @abstractmethod
+    def _create(self) -> None:
+        """Create `table` if missing."""
+
+    # The helpers below expect the caller to hold self._lock.
+
+    def _upsert(self, key: Sequence[object], row: Sequence[object], size: int) -> None:
+        """Insert or replace `row` (all columns, key first) stored under `key`, `size` bytes."""
+        prev = self._conn.execute(f"SELECT {self.size_sql} FROM {self.table} WHERE {self._key_where}", tuple(key)).fetchone()
+        marks = ",".join("?" * len(row))
+        self._conn.execute(f"INSERT OR REPLACE INTO {self.table} VALUES ({marks})", tuple(row))
+        self._bytes += size - (prev[0] if prev else 0)
+
+    def _touch(self, keys: Iterable[Sequence[object]], now: float) -> None:
+        self._conn.executemany(
+            f"UPDATE {self.table} SET last_access = ? WHERE {self._key_where}", [(now, *key) for key in keys]
+        )
+
+    def _delete(self, key: Sequence[object], size: int) -> None:
+        self._conn.execute(f"DELETE FROM {self.table} WHERE {self._key_where}", tuple(key))
+        self._bytes -= size
+
+    def _make_room(self) -> None:
+        if self.max_bytes and self._bytes > self.max_bytes:
+            self._evict(target=int(self.max_bytes * 0.9))
+
+    def _evict(self, *, target: int) -> None:
+        keys = ", ".join(self.key_columns)
+        while self._bytes > target:
+            rows = self._conn.execute(
+                f"SELECT {keys}, {self.size_sql} FROM {self.table} ORDER BY last_access ASC LIMIT ?", (BATCH,)
+            ).fetchall()
+            if not rows:
+                self._bytes = 0
+                return
+            victims = []
+            for *key, size in rows:
+                if self._bytes <= target:
+                    break
+                victims.append(tuple(key))
+                self._bytes -= size
+            self._conn.executemany(f"DELETE FROM {self.table} WHERE {self._key_where}", victims)
+            self.evictions += len(victims)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "writes": self.writes,
+                "evictions": self.evictions,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
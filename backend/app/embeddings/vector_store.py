@@ -1,7 +1,10 @@
-import hashlib
 import os
-import struct
-from typing import Dict, List, Optional
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.embeddings import batching, embedding_cache, query_cache
 
 # Disable Chroma telemetry by default (avoids noisy PostHog version mismatches in dev).
 os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
@@ -12,9 +15,22 @@ except Exception:  # pragma: no cover
     chromadb = None
 
 CHROMA_DIR = os.environ.get("CHROMA_DIR", "./chroma_db")
+# "chroma" (default), "numpy" (exact in-process index, see numpy_index.py)
+# or "pgvector" (chunks_vector table in DATABASE_URL, see pgvector_store.py)
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "chroma").strip().lower()
+# Chroma only: "kb" gives every KB its own collection (see chroma_shards.py); "none" keeps one collection.
+VECTOR_SHARDING = os.environ.get("VECTOR_SHARDING", "none").strip().lower()
 EMBED_MODEL_NAME = os.environ.get("EMBED_MODEL", "all-MiniLM-L6-v2")
 EMBED_PROVIDER = os.environ.get("EMBED_PROVIDER", "auto").strip().lower()
 FALLBACK_EMBED_DIM = int(os.environ.get("EMBED_DIM", "384"))
+# Docs per encode/write batch when indexing; keep below the store's max batch size.
+INDEX_BATCH_SIZE = int(os.environ.get("INDEX_BATCH_SIZE", "256"))
+# Candidates fetched per requested result when a per-document quota trims the hit list.
+QUOTA_OVERFETCH = max(1, int(os.environ.get("QUOTA_OVERFETCH", "3")))
+# Candidates per requested result when KB-wide searches prune hits from superseded document versions.
+VERSION_OVERFETCH = max(1, int(os.environ.get("VERSION_OVERFETCH", "2")))
+# Re-query with twice the candidates at most this many times when pruning left too few hits.
+VERSION_MAX_REFETCH = int(os.environ.get("VERSION_MAX_REFETCH", "2"))
 
 _client = None
 _collection = None
@@ -22,46 +38,81 @@ _embedder = None
 _embedder_kind = None
 
 
-class _HashEmbedder:
-    def __init__(self, dim: int):
-        self.dim = dim
-
-    def encode(self, texts: List[str], show_progress_bar: bool = False):  # noqa: ARG002
-        return [_hash_embed(t, dim=self.dim) for t in texts]
-
-
-def _hash_embed(text: str, dim: int) -> List[float]:
-    if dim <= 0:
-        raise ValueError("EMBED_DIM must be > 0")
-    seed = hashlib.sha256(text.encode("utf-8")).digest()
-    out: List[float] = []
-    counter = 0
-    while len(out) < dim:
-        block = hashlib.sha256(seed + counter.to_bytes(4, "little")).digest()
-        counter += 1
-        for i in range(0, len(block), 4):
-            if len(out) >= dim:
-                break
-            (val,) = struct.unpack("<i", block[i : i + 4])
-            out.append(val / 2147483648.0)
-    return out
-
-
 def _get_collection():
     global _client, _collection
     if _collection is not None:
         return _collection
+    if VECTOR_BACKEND == "numpy":
+        from app.embeddings.numpy_index import NUMPY_INDEX_DIR, NumpyIndex
+
+        _collection = NumpyIndex(NUMPY_INDEX_DIR)
+        return _collection
+    if VECTOR_BACKEND == "pgvector":
+        from app.db.session import get_engine
+        from app.embeddings.pgvector_store import PgVectorIndex
+
+        _collection = PgVectorIndex(get_engine())
+        return _collection
     if chromadb is None:
         raise RuntimeError("chromadb is not available (install backend requirements)")
     _client = chromadb.PersistentClient(path=CHROMA_DIR)
-    _collection = _client.get_or_create_collection("documents")
+    if VECTOR_SHARDING == "kb":
+        from app.embeddings.chroma_shards import ShardedChromaCollection
+
+        _collection = ShardedChromaCollection(_client)
+    else:
+        _collection = _client.get_or_create_collection("documents")
     return _collection
 
 
+def drop_kb(kb_id: str) -> None:
+    """Remove every vector of a KB (drops its collection/shard when the backend has one per KB)."""
+    collection = _get_collection()
+    if hasattr(collection, "drop_kb"):
+        collection.drop_kb(kb_id)
+    else:
+        collection.delete(where={"kb_id": kb_id})
+
+
+def delete_vectors(
+    *,
+    kb_id: Optional[str] = None,
+    document_id: Optional[str] = None,
+    version_id: Optional[str] = None,
+    batch_size: Optional[int] = None,
+) -> int:
+    """
+    Delete every vector whose metadata matches all given keys; returns how many.
+    Matching ids are looked up first and removed in `INDEX_BATCH_SIZE` batches,
+    keeping each delete under the store's max batch size. `kb_id` also routes
+    the lookup to a single shard where the backend has one per KB.
+    """
+    filters = [{k: v} for k, v in (("kb_id", kb_id), ("document_id", document_id), ("version_id", version_id)) if v]
+    if not filters:
+        raise ValueError("delete_vectors needs kb_id, document_id or version_id")
+    where = filters[0] if len(filters) == 1 else {"$and": filters}
+    collection = _get_collection()
+    ids = collection.get(where=where, include=[]).get("ids") or []
+    return delete_ids(ids, kb_id=kb_id, batch_size=batch_size)
+
+
+def delete_ids(ids: List[str], *, kb_id: Optional[str] = None, batch_size: Optional[int] = None) -> int:
+    """Delete vectors by id in batches (`kb_id` narrows sharded backends to one shard)."""
+    collection = _get_collection()
+    size = max(1, batch_size or INDEX_BATCH_SIZE)
+    where = {"kb_id": kb_id} if kb_id else None
+    for i in range(0, len(ids), size):
+        collection.delete(ids=ids[i : i + size], where=where)
+    return len(ids)
+
+
 def _get_embedder():
     global _embedder, _embedder_kind
     if _embedder is not None:
         return _embedder
+    # numpy-backed; imported lazily so the module stays importable in the slim dev image
+    from app.embeddings.hash_embedder import _HashEmbedder
+
     if EMBED_PROVIDER in {"hash", "fallback"}:
         _embedder = _HashEmbedder(dim=FALLBACK_EMBED_DIM)
         _embedder_kind = "hash-fallback"
@@ -80,38 +131,287 @@ def _get_embedder():
     return _embedder
 
 
+def _embedder_identity() -> str:
+    """Stable key for the active embedder; vectors from different embedders must never mix."""
+    _get_embedder()
+    if _embedder_kind == "sentence-transformers":
+        return f"st:{EMBED_MODEL_NAME}"
+    return f"hash-fallback:{FALLBACK_EMBED_DIM}"
+
+
+def _raw_encode(texts: List[str]) -> List[List[float]]:
+    out = _get_embedder().encode(texts, show_progress_bar=False)
+    return out.tolist() if hasattr(out, "tolist") else [list(v) for v in out]
+
+
+def _encode(texts: List[str], encode_fn: Optional[Callable[[List[str]], List[List[float]]]] = None) -> List[List[float]]:
+    """Encode texts, consulting the persistent embedding cache first."""
+    if not texts:
+        return []
+    encode_fn = encode_fn or _raw_encode
+    cache = embedding_cache.get_cache()
+    if cache is None:
+        return encode_fn(texts)
+
+    model = _embedder_identity()
+    hashes = [embedding_cache.text_hash(t) for t in texts]
+    found = cache.get_many(model, hashes)
+    # encode each distinct missing text once
+    missing: Dict[str, str] = {}
+    for h, t in zip(hashes, texts):
+        if h not in found and h not in missing:
+            missing[h] = t
+    if missing:
+        new = dict(zip(missing.keys(), encode_fn(list(missing.values()))))
+        cache.put_many(model, new.items())
+        found.update(new)
+    return [found[h] for h in hashes]
+
+
+def _encode_query_uncached(query: str) -> List[float]:
+    service = batching.get_service(_raw_encode)
+    return _encode([query], encode_fn=service.encode if service is not None else None)[0]
+
+
+def _encode_query(query: str) -> List[float]:
+    """
+    Query-time encode. Checks the in-memory query LRU, then the persistent
+    embedding cache; misses are coalesced with concurrent callers by the
+    micro-batching service.
+    """
+    cache = query_cache.get_cache()
+    if cache is None:
+        return _encode_query_uncached(query)
+    return cache.get_or_compute(_embedder_identity(), query, _encode_query_uncached)
+
+
+def _batched(items: Iterable[Dict], size: int) -> Iterator[List[Dict]]:
+    it = iter(items)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _prepare_batch(batch: List[Dict]) -> Dict:
+    """Resolve embeddings for one batch: precomputed, copied from an existing vector, or freshly encoded."""
+    embeddings: List[Optional[List[float]]] = [d.get('embedding') for d in batch]
+    copy_from = {i: d['embedding_from'] for i, d in enumerate(batch) if embeddings[i] is None and d.get('embedding_from')}
+    if copy_from:
+        kbs = {(batch[i].get('metadata') or {}).get('kb_id') for i in copy_from}
+        stored = get_embeddings(list(set(copy_from.values())), kb_id=kbs.pop() if len(kbs) == 1 else None)
+        for i, src in copy_from.items():
+            embeddings[i] = stored.get(src)
+    reused = sum(1 for e in embeddings if e is not None)
+    todo = [i for i, e in enumerate(embeddings) if e is None]
+    for i, emb in zip(todo, _encode([batch[i]['text'] for i in todo])):
+        embeddings[i] = emb
+    return {
+        "ids": [d['id'] for d in batch],
+        "documents": [d['text'] for d in batch],
+        "embeddings": embeddings,
+        "metadatas": [d.get('metadata') or {} for d in batch],
+        "reused": reused,
+        "encoded": len(todo),
+    }
+
+
+def _write_batch(collection, payload: Dict) -> float:
+    t0 = time.perf_counter()
+    collection.add(
+        ids=payload["ids"],
+        documents=payload["documents"],
+        embeddings=payload["embeddings"],
+        metadatas=payload["metadatas"],
+    )
+    return time.perf_counter() - t0
+
+
+def add_documents_stream(
+    docs: Iterable[Dict],
+    *,
+    batch_size: Optional[int] = None,
+    on_batch: Optional[Callable[[Dict], None]] = None,
+) -> Dict:
+    """
+    Index docs pulled lazily from `docs` in fixed-size batches.
+    Batch N+1 is encoded while batch N is written to the store on a background
+    thread, so at most two batches are held in memory regardless of document size.
+    `on_batch` receives per-batch stats (sizes, encode/write ms, docs/s).
+    """
+    size = max(1, batch_size or INDEX_BATCH_SIZE)
+    collection = _get_collection()
+    totals = {"docs": 0, "encoded": 0, "reused": 0, "batches": 0}
+    started = time.perf_counter()
+    writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-writer")
+    in_flight: Optional[Tuple[Future, Dict]] = None
+
+    def _finish(fut: Future, info: Dict) -> None:
+        info["write_ms"] = round(fut.result() * 1000, 1)
+        elapsed = info["encode_ms"] + info["write_ms"]
+        info["docs_per_s"] = round(info["size"] / (elapsed / 1000), 1) if elapsed else None
+        if on_batch is not None:
+            on_batch(info)
+
+    try:
+        for idx, batch in enumerate(_batched(docs, size)):
+            t0 = time.perf_counter()
+            payload = _prepare_batch(batch)
+            info = {
+                "batch": idx,
+                "size": len(batch),
+                "encoded": payload["encoded"],
+                "reused": payload["reused"],
+                "encode_ms": round((time.perf_counter() - t0) * 1000, 1),
+            }
+            if in_flight is not None:
+                _finish(*in_flight)
+            in_flight = (writer.submit(_write_batch, collection, payload), info)
+            totals["docs"] += len(batch)
+            totals["encoded"] += payload["encoded"]
+            totals["reused"] += payload["reused"]
+            totals["batches"] += 1
+        if in_flight is not None:
+            _finish(*in_flight)
+    finally:
+        writer.shutdown(wait=True)
+    elapsed = time.perf_counter() - started
+    totals["elapsed_ms"] = round(elapsed * 1000, 1)
+    totals["docs_per_s"] = round(totals["docs"] / elapsed, 1) if elapsed else None
+    return totals
+
+
 def add_documents(docs: List[Dict]):
     """
     docs: list of {id: str, text: str, metadata: dict} — add to chroma.
     metadata is used for filtering (e.g., kb_id, document_id, version_id).
+    Optional per-doc `embedding` (precomputed vector) or `embedding_from`
+    (id of a stored vector to copy) skip the encoder.
     """
     if not docs:
         return []
+    add_documents_stream(docs)
+    return [d['id'] for d in docs]
+
+
+def get_embeddings(ids: List[str], batch_size: int = 500, kb_id: Optional[str] = None) -> Dict[str, List[float]]:
+    """
+    Fetch stored vectors by id; ids missing from the store are simply absent from the result.
+    `kb_id` narrows the lookup to one KB's vectors.
+    """
+    if not ids:
+        return {}
     collection = _get_collection()
-    embedder = _get_embedder()
-    ids = [d['id'] for d in docs]
-    texts = [d['text'] for d in docs]
-    metadata = [d.get('metadata') or {} for d in docs]
-    embeddings = embedder.encode(texts, show_progress_bar=False)
-    if hasattr(embeddings, "tolist"):
-        embeddings = embeddings.tolist()
-    collection.add(ids=ids, documents=texts, embeddings=embeddings, metadatas=metadata)
-    return ids
-
-
-def query_documents(query: str, n_results: int = 5, kb_id: Optional[str] = None, document_id: Optional[str] = None):
-    """Return top matches; optionally filter by kb_id and/or document_id."""
+    where = {"kb_id": kb_id} if kb_id else None
+    out: Dict[str, List[float]] = {}
+    for i in range(0, len(ids), batch_size):
+        got = collection.get(ids=ids[i : i + batch_size], where=where, include=["embeddings"])
+        for vid, emb in zip(got.get("ids") or [], got.get("embeddings") or []):
+            if emb is not None:
+                out[vid] = list(emb)
+    return out
+
+
+def _hit_columns(results: Dict) -> List[str]:
+    # every per-hit column (ids, documents, metadatas, distances, ...) of the first query
+    return [k for k, v in results.items() if isinstance(v, list) and v and isinstance(v[0], list)]
+
+
+def _current_versions(document_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+    from app.db.session import SessionLocal
+    from app.db.versions import current_versions
+
+    with SessionLocal() as db:
+        return current_versions(db, document_ids)
+
+
+def _version_filter(document_ids: List[str]) -> Optional[Dict]:
+    """Where-clause restricting the given documents to their current version (None when all versions are active)."""
+    current = _current_versions(document_ids)
+    if not any(current.values()):
+        return None
+    clauses = [{"version_id": current[d]} if current.get(d) else {"document_id": d} for d in document_ids]
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+def drop_superseded(results: Dict) -> Dict:
+    """Drop hits from non-current versions of their document (hits without a known document are kept)."""
+    keys = _hit_columns(results)
+    metadatas = (results.get("metadatas") or [[]])[0]
+    if not keys or not metadatas:
+        return results
+    current = _current_versions((m or {}).get("document_id") for m in metadatas)
+    keep = [
+        j
+        for j, m in enumerate(metadatas)
+        if not current.get((m or {}).get("document_id")) or (m or {}).get("version_id") == current[m["document_id"]]
+    ]
+    return {**results, **{k: [[results[k][0][j] for j in keep]] for k in keys}}
+
+
+def apply_quota(results: Dict, n_results: int, per_doc_quota: int) -> Dict:
+    """Keep hits in rank order, at most `per_doc_quota` per document, up to `n_results`."""
+    keys = _hit_columns(results)
+    out: Dict = {k: [[]] for k in keys}
+    if not keys or not results[keys[0]]:
+        return {**results, **out}
+    taken: Dict[Optional[str], int] = {}
+    metadatas = (results.get("metadatas") or [[]])[0]
+    for j in range(len(results[keys[0]][0])):
+        meta = metadatas[j] if j < len(metadatas) else None
+        doc = (meta or {}).get("document_id")
+        if taken.get(doc, 0) >= per_doc_quota:
+            continue
+        taken[doc] = taken.get(doc, 0) + 1
+        for k in keys:
+            out[k][0].append(results[k][0][j])
+        if len(out[keys[0]][0]) >= n_results:
+            break
+    return {**results, **out}
+
+
+def query_documents(
+    query: str,
+    n_results: int = 5,
+    kb_id: Optional[str] = None,
+    document_id: Optional[str] = None,
+    *,
+    document_ids: Optional[List[str]] = None,
+    per_doc_quota: Optional[int] = None,
+    include_history: bool = False,
+):
+    """
+    Return top matches; optionally filter by kb_id and/or document_id.
+
+    `document_ids` restricts a single ANN query to several documents
+    (`document_id` in the list). `per_doc_quota` caps hits per document after the
+    search (the store is over-fetched by QUOTA_OVERFETCH to compensate).
+
+    Only each document's current version is searched unless `include_history`.
+    Document-scoped queries filter on `version_id`. KB-wide ones over-fetch by
+    VERSION_OVERFETCH and prune hits from superseded versions.
+    """
     collection = _get_collection()
-    embedder = _get_embedder()
-    embeddings = embedder.encode([query], show_progress_bar=False)
-    if hasattr(embeddings, "tolist"):
-        embeddings = embeddings.tolist()
-    emb = embeddings[0]
+    emb = _encode_query(query)
     filters = []
     if kb_id:
         filters.append({"kb_id": kb_id})
     if document_id:
         filters.append({"document_id": document_id})
+    if document_ids:
+        ids = list(dict.fromkeys(document_ids))
+        # `$or` of equalities == `document_id $in ids`; `$in` is not available on the pinned Chroma
+        filters.append({"document_id": ids[0]} if len(ids) == 1 else {"$or": [{"document_id": i} for i in ids]})
+    scoped = list(dict.fromkeys(([document_id] if document_id else []) + list(document_ids or [])))
+    prune = False
+    if not include_history:
+        if scoped:
+            version_filter = _version_filter(scoped)
+            if version_filter:
+                filters.append(version_filter)
+        else:
+            prune = True
     # Chroma (new API) expects a single logical operator; use $and when multiple filters
     where = None
     if len(filters) == 1:
@@ -119,8 +419,22 @@ def query_documents(query: str, n_results: int = 5, kb_id: Optional[str] = None,
     elif len(filters) > 1:
         where = {"$and": filters}
 
-    results = collection.query(query_embeddings=[emb], n_results=n_results, where=where)
+    need = n_results * QUOTA_OVERFETCH if per_doc_quota else n_results
+    fetch = need * VERSION_OVERFETCH if prune else need
+    for _ in range(VERSION_MAX_REFETCH + 1):
+        results = collection.query(query_embeddings=[emb], n_results=fetch, where=where)
+        if not prune:
+            break
+        returned = len((results.get("ids") or [[]])[0])
+        results = drop_superseded(results)
+        if len((results.get("ids") or [[]])[0]) >= need or returned < fetch:
+            break
+        fetch *= 2
     # results is a dict with ids/documents/scores/metadatas
+    if per_doc_quota:
+        results = apply_quota(results, n_results, per_doc_quota)
+    elif prune:
+        results = {**results, **{k: [results[k][0][:n_results]] for k in _hit_columns(results)}}
     return results
 
 
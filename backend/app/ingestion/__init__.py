@@ -0,0 +1,4 @@
+from .pipeline import run_ingestion_item, recover_interrupted_jobs
+from .worker import IngestionQueueFull, submit
+
+__all__ = ["run_ingestion_item", "recover_interrupted_jobs", "IngestionQueueFull", "submit"]
@@ -0,0 +1,354 @@
+"""Staged ingestion pipeline: parse → chunk → embed → profile.
+
+Each stage runs on an ingestion worker (never on the API event loop) and
+records its status/timing on the `IngestionItem` row so clients can poll
+progress via `GET /ingestion/jobs/{job_id}`.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from app.agent.profiling import SNIPPET_CHARS, generate_document_profile
+from app.db import catalog, models
+from app.db.bulk import bulk_insert_chunks
+from app.db.session import get_session
+from app.db.versions import ingested_version, set_current_version
+from app.embeddings import vector_store
+from app.parsers.chunker import chunk_text
+
+# Diff-aware ingest: reuse stored vectors for chunks whose text is unchanged since the previous version.
+INGEST_INCREMENTAL = os.environ.get("INGEST_INCREMENTAL", "true").strip().lower() not in {"0", "false", "no"}
+# Chunk ends snap to the next line break within this many chars so boundaries survive local edits.
+# Applies to new documents; later versions keep the window their previous version was chunked with.
+CHUNK_SNAP_WINDOW = int(os.environ.get("CHUNK_SNAP_WINDOW", "200"))
+# Delete superseded versions' vectors once a new version is indexed (their chunk rows stay).
+# Keeps the index at one version per document, but `include_history` searches then only find them lexically.
+EVICT_SUPERSEDED_VECTORS = os.environ.get("EVICT_SUPERSEDED_VECTORS", "false").strip().lower() in {"1", "true", "yes"}
+
+
+@dataclass
+class IngestionContext:
+    db: Session
+    job: models.IngestionJob
+    item: models.IngestionItem
+    doc: models.Document
+    file_name: str
+    file_path: str
+    content_hash: Optional[str] = None
+    incremental: bool = INGEST_INCREMENTAL
+    # full parsed text until the chunk stage; only the profile snippet is kept after it
+    text: str = ""
+    version: Optional[models.DocumentVersion] = None
+    previous_version: Optional[models.DocumentVersion] = None
+    chunk_count: int = 0
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _update_detail(ctx: IngestionContext, **changes: Any) -> None:
+    # JSON columns are not mutation-tracked; always assign a fresh dict.
+    detail = dict(ctx.item.detail or {})
+    detail.update(changes)
+    ctx.item.detail = detail
+    ctx.db.add(ctx.item)
+    ctx.db.commit()
+
+
+def _stage_parse(ctx: IngestionContext) -> Dict[str, Any]:
+    from app.parsers.pdf_parser import parse_path
+
+    ctx.text = parse_path(ctx.file_name, ctx.file_path)
+    return {"chars": len(ctx.text)}
+
+
+def _snap_window(base: Optional[models.DocumentVersion]) -> int:
+    """Chunk a new document with CHUNK_SNAP_WINDOW and a new version like its diff base.
+
+    Matching the base keeps boundaries (and so reusable vectors) stable when the
+    setting changes; versions from before it was recorded used fixed windows.
+    """
+    if base is None:
+        return CHUNK_SNAP_WINDOW
+    return int((base.meta or {}).get("snap_window", 0))
+
+
+def _stage_chunk(ctx: IngestionContext) -> Dict[str, Any]:
+    db = ctx.db
+    last_number = (
+        db.query(models.DocumentVersion.version_number)
+        .filter(models.DocumentVersion.document_id == ctx.doc.id)
+        .order_by(models.DocumentVersion.version_number.desc())
+        .limit(1)
+        .scalar()
+    )
+    # diff against what is being served, never a version whose ingestion failed halfway
+    ctx.previous_version = ingested_version(db, ctx.doc)
+    snap_window = _snap_window(ctx.previous_version)
+
+    version = models.DocumentVersion(
+        document_id=ctx.doc.id,
+        version_number=(last_number or 0) + 1,
+        file_name=ctx.file_name,
+        file_path=ctx.file_path,
+        content_hash=ctx.content_hash,
+        meta={"snap_window": snap_window},
+    )
+    db.add(version)
+    db.commit()
+    db.refresh(version)
+    ctx.version = version
+    if ctx.doc.current_version_id is None:
+        # the catalog lists a document without a current version under its newest version, now this one
+        catalog.invalidate(ctx.doc.kb_id)
+
+    rows = [
+        {
+            "id": models.gen_uuid(),
+            "version_id": version.id,
+            "text": c["text"],
+            "start_pos": c["start_pos"],
+            "end_pos": c["end_pos"],
+            "content_hash": hashlib.sha256(c["text"].encode("utf-8")).hexdigest(),
+            "meta": None,
+        }
+        for c in chunk_text(ctx.text, snap_window=snap_window)
+    ]
+    bulk_insert_chunks(db, rows)
+    ctx.chunk_count = len(rows)
+    # the embed stage reads chunks back from the DB page by page; drop the in-memory copies
+    ctx.text = ctx.text[:SNIPPET_CHARS]
+    _update_detail(ctx, version_id=version.id, chunks_created=len(rows))
+    return {"version_id": version.id, "chunks": len(rows), "snap_window": snap_window}
+
+
+def _reusable_vectors(ctx: IngestionContext) -> Dict[str, str]:
+    """content_hash -> id of an identical chunk in the previous version (its stored vector gets copied)."""
+    if not ctx.incremental or ctx.previous_version is None:
+        return {}
+    wanted = ctx.db.query(models.Chunk.content_hash).filter(models.Chunk.version_id == ctx.version.id)
+    prev = (
+        ctx.db.query(models.Chunk.id, models.Chunk.content_hash)
+        .filter(models.Chunk.version_id == ctx.previous_version.id)
+        .filter(models.Chunk.content_hash.in_(wanted.scalar_subquery()))
+        .all()
+    )
+    by_hash: Dict[str, str] = {}
+    for chunk_id, h in prev:
+        by_hash.setdefault(h, chunk_id)
+    return by_hash
+
+
+def _chunk_pages(ctx: IngestionContext, page_size: int) -> Iterator[List[Any]]:
+    """The new version's chunk rows in `page_size` pages (keyset on start_pos, id).
+
+    Each page is its own short query, so no cursor stays open while the embed
+    stage commits its progress on the same session.
+    """
+    C = models.Chunk
+    cols = (C.id, C.text, C.start_pos, C.end_pos, C.content_hash)
+    last: Optional[Tuple[int, str]] = None
+    while True:
+        q = ctx.db.query(*cols).filter(C.version_id == ctx.version.id)
+        if last is not None:
+            q = q.filter(or_(C.start_pos > last[0], and_(C.start_pos == last[0], C.id > last[1])))
+        page = q.order_by(C.start_pos, C.id).limit(page_size).all()
+        if not page:
+            return
+        yield page
+        last = (page[-1].start_pos, page[-1].id)
+
+
+def _stage_embed(ctx: IngestionContext) -> Dict[str, Any]:
+    reuse = _reusable_vectors(ctx)
+
+    def _docs():
+        for page in _chunk_pages(ctx, vector_store.INDEX_BATCH_SIZE):
+            for ch in page:
+                yield {
+                    "id": ch.id,
+                    "text": ch.text,
+                    "embedding_from": reuse.get(ch.content_hash),
+                    "metadata": {
+                        "kb_id": ctx.doc.kb_id,
+                        "document_id": ctx.doc.id,
+                        "version_id": ctx.version.id,
+                        "start_pos": ch.start_pos,
+                        "end_pos": ch.end_pos,
+                    },
+                }
+
+    indexed = 0
+
+    def _progress(info: Dict[str, Any]) -> None:
+        nonlocal indexed
+        indexed += info["size"]
+        _update_detail(ctx, embed_progress={"indexed": indexed, "total": ctx.chunk_count, "last_batch": info})
+
+    try:
+        totals = vector_store.add_documents_stream(_docs(), on_batch=_progress)
+    except Exception as exc:
+        # embeddings are optional in dev; record and continue (lexical search still serves the new chunks)
+        _activate_version(ctx, evict=False)
+        return {"skipped": True, "error": str(exc)}
+    return {
+        "embedded": totals["encoded"],
+        "reused": totals["reused"],
+        "batches": totals["batches"],
+        "docs_per_s": totals["docs_per_s"],
+        **_activate_version(ctx, evict=EVICT_SUPERSEDED_VECTORS),
+    }
+
+
+def _activate_version(ctx: IngestionContext, *, evict: bool) -> Dict[str, Any]:
+    """Switch searches to the new version now that it is indexed; optionally evict older vectors."""
+    superseded = set_current_version(ctx.db, ctx.doc.id, ctx.version.id)
+    ctx.db.commit()
+    # the catalog follows current_version_id; don't leave routing on the old version until profiling finishes
+    catalog.invalidate(ctx.doc.kb_id)
+    if not evict or not superseded:
+        return {}
+    evicted = 0
+    try:
+        for version_id in superseded:
+            evicted += vector_store.delete_vectors(version_id=version_id, kb_id=ctx.doc.kb_id)
+    except Exception as exc:
+        return {"evicted": evicted, "evict_error": str(exc)}
+    return {"evicted": evicted}
+
+
+def _stage_profile(ctx: IngestionContext) -> Dict[str, Any]:
+    try:
+        prof = generate_document_profile(title=ctx.doc.title or "", file_name=ctx.file_name, text=ctx.text)
+        ctx.db.add(
+            models.DocumentProfile(
+                document_id=ctx.doc.id,
+                version_id=ctx.version.id,
+                title=ctx.doc.title,
+                file_name=ctx.file_name,
+                doc_type=prof.doc_type,
+                year_start=prof.year_start,
+                year_end=prof.year_end,
+                summary=prof.summary,
+                tags=prof.tags,
+                meta=prof.meta,
+            )
+        )
+        ctx.db.commit()
+        catalog.invalidate(ctx.doc.kb_id)
+    except Exception as exc:
+        # profiling is best-effort in dev
+        ctx.db.rollback()
+        return {"skipped": True, "error": str(exc)}
+    return {"doc_type": prof.doc_type}
+
+
+# (stage name, item status while running, handler)
+STAGES: List[Tuple[str, str, Callable[[IngestionContext], Dict[str, Any]]]] = [
+    ("parse", "parsing", _stage_parse),
+    ("chunk", "chunking", _stage_chunk),
+    ("embed", "embedding", _stage_embed),
+    ("profile", "profiling", _stage_profile),
+]
+
+
+def run_ingestion_item(item_id: str, *, file_name: str, file_path: str) -> None:
+    """Run every stage for one uploaded file. Executed on an ingestion worker thread."""
+    db = get_session()
+    try:
+        item = db.get(models.IngestionItem, item_id)
+        if item is None:
+            return
+        job = item.job
+        doc = db.get(models.Document, item.document_id)
+        if doc is None:
+            item.status = "failed"
+            item.detail = {**(item.detail or {}), "error": "document not found"}
+            job.status = "failed"
+            job.finished_at = _now()
+            db.commit()
+            return
+
+        job.status = "running"
+        job.started_at = _now()
+        db.commit()
+
+        ctx = IngestionContext(
+            db=db,
+            job=job,
+            item=item,
+            doc=doc,
+            file_name=file_name,
+            file_path=file_path,
+            content_hash=(item.detail or {}).get("sha256"),
+            incremental=(item.detail or {}).get("incremental", INGEST_INCREMENTAL),
+        )
+        stages: Dict[str, Any] = {}
+        for name, status, handler in STAGES:
+            ctx.item.status = status
+            _update_detail(ctx, stage=name)
+            t0 = time.perf_counter()
+            out = handler(ctx)
+            stages[name] = {"ms": round((time.perf_counter() - t0) * 1000, 1), **(out or {})}
+            _update_detail(ctx, stages=dict(stages))
+
+        item.status = "completed"
+        _update_detail(ctx, stage=None)
+        job.status = "completed"
+        job.finished_at = _now()
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        item = db.get(models.IngestionItem, item_id)
+        if item is not None:
+            item.status = "failed"
+            item.detail = {**(item.detail or {}), "error": str(exc)}
+            if item.job is not None:
+                item.job.status = "failed"
+                item.job.finished_at = _now()
+            db.commit()
+    finally:
+        db.close()
+
+
+def recover_interrupted_jobs() -> List[Tuple[str, str, str]]:
+    """
+    Reconcile jobs left behind by a previous process.
+    Items that never started still have their blob on disk and are returned as
+    `(item_id, file_name, file_path)` for re-queueing; items interrupted mid-stage
+    may have written partial rows, so they are marked failed instead.
+    """
+    db = get_session()
+    resumable: List[Tuple[str, str, str]] = []
+    try:
+        jobs = (
+            db.query(models.IngestionJob)
+            .filter(models.IngestionJob.status.in_(["pending", "running"]))
+            .all()
+        )
+        for job in jobs:
+            for item in job.items:
+                detail = item.detail or {}
+                path = detail.get("file_path")
+                if item.status == "pending" and path and os.path.exists(path):
+                    resumable.append((item.id, detail.get("file_name") or "", path))
+                elif item.status not in {"completed", "failed"}:
+                    item.status = "failed"
+                    item.detail = {**detail, "error": "interrupted by server restart"}
+            if not any(it.status == "pending" for it in job.items):
+                job.status = "failed"
+                job.finished_at = _now()
+        db.commit()
+        return resumable
+    finally:
+        db.close()
@@ -0,0 +1,73 @@
+"""Bounded worker pool for ingestion jobs.
+
+`INGEST_MAX_CONCURRENT_JOBS` caps how many jobs run at once; further jobs
+wait in the executor queue, up to `INGEST_MAX_QUEUED_JOBS` (beyond that the
+upload endpoint answers 503 so clients back off).
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+INGEST_MAX_CONCURRENT_JOBS = max(1, int(os.environ.get("INGEST_MAX_CONCURRENT_JOBS", "2")))
+INGEST_MAX_QUEUED_JOBS = max(0, int(os.environ.get("INGEST_MAX_QUEUED_JOBS", "64")))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+_outstanding = 0
+
+
+class IngestionQueueFull(RuntimeError):
+    pass
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=INGEST_MAX_CONCURRENT_JOBS, thread_name_prefix="ingest")
+    return _executor
+
+
+def _release(_fut: Optional[Future] = None) -> None:
+    global _outstanding
+    with _lock:
+        _outstanding -= 1
+
+
+def submit(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+    """Queue `fn` on the ingestion pool; raises IngestionQueueFull when the backlog is at capacity."""
+    global _outstanding
+    with _lock:
+        if _outstanding >= INGEST_MAX_CONCURRENT_JOBS + INGEST_MAX_QUEUED_JOBS:
+            raise IngestionQueueFull("ingestion queue is full, retry later")
+        _outstanding += 1
+        executor = _get_executor()
+    try:
+        fut = executor.submit(fn, *args, **kwargs)
+    except Exception:
+        _release()
+        raise
+    fut.add_done_callback(_release)
+    return fut
+
+
+def stats() -> Dict[str, int]:
+    with _lock:
+        running = min(_outstanding, INGEST_MAX_CONCURRENT_JOBS)
+        return {
+            "max_concurrent": INGEST_MAX_CONCURRENT_JOBS,
+            "max_queued": INGEST_MAX_QUEUED_JOBS,
+            "running": running,
+            "queued": _outstanding - running,
+        }
+
+
+def shutdown(wait: bool = False) -> None:
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
@@ -1,6 +1,7 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 import tempfile
 import os
 from dotenv import load_dotenv
@@ -8,6 +9,8 @@ from pathlib import Path
 # import parsers lazily (parsing libs are optional in dev image)
 from app.db.session import get_engine
 from app.db import models as models
+from app.storage import BadUpload, UploadTooLarge, receive_upload
+from app.storage.uploads import OPENAPI_UPLOAD_BODY
 
 load_dotenv()
 
@@ -41,6 +44,37 @@ def startup_db():
     # Ensure any new tables (not yet in migrations) exist in dev.
     models.Base.metadata.create_all(bind=engine)
 
+    # Full-text index over chunks (normally created by migration 0005).
+    from app.retrieval import lexical
+    try:
+        with engine.begin() as conn:
+            lexical.ensure_index(conn)
+    except Exception:
+        pass
+
+    # Re-queue ingestion items a previous process accepted but never started.
+    from app import ingestion
+    for item_id, file_name, file_path in ingestion.recover_interrupted_jobs():
+        try:
+            ingestion.submit(ingestion.run_ingestion_item, item_id, file_name=file_name, file_path=file_path)
+        except ingestion.IngestionQueueFull:
+            break
+
+
+@app.on_event("shutdown")
+async def close_llm_clients():
+    from app.embeddings import llm_clients
+    await llm_clients.aclose_all()
+
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    from app.ingestion import worker
+    from app.parsers import engine
+    worker.shutdown(wait=False)
+    engine.shutdown()
+
+
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
 
 # include API routers
@@ -51,6 +85,8 @@ from app.api.auth import router as auth_router
 from app.api.projects import router as projects_router
 from app.api.chat import router as chat_router
 from app.agent.router import router as agent_router
+from app.api.ingestion import router as ingestion_router
+from app.api.metrics import router as metrics_router
 
 app.include_router(kb_router)
 app.include_router(documents_router)
@@ -59,30 +95,37 @@ app.include_router(auth_router)
 app.include_router(projects_router)
 app.include_router(chat_router)
 app.include_router(agent_router)
+app.include_router(ingestion_router)
+app.include_router(metrics_router)
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
-@app.post("/upload")
-async def upload(file: UploadFile = File(...)):
-    filename = file.filename
-    data = await file.read()
+@app.post("/upload", openapi_extra=OPENAPI_UPLOAD_BODY)
+async def upload(request: Request):
+    try:
+        received = await receive_upload(request)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except BadUpload as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    filename, blob = received.filename, received.blob
     try:
-        from app.parsers.pdf_parser import parse_file
-        text = parse_file(filename, data)
+        from app.parsers.pdf_parser import parse_path
+        text = await run_in_threadpool(parse_path, filename, blob.path)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
     # Add to vector store (placeholder). import lazily so dev image doesn't require heavy libs
     try:
         from app.embeddings.vector_store import add_documents
-        add_documents([{"id": filename, "text": text}])
+        await run_in_threadpool(add_documents, [{"id": filename, "text": text}])
     except Exception:
         # embedding subsystem is optional in dev mode
         pass
 
-    return {"filename": filename, "size": len(data), "preview": text[:500]}
+    return {"filename": filename, "size": blob.size, "sha256": blob.sha256, "preview": text[:500]}
 
 @app.post("/qa")
 async def qa(query: dict):
@@ -0,0 +1,40 @@
+"""Tiny in-process metric primitives (exposed as JSON via `GET /metrics`)."""
+
+from __future__ import annotations
+
+import bisect
+import threading
+from typing import Dict, Sequence
+
+
+class Histogram:
+    """Cumulative-bucket histogram, Prometheus style (`le` upper bounds plus +Inf)."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.bounds = sorted(buckets)
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        idx = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self._counts[idx] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            cumulative = {}
+            running = 0
+            for bound, n in zip(self.bounds, self._counts):
+                running += n
+                cumulative[f"le_{bound:g}"] = running
+            cumulative["le_inf"] = self._count
+            return {
+                "count": self._count,
+                "sum": round(self._sum, 3),
+                "avg": round(self._sum / self._count, 3) if self._count else None,
+                "buckets": cumulative,
+            }
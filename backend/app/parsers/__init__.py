@@ -10,4 +10,10 @@ def parse_file(filename: str, raw_bytes: bytes) -> str:
 
 	return _parse_file(filename, raw_bytes)
 
-__all__ = ["parse_file"]
+
+def parse_path(filename: str, path: str) -> str:
+	from .pdf_parser import parse_path as _parse_path
+
+	return _parse_path(filename, path)
+
+__all__ = ["parse_file", "parse_path"]
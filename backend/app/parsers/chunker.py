@@ -1,9 +1,26 @@
 from typing import List, Dict
 
 
-def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[Dict]:
+def _snap_end(text: str, end: int, window: int) -> int:
+    """Move `end` forward to just past the next line break (else whitespace) within `window` chars."""
+    limit = min(len(text), end + window)
+    nl = text.find("\n", end, limit)
+    if nl != -1:
+        return nl + 1
+    for i in range(end, limit):
+        if text[i].isspace():
+            return i + 1
+    return end
+
+
+def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200, snap_window: int = 0) -> List[Dict]:
     """Split text into overlapping chunks.
 
+    With `snap_window > 0`, chunk boundaries move forward (by at most `snap_window`
+    chars) to the next line break. Boundaries then depend on the content rather than
+    on absolute offsets, so after a local edit the chunking re-synchronises and
+    later chunks come out byte-identical to the previous version's.
+
     Returns a list of dicts: {"text": <chunk_text>, "start_pos": <int>, "end_pos": <int>}
     """
     if not text:
@@ -20,11 +37,18 @@ def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[Di
         end = start + chunk_size
         if end >= text_len:
             end = text_len
+        elif snap_window > 0:
+            end = _snap_end(text, end, snap_window)
         chunk = text[start:end]
         chunks.append({"text": chunk, "start_pos": start, "end_pos": end})
         if end == text_len:
             break
-        start = end - overlap
+        next_start = end - overlap
+        if snap_window > 0:
+            next_start = _snap_end(text, next_start, snap_window)
+            if next_start >= end:
+                next_start = end - overlap
+        start = max(next_start, start + 1)
         if start < 0:
             start = 0
 
@@ -0,0 +1,111 @@
+"""Process-pool PDF text extraction.
+
+PDFs are split into page ranges that are extracted in parallel on a
+`ProcessPoolExecutor`; `iter_pdf_pages` yields page texts in page order while
+keeping only a bounded window of ranges in flight. Callers run on ingestion
+workers or the threadpool, never on the API event loop.
+
+This module is imported by the pool's child processes, so keep its imports light.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+PARSE_POOL_SIZE = max(1, int(os.environ.get("PARSE_POOL_SIZE", str(min(4, os.cpu_count() or 1)))))
+PARSE_PAGES_PER_TASK = max(1, int(os.environ.get("PARSE_PAGES_PER_TASK", "16")))
+# 0 disables the cap; pages beyond the cap are not extracted.
+PARSE_MAX_PAGES = max(0, int(os.environ.get("PARSE_MAX_PAGES", "2000")))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _open_reader(fh):
+    try:
+        from pypdf import PdfReader
+    except Exception as e:
+        raise RuntimeError('pypdf is not installed in the runtime image') from e
+    return PdfReader(fh)
+
+
+def _extract_range(path: str, start: int, end: int) -> List[Optional[str]]:
+    """Child-process task: text of pages [start, end); None for pages that fail to extract."""
+    out: List[Optional[str]] = []
+    with open(path, "rb") as fh:
+        reader = _open_reader(fh)
+        for i in range(start, end):
+            try:
+                out.append(reader.pages[i].extract_text() or "")
+            except Exception:
+                out.append(None)
+    return out
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a multi-threaded server process is unsafe
+            _pool = ProcessPoolExecutor(max_workers=PARSE_POOL_SIZE, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def page_count(path: str) -> int:
+    with open(path, "rb") as fh:
+        return len(_open_reader(fh).pages)
+
+
+def page_ranges(n_pages: int, pages_per_task: Optional[int] = None) -> List[Tuple[int, int]]:
+    step = pages_per_task or PARSE_PAGES_PER_TASK
+    return [(s, min(s + step, n_pages)) for s in range(0, n_pages, step)]
+
+
+def iter_pdf_pages(path: str, *, max_pages: Optional[int] = None) -> Iterator[str]:
+    """Yield the text of each page in order; pages that fail to extract are skipped."""
+    cap = PARSE_MAX_PAGES if max_pages is None else max_pages
+    n = page_count(path)
+    if cap:
+        n = min(n, cap)
+    ranges = page_ranges(n)
+
+    if PARSE_POOL_SIZE <= 1 or len(ranges) <= 1:
+        for start, end in ranges:
+            for text in _extract_range(path, start, end):
+                if text is not None:
+                    yield text
+        return
+
+    pool = _get_pool()
+    window = PARSE_POOL_SIZE * 2
+    pending = deque()
+    todo = iter(ranges)
+    for start, end in todo:
+        pending.append(pool.submit(_extract_range, path, start, end))
+        if len(pending) >= window:
+            break
+    while pending:
+        texts = pending.popleft().result()
+        nxt = next(todo, None)
+        if nxt is not None:
+            pending.append(pool.submit(_extract_range, path, *nxt))
+        for text in texts:
+            if text is not None:
+                yield text
+
+
+def extract_pdf_text(path: str, *, max_pages: Optional[int] = None) -> str:
+    return "\n".join(iter_pdf_pages(path, max_pages=max_pages))
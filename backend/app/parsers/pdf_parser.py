@@ -1,35 +1,58 @@
 import io
 import os
+import re
+
+
+def _extract_pdf(stream) -> str:
+    try:
+        from pypdf import PdfReader
+    except Exception as e:
+        raise RuntimeError('pypdf is not installed in the runtime image') from e
+    texts = []
+    reader = PdfReader(stream)
+    for p in reader.pages:
+        try:
+            texts.append(p.extract_text() or "")
+        except Exception:
+            continue
+    return "\n".join(texts)
+
+
+def _strip_tags(s: str) -> str:
+    # naive strip tags — placeholder
+    return re.sub(r'<[^>]+>', ' ', s)
 
 
 def parse_file(filename: str, raw_bytes: bytes) -> str:
     """Simple parser for PDF/TXT/HTML. Returns extracted text as string."""
     _, ext = os.path.splitext(filename.lower())
     if ext == '.pdf':
-        stream = io.BytesIO(raw_bytes)
-        try:
-            from pypdf import PdfReader
-        except Exception as e:
-            raise RuntimeError('pypdf is not installed in the runtime image') from e
-        texts = []
-        reader = PdfReader(stream)
-        for p in reader.pages:
-            try:
-                texts.append(p.extract_text() or "")
-            except Exception:
-                continue
-        return "\n".join(texts)
+        return _extract_pdf(io.BytesIO(raw_bytes))
     elif ext in ('.txt', '.text'):
         return raw_bytes.decode('utf-8', errors='ignore')
     elif ext in ('.html', '.htm'):
-        # naive strip tags — placeholder
-        s = raw_bytes.decode('utf-8', errors='ignore')
-        # very naive: remove tags
-        import re
-        return re.sub(r'<[^>]+>', ' ', s)
+        return _strip_tags(raw_bytes.decode('utf-8', errors='ignore'))
     else:
         # try to decode as text
         try:
             return raw_bytes.decode('utf-8', errors='ignore')
         except Exception:
             raise ValueError('Unsupported file type or unreadable bytes')
+
+
+def parse_path(filename: str, path: str) -> str:
+    """Like `parse_file`, but reads from a file on disk (e.g. a blob store path) via a file handle."""
+    _, ext = os.path.splitext(filename.lower())
+    if ext == '.pdf':
+        # pages are extracted in parallel on the parse process pool, each worker reading the file itself
+        from .engine import extract_pdf_text
+
+        return extract_pdf_text(path)
+    try:
+        with open(path, 'r', encoding='utf-8', errors='ignore') as fh:
+            s = fh.read()
+    except OSError as e:
+        raise ValueError(f'Unreadable file: {e}') from e
+    if ext in ('.html', '.htm'):
+        return _strip_tags(s)
+    return s
@@ -0,0 +1,5 @@
+from . import rerank
+from .context import pack_contexts
+from .hybrid import hybrid_search, resolve_mode
+
+__all__ = ["hybrid_search", "pack_contexts", "resolve_mode", "rerank"]
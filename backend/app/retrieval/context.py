@@ -0,0 +1,162 @@
+"""Context assembly between retrieval and the LLM.
+
+Chunks overlap by 200 chars, and neighbouring chunks of a version are often
+retrieved together, so joining hits verbatim repeats text. `pack_contexts`:
+
+1. merges hits of the same version whose `start_pos`/`end_pos` spans overlap
+   or touch (within `CONTEXT_MERGE_GAP` chars) into one block;
+2. drops blocks whose word shingles are already covered by a better-ranked
+   block (`CONTEXT_DEDUP_THRESHOLD`), e.g. boilerplate repeated across
+   documents or old versions;
+3. keeps blocks in rank order until `CONTEXT_TOKEN_BUDGET` approximate tokens.
+
+Sources returned to the client are unchanged; only the prompt is packed.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+CONTEXT_PACKING_ENABLED = os.environ.get("CONTEXT_PACKING_ENABLED", "true").strip().lower() not in {"0", "false", "no"}
+# 0 = no budget (merge and dedup only)
+CONTEXT_TOKEN_BUDGET = max(0, int(os.environ.get("CONTEXT_TOKEN_BUDGET", "3000")))
+CONTEXT_MERGE_GAP = max(0, int(os.environ.get("CONTEXT_MERGE_GAP", "0")))
+# share of a block's shingles already present in a kept block above which it is dropped (>1 disables)
+CONTEXT_DEDUP_THRESHOLD = float(os.environ.get("CONTEXT_DEDUP_THRESHOLD", "0.9"))
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+_WORD = re.compile(r"\w+")
+_GAP_MARK = "\n...\n"
+
+
+def approx_tokens(text: str) -> int:
+    """Rough BPE token count: words and punctuation, but at least one token per 4 chars."""
+    if not text:
+        return 0
+    return max(len(_TOKEN.findall(text)), math.ceil(len(text) / 4))
+
+
+def _shingles(text: str, n: int = 3) -> Set[Tuple[str, ...]]:
+    words = _WORD.findall(text.lower())
+    if len(words) > n + 2:
+        # chunk boundaries cut words in half; the edge words would never match
+        words = words[1:-1]
+    if len(words) < n:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i : i + n]) for i in range(len(words) - n + 1)}
+
+
+def _span(ctx: Dict[str, Any]) -> Optional[Tuple[str, int, int]]:
+    """(version_id, start, end) when the hit's text is exactly that slice of the version."""
+    meta = ctx.get("metadata") or {}
+    version, start, end = meta.get("version_id"), meta.get("start_pos"), meta.get("end_pos")
+    if not version or not isinstance(start, int) or not isinstance(end, int):
+        return None
+    if end - start != len(ctx.get("text") or ""):
+        return None
+    return version, start, end
+
+
+def _merge(contexts: Sequence[Dict[str, Any]], gap: int) -> Tuple[List[Dict[str, Any]], int]:
+    """Blocks of overlapping/adjacent hits, each tagged with the best rank of its members."""
+    blocks: List[Dict[str, Any]] = []
+    by_version: Dict[str, List[Tuple[int, int, int]]] = {}
+    for rank, ctx in enumerate(contexts):
+        span = _span(ctx)
+        if span is None:
+            blocks.append({"rank": rank, "members": [rank], "text": ctx.get("text") or ""})
+        else:
+            by_version.setdefault(span[0], []).append((span[1], span[2], rank))
+
+    merged = 0
+    for spans in by_version.values():
+        spans.sort()
+        cur: Optional[Dict[str, Any]] = None
+        for start, end, rank in spans:
+            text = contexts[rank].get("text") or ""
+            if cur is not None and start <= cur["end"] + gap:
+                merged += 1
+                cur["members"].append(rank)
+                cur["rank"] = min(cur["rank"], rank)
+                if end > cur["end"]:
+                    if start >= cur["end"]:
+                        cur["text"] += (_GAP_MARK if start > cur["end"] else "") + text
+                    else:
+                        cur["text"] += text[cur["end"] - start :]
+                    cur["end"] = end
+                continue
+            cur = {"rank": rank, "members": [rank], "text": text, "start": start, "end": end}
+            blocks.append(cur)
+    blocks.sort(key=lambda b: b["rank"])
+    return blocks, merged
+
+
+def pack_contexts(
+    contexts: Sequence[Dict[str, Any]],
+    *,
+    token_budget: Optional[int] = None,
+    merge_gap: Optional[int] = None,
+    dedup_threshold: Optional[float] = None,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Pack ranked hits ({chunk_id, text, score, metadata}) into prompt contexts.
+    Returns (packed contexts in rank order, stats). A packed context keeps the
+    fields of its best-ranked member, with the merged text, `chunk_ids` of all
+    members and its approximate `tokens`.
+    """
+    tokens_in = sum(approx_tokens(c.get("text") or "") for c in contexts)
+    if not CONTEXT_PACKING_ENABLED or not contexts:
+        return list(contexts), {"enabled": CONTEXT_PACKING_ENABLED, "chunks": len(contexts), "tokens_in": tokens_in}
+    budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    threshold = CONTEXT_DEDUP_THRESHOLD if dedup_threshold is None else dedup_threshold
+
+    blocks, merged = _merge(contexts, CONTEXT_MERGE_GAP if merge_gap is None else merge_gap)
+
+    packed: List[Dict[str, Any]] = []
+    seen: List[Set[Tuple[str, ...]]] = []
+    duplicates = over_budget = truncated = 0
+    used = 0
+    for block in blocks:
+        shingles = _shingles(block["text"])
+        if shingles and any(len(shingles & prev) >= threshold * len(shingles) for prev in seen):
+            duplicates += 1
+            continue
+        text = block["text"]
+        tokens = approx_tokens(text)
+        if budget and used + tokens > budget:
+            if packed:
+                over_budget += 1
+                continue
+            # the best block alone is over budget: keep its head rather than send nothing
+            text = text[: max(1, int(len(text) * budget / tokens))]
+            tokens = approx_tokens(text)
+            truncated += 1
+        best = contexts[block["rank"]]
+        meta = dict(best.get("metadata") or {})
+        if "start" in block:
+            meta.update(start_pos=block["start"], end_pos=block["end"])
+        packed.append({
+            **best,
+            "text": text,
+            "metadata": meta,
+            "chunk_ids": [contexts[m].get("chunk_id") for m in sorted(block["members"])],
+            "tokens": tokens,
+        })
+        seen.append(shingles)
+        used += tokens
+
+    return packed, {
+        "enabled": True,
+        "chunks": len(contexts),
+        "blocks": len(packed),
+        "merged": merged,
+        "duplicates": duplicates,
+        "over_budget": over_budget,
+        "truncated": truncated,
+        "tokens_in": tokens_in,
+        "tokens_out": used,
+        "token_budget": budget or None,
+    }
@@ -0,0 +1,151 @@
+"""Hybrid retrieval: dense vectors + lexical full-text, fused with reciprocal rank fusion.
+
+Both legs run concurrently on a small thread pool. Each hit's fused score is
+`sum(1 / (HYBRID_RRF_K + rank))` over the legs that returned it. Exact
+identifiers (invoice numbers, part codes) come back through the lexical leg
+even when the embedding misses them. If one leg fails, results fall back to
+the other leg's order and the response names the failed leg in `degraded`;
+only when both fail does the search raise.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.db.session import SessionLocal
+from app.embeddings import vector_store
+from app.metrics import Histogram
+from app.retrieval import lexical
+
+# "vector" or "hybrid"; per request via `mode` on /rag/query or `retrieval_mode` on the agent.
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "vector").strip().lower()
+HYBRID_RRF_K = int(os.environ.get("HYBRID_RRF_K", "60"))
+# Candidates fetched from each leg per requested result.
+HYBRID_OVERFETCH = max(1, int(os.environ.get("HYBRID_OVERFETCH", "4")))
+HYBRID_THREADS = max(2, int(os.environ.get("HYBRID_THREADS", "8")))
+
+MODES = ("vector", "hybrid")
+
+_executor = ThreadPoolExecutor(max_workers=HYBRID_THREADS, thread_name_prefix="hybrid")
+
+leg_ms = {
+    "vector": Histogram([1, 2, 5, 10, 25, 50, 100, 250, 1000]),
+    "lexical": Histogram([1, 2, 5, 10, 25, 50, 100, 250, 1000]),
+}
+
+
+def resolve_mode(mode: Optional[str]) -> str:
+    mode = (mode or RETRIEVAL_MODE).strip().lower()
+    if mode not in MODES:
+        raise ValueError(f"unknown retrieval mode: {mode} (expected one of {', '.join(MODES)})")
+    return mode
+
+
+def _timed(fn: Callable, *args, **kwargs) -> Tuple[Any, float]:
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, (time.perf_counter() - t0) * 1000
+
+
+def _leg(name: str, fut) -> Tuple[Any, Optional[float], Optional[Exception]]:
+    """(result, ms, None) of a leg's future, or (None, None, error) if the leg raised."""
+    try:
+        out, ms = fut.result()
+    except Exception as exc:
+        return None, None, exc
+    leg_ms[name].observe(ms)
+    return out, ms, None
+
+
+def _lexical_leg(query: str, **kwargs) -> List[Dict[str, Any]]:
+    with SessionLocal() as db:
+        return lexical.search(db, query, **kwargs)
+
+
+def rrf_fuse(rankings: List[List[str]], k: int = HYBRID_RRF_K) -> List[Tuple[str, float]]:
+    """Reciprocal rank fusion of id rankings (best first); returns (id, score) best first."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, vid in enumerate(ranking, start=1):
+            scores[vid] = scores.get(vid, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+
+
+def hybrid_search(
+    query: str,
+    n_results: int = 5,
+    kb_id: Optional[str] = None,
+    document_id: Optional[str] = None,
+    *,
+    document_ids: Optional[List[str]] = None,
+    per_doc_quota: Optional[int] = None,
+    include_history: bool = False,
+) -> Dict[str, Any]:
+    """
+    Same shape as `vector_store.query_documents`, plus:
+    `scores` (RRF, higher is better), `distances` (vector distance, None for
+    lexical-only hits), `sources` (legs that returned each hit), `timings_ms`
+    and, if a leg failed, `degraded` ({leg: error}).
+    """
+    fetch = n_results * HYBRID_OVERFETCH
+    scope = {"kb_id": kb_id, "document_id": document_id, "document_ids": document_ids, "include_history": include_history}
+    started = time.perf_counter()
+    vec_fut = _executor.submit(_timed, vector_store.query_documents, query, fetch, **scope)
+    lex_fut = _executor.submit(_timed, _lexical_leg, query, n_results=fetch, **scope)
+
+    raw, vector_ms, vector_error = _leg("vector", vec_fut)
+    lex_hits, lexical_ms, lexical_error = _leg("lexical", lex_fut)
+    if vector_error is not None and lexical_error is not None:
+        raise vector_error
+    raw = raw or {}
+    lex_hits = lex_hits or []
+
+    hits: Dict[str, Dict[str, Any]] = {}
+    vec_ids = (raw.get("ids") or [[]])[0]
+    for j, vid in enumerate(vec_ids):
+        hits[vid] = {
+            "document": (raw.get("documents") or [[]])[0][j],
+            "metadata": ((raw.get("metadatas") or [[]])[0][j]) or {},
+            "distance": (raw.get("distances") or [[]])[0][j] if raw.get("distances") else None,
+            "sources": ["vector"],
+        }
+    for h in lex_hits:
+        if h["id"] in hits:
+            hits[h["id"]]["sources"].append("lexical")
+        else:
+            hits[h["id"]] = {"document": h["text"], "metadata": h["metadata"], "distance": None, "sources": ["lexical"]}
+
+    t0 = time.perf_counter()
+    fused = rrf_fuse([vec_ids, [h["id"] for h in lex_hits]])
+    results: Dict[str, Any] = {
+        "ids": [[vid for vid, _ in fused]],
+        "documents": [[hits[vid]["document"] for vid, _ in fused]],
+        "metadatas": [[hits[vid]["metadata"] for vid, _ in fused]],
+        "distances": [[hits[vid]["distance"] for vid, _ in fused]],
+        "scores": [[round(score, 6) for _, score in fused]],
+        "sources": [[hits[vid]["sources"] for vid, _ in fused]],
+    }
+    if per_doc_quota:
+        results = vector_store.apply_quota(results, n_results, per_doc_quota)
+    else:
+        results = {k: [v[0][:n_results]] for k, v in results.items()}
+    fusion_ms = (time.perf_counter() - t0) * 1000
+
+    results["timings_ms"] = {
+        "vector": round(vector_ms, 2) if vector_ms is not None else None,
+        "lexical": round(lexical_ms, 2) if lexical_ms is not None else None,
+        "fusion": round(fusion_ms, 2),
+        "total": round((time.perf_counter() - started) * 1000, 2),
+    }
+    results["legs"] = {"vector": len(vec_ids), "lexical": len(lex_hits)}
+    degraded = {name: str(exc) for name, exc in (("vector", vector_error), ("lexical", lexical_error)) if exc is not None}
+    if degraded:
+        results["degraded"] = degraded
+    return results
+
+
+def stats() -> Dict[str, Any]:
+    return {"mode": RETRIEVAL_MODE, "leg_ms": {name: h.snapshot() for name, h in leg_ms.items()}}
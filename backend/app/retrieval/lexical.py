@@ -0,0 +1,174 @@
+"""Lexical (full-text) index over `Chunk.text`.
+
+- SQLite: an FTS5 table `chunks_fts(chunk_id UNINDEXED, text)` kept in sync
+  with `chunks` by triggers and joined back on `chunk_id`, ranked with `bm25()`.
+- Postgres: a generated `chunks.text_tsv` tsvector column (`simple` config, so
+  identifiers are not stemmed) with a GIN index, ranked with `ts_rank_cd`.
+
+Either way the database updates the index as chunk rows are inserted or
+deleted during ingest. No separate indexing pass is needed.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+# Longer questions are truncated to this many search terms.
+MAX_TERMS = 32
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+# chunks_fts holds its own copy of the text and is joined to chunks on chunk_id, never on
+# rowid: chunks has a text primary key, so its implicit rowids may change on VACUUM.
+# chunks_fts_rowid maps chunk_id -> FTS rowid so delete triggers don't scan the FTS table.
+_SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(chunk_id UNINDEXED, text)",
+    "CREATE TABLE IF NOT EXISTS chunks_fts_rowid (chunk_id TEXT PRIMARY KEY, fts_rowid INTEGER NOT NULL) WITHOUT ROWID",
+    "CREATE TRIGGER IF NOT EXISTS chunks_fts_ai AFTER INSERT ON chunks BEGIN"
+    " INSERT INTO chunks_fts(chunk_id, text) VALUES (new.id, new.text);"
+    " INSERT OR REPLACE INTO chunks_fts_rowid(chunk_id, fts_rowid) VALUES (new.id, last_insert_rowid()); END",
+    "CREATE TRIGGER IF NOT EXISTS chunks_fts_ad AFTER DELETE ON chunks BEGIN"
+    " DELETE FROM chunks_fts WHERE rowid = (SELECT fts_rowid FROM chunks_fts_rowid WHERE chunk_id = old.id);"
+    " DELETE FROM chunks_fts_rowid WHERE chunk_id = old.id; END",
+    "CREATE TRIGGER IF NOT EXISTS chunks_fts_au AFTER UPDATE OF text ON chunks BEGIN"
+    " UPDATE chunks_fts SET text = new.text WHERE rowid = (SELECT fts_rowid FROM chunks_fts_rowid WHERE chunk_id = old.id); END",
+]
+_SQLITE_TRIGGERS = ("chunks_fts_ai", "chunks_fts_ad", "chunks_fts_au")
+
+_PG_DDL = [
+    "ALTER TABLE chunks ADD COLUMN IF NOT EXISTS text_tsv tsvector"
+    " GENERATED ALWAYS AS (to_tsvector('simple', coalesce(text, ''))) STORED",
+    "CREATE INDEX IF NOT EXISTS idx_chunks_text_tsv ON chunks USING GIN (text_tsv)",
+]
+
+
+def ensure_index(conn: Connection) -> bool:
+    """Create the lexical index if missing (idempotent); False when the dialect has none."""
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        current = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = 'chunks_fts'")).scalar()
+        if current is not None and "chunk_id" not in current:
+            # pre-chunk_id layout (external content keyed by chunks.rowid): rebuild
+            drop_sqlite_index(conn)
+            current = None
+        for stmt in _SQLITE_DDL:
+            conn.execute(text(stmt))
+        if current is None:
+            # backfill chunks that predate the index
+            conn.execute(text("DELETE FROM chunks_fts_rowid"))
+            conn.execute(text("INSERT INTO chunks_fts(rowid, chunk_id, text) SELECT rowid, id, text FROM chunks"))
+            conn.execute(text("INSERT INTO chunks_fts_rowid(chunk_id, fts_rowid) SELECT id, rowid FROM chunks"))
+        return True
+    if dialect == "postgresql":
+        for stmt in _PG_DDL:
+            conn.execute(text(stmt))
+        return True
+    return False
+
+
+def drop_sqlite_index(conn: Connection) -> None:
+    for trigger in _SQLITE_TRIGGERS:
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+    conn.execute(text("DROP TABLE IF EXISTS chunks_fts"))
+    conn.execute(text("DROP TABLE IF EXISTS chunks_fts_rowid"))
+
+
+def _terms(query: str) -> List[List[str]]:
+    """Whitespace-separated terms split into word parts: `INV-2023/17` -> ['INV', '2023', '17']."""
+    out = []
+    for term in (query or "").split():
+        parts = _WORD.findall(term)
+        if parts:
+            out.append(parts)
+    return out[:MAX_TERMS]
+
+
+def fts5_match(query: str) -> Optional[str]:
+    # each term is a phrase (keeps multi-part identifiers together); any term may match
+    terms = _terms(query)
+    return " OR ".join('"' + " ".join(parts) + '"' for parts in terms) if terms else None
+
+
+def pg_tsquery(query: str) -> Optional[str]:
+    terms = _terms(query)
+    return " | ".join("(" + " & ".join(f"'{p}'" for p in parts) + ")" for parts in terms) if terms else None
+
+
+def search(
+    db: Session,
+    query: str,
+    *,
+    n_results: int = 10,
+    kb_id: Optional[str] = None,
+    document_id: Optional[str] = None,
+    document_ids: Optional[List[str]] = None,
+    include_history: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Best lexical matches, best first: [{id, text, score, metadata}], where score is
+    higher-is-better and metadata mirrors the vector store's chunk metadata.
+    Chunks of superseded document versions are skipped unless `include_history`.
+    """
+    dialect = db.get_bind().dialect.name
+    filters = []
+    params: Dict[str, Any] = {"k": int(n_results)}
+    if kb_id:
+        filters.append("d.kb_id = :kb_id")
+        params["kb_id"] = kb_id
+    if document_id:
+        filters.append("dv.document_id = :document_id")
+        params["document_id"] = document_id
+    if document_ids:
+        filters.append("dv.document_id IN :document_ids")
+        params["document_ids"] = list(document_ids)
+    if not include_history:
+        filters.append("(d.current_version_id IS NULL OR c.version_id = d.current_version_id)")
+    where = "".join(f" AND {f}" for f in filters)
+    joins = "JOIN document_versions dv ON dv.id = c.version_id JOIN documents d ON d.id = dv.document_id"
+    cols = "c.id, c.text, c.version_id, c.start_pos, c.end_pos, dv.document_id, d.kb_id"
+
+    if dialect == "sqlite":
+        match = fts5_match(query)
+        if not match:
+            return []
+        params["match"] = match
+        sql = (
+            f"SELECT {cols}, -bm25(chunks_fts) AS score FROM chunks_fts JOIN chunks c ON c.id = chunks_fts.chunk_id "
+            f"{joins} WHERE chunks_fts MATCH :match{where} ORDER BY bm25(chunks_fts) LIMIT :k"
+        )
+    elif dialect == "postgresql":
+        tsq = pg_tsquery(query)
+        if not tsq:
+            return []
+        params["tsq"] = tsq
+        sql = (
+            f"SELECT {cols}, ts_rank_cd(c.text_tsv, q) AS score FROM chunks c {joins}, to_tsquery('simple', :tsq) q "
+            f"WHERE c.text_tsv @@ q{where} ORDER BY score DESC LIMIT :k"
+        )
+    else:
+        return []
+
+    stmt = text(sql)
+    if document_ids:
+        stmt = stmt.bindparams(bindparam("document_ids", expanding=True))
+    rows = db.execute(stmt, params).all()
+    return [
+        {
+            "id": r.id,
+            "text": r.text,
+            "score": float(r.score),
+            "metadata": {
+                "kb_id": r.kb_id,
+                "document_id": r.document_id,
+                "version_id": r.version_id,
+                "start_pos": r.start_pos,
+                "end_pos": r.end_pos,
+            },
+        }
+        for r in rows
+    ]
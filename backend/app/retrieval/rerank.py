@@ -0,0 +1,181 @@
+"""Optional cross-encoder rerank stage.
+
+Retrieval over-fetches `RERANK_CANDIDATES` hits. A small cross-encoder
+(`RERANK_MODEL`, sentence-transformers) scores each (query, chunk) pair in
+batches on CPU, and the best `top_k` go to the LLM. Scores are cached by
+(model, query, chunk_id). Chunk ids are never reused for different text, since
+a new document version gets new ids.
+
+Scoring runs on a dedicated executor and the request waits at most
+`RERANK_BUDGET_MS` for it. Past the budget, or when the model can't be loaded,
+the request keeps vector order. Scoring still finishes in the background and
+fills the cache, so a repeated question is reranked. While such an overrunning
+job is still running, new requests don't queue behind it: they keep vector
+order straight away (counted as `busy`).
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.embeddings.query_cache import normalize_query
+from app.metrics import Histogram
+
+RERANK_ENABLED = os.environ.get("RERANK_ENABLED", "false").strip().lower() in {"1", "true", "yes"}
+RERANK_MODEL = os.environ.get("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = max(1, int(os.environ.get("RERANK_CANDIDATES", "20")))
+RERANK_BATCH_SIZE = max(1, int(os.environ.get("RERANK_BATCH_SIZE", "16")))
+RERANK_BUDGET_MS = float(os.environ.get("RERANK_BUDGET_MS", "300"))
+RERANK_CACHE_SIZE = max(0, int(os.environ.get("RERANK_CACHE_SIZE", "4096")))
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+# the last job a request gave up on; set while it may still occupy the executor
+_overrunning: Optional[Future] = None
+_model = None
+_model_error: Optional[str] = None
+_model_lock = threading.Lock()
+
+_cache: "OrderedDict[Tuple[str, str, str], float]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+rerank_ms = Histogram([5, 10, 25, 50, 100, 250, 500, 1000])
+_counts = {"reranked": 0, "budget_exceeded": 0, "busy": 0, "unavailable": 0, "cache_hits": 0, "pairs_scored": 0}
+_counts_lock = threading.Lock()
+
+
+def _count(name: str, n: int = 1) -> None:
+    with _counts_lock:
+        _counts[name] += n
+
+
+def candidates_for(top_k: int) -> int:
+    """How many hits to fetch so the reranker has something to choose from."""
+    return max(top_k, RERANK_CANDIDATES)
+
+
+def _get_model():
+    global _model, _model_error
+    with _model_lock:
+        if _model is None and _model_error is None:
+            try:
+                from sentence_transformers import CrossEncoder  # type: ignore
+
+                _model = CrossEncoder(RERANK_MODEL, device="cpu")
+            except Exception as exc:
+                _model_error = f"{type(exc).__name__}: {exc}"
+        return _model
+
+
+def _cache_get(keys: Sequence[Tuple[str, str, str]]) -> Dict[int, float]:
+    found: Dict[int, float] = {}
+    with _cache_lock:
+        for i, key in enumerate(keys):
+            score = _cache.get(key)
+            if score is not None:
+                _cache.move_to_end(key)
+                found[i] = score
+    return found
+
+
+def _cache_put(items: Sequence[Tuple[Tuple[str, str, str], float]]) -> None:
+    if not RERANK_CACHE_SIZE:
+        return
+    with _cache_lock:
+        for key, score in items:
+            _cache[key] = score
+            _cache.move_to_end(key)
+        while len(_cache) > RERANK_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _score(query: str, keys: List[Tuple[str, str, str]], texts: List[str]) -> List[float]:
+    model = _get_model()
+    if model is None:
+        raise RuntimeError(_model_error or "rerank model unavailable")
+    scores: List[float] = []
+    for i in range(0, len(texts), RERANK_BATCH_SIZE):
+        batch = texts[i : i + RERANK_BATCH_SIZE]
+        out = model.predict([(query, t) for t in batch], batch_size=RERANK_BATCH_SIZE, show_progress_bar=False)
+        batch_scores = [float(s) for s in out]
+        _cache_put(list(zip(keys[i : i + len(batch)], batch_scores)))
+        scores.extend(batch_scores)
+    _count("pairs_scored", len(texts))
+    return scores
+
+
+def rerank(
+    query: str,
+    ids: Sequence[Optional[str]],
+    texts: Sequence[str],
+    top_k: int,
+    *,
+    budget_ms: Optional[float] = None,
+) -> Tuple[List[int], Optional[List[float]], Dict[str, object]]:
+    """
+    Returns (order, scores, info): `order` indexes into the candidates (best
+    first, at most top_k), `scores` the cross-encoder score per returned
+    candidate (None on fallback), `info` what happened.
+    """
+    global _overrunning
+    budget = RERANK_BUDGET_MS if budget_ms is None else budget_ms
+    started = time.perf_counter()
+    fallback = list(range(min(top_k, len(texts))))
+    if not texts:
+        return [], None, {"applied": False, "reason": "no candidates"}
+
+    qn = normalize_query(query)
+    keys = [(RERANK_MODEL, qn, vid or f"text:{hash(t)}") for vid, t in zip(ids, texts)]
+    scores: Dict[int, float] = _cache_get(keys)
+    _count("cache_hits", len(scores))
+    todo = [i for i in range(len(texts)) if i not in scores]
+    if todo:
+        with _counts_lock:
+            busy = _overrunning is not None and not _overrunning.done()
+        if busy:
+            # the executor is still working past an earlier budget; this request would only time out behind it
+            _count("busy")
+            return fallback, None, {"applied": False, "reason": "busy", "candidates": len(texts)}
+        fut = _executor.submit(_score, query, [keys[i] for i in todo], [texts[i] for i in todo])
+        remaining = budget / 1000 - (time.perf_counter() - started)
+        try:
+            scores.update(zip(todo, fut.result(timeout=max(0.0, remaining))))
+        except FutureTimeout:
+            with _counts_lock:
+                _overrunning = fut
+                _counts["budget_exceeded"] += 1
+            return fallback, None, {"applied": False, "reason": "budget exceeded", "budget_ms": budget, "candidates": len(texts)}
+        except Exception as exc:
+            _count("unavailable")
+            return fallback, None, {"applied": False, "reason": f"unavailable: {exc}", "candidates": len(texts)}
+
+    order = sorted(range(len(texts)), key=lambda i: scores[i], reverse=True)[:top_k]
+    elapsed = (time.perf_counter() - started) * 1000
+    rerank_ms.observe(elapsed)
+    _count("reranked")
+    return order, [scores[i] for i in order], {
+        "applied": True,
+        "model": RERANK_MODEL,
+        "candidates": len(texts),
+        "cached": len(texts) - len(todo),
+        "ms": round(elapsed, 2),
+    }
+
+
+def stats() -> Dict[str, object]:
+    with _cache_lock:
+        cached = len(_cache)
+    with _counts_lock:
+        counts = dict(_counts)
+    return {
+        "enabled": RERANK_ENABLED,
+        "model": RERANK_MODEL,
+        "model_error": _model_error,
+        "cache_entries": cached,
+        **counts,
+        "ms": rerank_ms.snapshot(),
+    }
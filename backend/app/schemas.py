@@ -36,6 +36,7 @@ class DocumentRead(BaseModel):
     id: str
     kb_id: Optional[str]
     title: str
+    current_version_id: Optional[str] = None
     metadata: Optional[Any]
     created_at: datetime
 
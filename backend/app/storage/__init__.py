@@ -0,0 +1,13 @@
+from .blob_store import BlobWriter, StoredBlob, UploadTooLarge, blob_path, store_stream
+from .uploads import BadUpload, ReceivedUpload, receive_upload
+
+__all__ = [
+    "BadUpload",
+    "BlobWriter",
+    "ReceivedUpload",
+    "StoredBlob",
+    "UploadTooLarge",
+    "blob_path",
+    "receive_upload",
+    "store_stream",
+]
@@ -0,0 +1,88 @@
+"""Content-addressed blob store on local disk.
+
+Uploads are streamed in fixed-size chunks into a temp file while a SHA-256
+digest is computed, then atomically moved to `BLOB_DIR/ab/cd/<sha256>`.
+Identical bytes therefore map to a single file, and nothing ever holds the
+whole upload in memory. HTTP uploads arrive through `uploads.receive_upload`,
+which feeds the request body into a `BlobWriter` as it is received.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+BLOB_DIR = os.environ.get("BLOB_DIR", "./blobs")
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_MB", "512")) * 1024 * 1024
+COPY_CHUNK_BYTES = 1024 * 1024
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class StoredBlob:
+    sha256: str
+    path: str
+    size: int
+
+
+def blob_path(sha256: str) -> Path:
+    return Path(BLOB_DIR) / sha256[:2] / sha256[2:4] / sha256
+
+
+class BlobWriter:
+    """Incremental form of `store_stream`: `write` chunks as they arrive, then `commit` or `discard`."""
+
+    def __init__(self, *, max_bytes: Optional[int] = None):
+        self.limit = MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+        self.size = 0
+        self._hasher = hashlib.sha256()
+        tmp_dir = Path(BLOB_DIR) / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        fd, self._tmp_name = tempfile.mkstemp(dir=tmp_dir, prefix="upload-")
+        self._out = os.fdopen(fd, "wb")
+
+    def write(self, buf: bytes) -> None:
+        """Raises UploadTooLarge once the total passes the limit."""
+        self.size += len(buf)
+        if self.limit and self.size > self.limit:
+            raise UploadTooLarge(f"upload exceeds limit of {self.limit} bytes")
+        self._hasher.update(buf)
+        self._out.write(buf)
+
+    def commit(self) -> StoredBlob:
+        self._out.close()
+        digest = self._hasher.hexdigest()
+        final = blob_path(digest)
+        if final.exists():
+            os.unlink(self._tmp_name)
+        else:
+            final.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(self._tmp_name, final)
+        return StoredBlob(sha256=digest, path=str(final), size=self.size)
+
+    def discard(self) -> None:
+        self._out.close()
+        if os.path.exists(self._tmp_name):
+            os.unlink(self._tmp_name)
+
+
+def store_stream(src: BinaryIO, *, max_bytes: Optional[int] = None) -> StoredBlob:
+    """Copy `src` into the store chunk by chunk; raises UploadTooLarge past `max_bytes`."""
+    writer = BlobWriter(max_bytes=max_bytes)
+    try:
+        while True:
+            buf = src.read(COPY_CHUNK_BYTES)
+            if not buf:
+                break
+            writer.write(buf)
+        return writer.commit()
+    except BaseException:
+        writer.discard()
+        raise
@@ -0,0 +1,176 @@
+"""Multipart uploads streamed straight into the blob store.
+
+Starlette's form parser spools every file part to a temp file before the
+endpoint runs, so a size limit checked afterwards protects nothing and each
+accepted upload is written to disk twice. `receive_upload` instead rejects an
+oversized `Content-Length` before reading the body, then feeds the body through
+python-multipart and writes the file part into a `BlobWriter`, which enforces
+`MAX_UPLOAD_MB` as the bytes arrive (also for chunked requests).
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field as dc_field
+from typing import Dict, Optional
+
+import multipart
+from multipart.exceptions import FormParserError
+from multipart.multipart import parse_options_header
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+from app.storage import blob_store
+from app.storage.blob_store import BlobWriter, StoredBlob, UploadTooLarge
+
+# Multipart framing and small form fields on top of the file itself.
+FORM_OVERHEAD_BYTES = 64 * 1024
+MAX_FIELD_BYTES = 64 * 1024
+
+# OpenAPI request body for endpoints that read their upload with `receive_upload`.
+OPENAPI_UPLOAD_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
+
+
+class BadUpload(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class ReceivedUpload:
+    filename: str
+    blob: StoredBlob
+    fields: Dict[str, str] = dc_field(default_factory=dict)
+
+
+class _FormSink:
+    """python-multipart callbacks: the first file part named `field` goes to a BlobWriter."""
+
+    def __init__(self, field: str, max_bytes: Optional[int]):
+        self.field = field
+        self.max_bytes = max_bytes
+        self.writer: Optional[BlobWriter] = None
+        self.filename: Optional[str] = None
+        self.fields: Dict[str, str] = {}
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._name: Optional[str] = None
+        self._target: Optional[str] = None  # "file", "field" or None (ignored part)
+        self._data = b""
+        self.complete = False
+
+    def callbacks(self) -> Dict[str, object]:
+        return {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_end": self._on_end,
+        }
+
+    def _on_part_begin(self) -> None:
+        self._disposition = b""
+        self._name = None
+        self._target = None
+        self._data = b""
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._disposition)
+        if b"name" not in options:
+            raise BadUpload('multipart part without a Content-Disposition "name"')
+        self._name = options[b"name"].decode("utf-8", "replace")
+        if b"filename" not in options:
+            self._target = "field"
+        elif self._name == self.field and self.writer is None:
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+            self.writer = BlobWriter(max_bytes=self.max_bytes)
+            self._target = "file"
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._target == "file":
+            self.writer.write(data[start:end])
+        elif self._target == "field":
+            self._data += data[start:end]
+            if len(self._data) > MAX_FIELD_BYTES:
+                raise BadUpload(f"form field {self._name!r} exceeds {MAX_FIELD_BYTES} bytes")
+
+    def _on_part_end(self) -> None:
+        if self._target == "field":
+            self.fields[self._name] = self._data.decode("utf-8", "replace")
+        self._target = None
+
+    def _on_end(self) -> None:
+        self.complete = True
+
+    def finish(self) -> ReceivedUpload:
+        if not self.complete:
+            # the body stopped before the closing boundary: don't keep a truncated file
+            raise BadUpload("incomplete multipart body")
+        if self.writer is None:
+            raise BadUpload(f"missing file field {self.field!r}")
+        return ReceivedUpload(filename=self.filename or "", blob=self.writer.commit(), fields=self.fields)
+
+    def discard(self) -> None:
+        if self.writer is not None:
+            self.writer.discard()
+
+
+async def receive_upload(request: Request, *, field: str = "file", max_bytes: Optional[int] = None) -> ReceivedUpload:
+    """
+    Store the `field` file part of a multipart request body in the blob store.
+    Raises UploadTooLarge past `max_bytes` (default MAX_UPLOAD_MB) and BadUpload for a malformed body.
+    """
+    limit = blob_store.MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+    length = request.headers.get("content-length", "")
+    if limit and length.isdigit() and int(length) > limit + FORM_OVERHEAD_BYTES:
+        raise UploadTooLarge(f"upload exceeds limit of {limit} bytes")
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+        raise BadUpload("expected a multipart/form-data body")
+
+    sink = _FormSink(field, limit)
+    parser = multipart.MultipartParser(params[b"boundary"], sink.callbacks())
+    try:
+        async for chunk in request.stream():
+            if chunk:
+                # the callbacks hash and write to disk; keep that off the event loop
+                await run_in_threadpool(parser.write, chunk)
+        parser.finalize()
+        return await run_in_threadpool(sink.finish)
+    except BadUpload:
+        sink.discard()
+        raise
+    except FormParserError as exc:
+        sink.discard()
+        raise BadUpload(f"malformed multipart body: {exc}") from exc
+    except BaseException:
+        sink.discard()
+        raise
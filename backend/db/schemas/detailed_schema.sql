@@ -135,18 +135,26 @@ CREATE INDEX IF NOT EXISTS idx_chunks_doc_idx ON chunks(document_id, index_in_do
 CREATE INDEX IF NOT EXISTS idx_chunks_kb ON chunks(kb_id);
 CREATE INDEX IF NOT EXISTS idx_chunks_text_trgm ON chunks USING GIN (text gin_trgm_ops);
 
--- Optional: pgvector storage for embeddings
+-- Optional: pgvector storage for embeddings (VECTOR_BACKEND=pgvector).
+-- app/embeddings/pgvector_store.py creates this table on first write, with
+-- vector(dim) matching the active embedder (384 for all-MiniLM-L6-v2).
+-- Full metadata is kept in `meta`; kb_id/version_id are columns so filters
+-- and cascading deletes stay in SQL (document_id is joined via document_versions).
 -- CREATE EXTENSION IF NOT EXISTS vector;
 -- CREATE TABLE IF NOT EXISTS chunks_vector (
---   id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+--   id TEXT PRIMARY KEY, -- chunk id
 --   version_id UUID REFERENCES document_versions(id) ON DELETE CASCADE,
 --   kb_id UUID REFERENCES knowledge_bases(id) ON DELETE CASCADE,
 --   text TEXT NOT NULL,
---   embedding vector(1536),
---   meta JSONB DEFAULT '{}'::jsonb,
+--   embedding vector(384) NOT NULL,
+--   meta JSONB NOT NULL DEFAULT '{}'::jsonb,
 --   created_at TIMESTAMPTZ NOT NULL DEFAULT now()
 -- );
--- CREATE INDEX IF NOT EXISTS idx_chunks_embedding ON chunks_vector USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
+-- CREATE INDEX IF NOT EXISTS idx_chunks_vector_kb ON chunks_vector(kb_id);
+-- CREATE INDEX IF NOT EXISTS idx_chunks_vector_version ON chunks_vector(version_id);
+-- Distances are L2 (`<->`); HNSW by default (PGVECTOR_INDEX), ivfflat as an alternative:
+-- CREATE INDEX IF NOT EXISTS idx_chunks_vector_embedding ON chunks_vector USING hnsw (embedding vector_l2_ops) WITH (m = 16, ef_construction = 64);
+-- CREATE INDEX IF NOT EXISTS idx_chunks_vector_embedding ON chunks_vector USING ivfflat (embedding vector_l2_ops) WITH (lists = 100);
 
 
 -- =====================
@@ -0,0 +1,109 @@
+"""Compare numpy-index quantization settings: memory scanned per query vs. recall@k.
+
+Usage (from backend/):
+    python scripts/quantization_report.py                      # embeddings from the configured vector store
+    python scripts/quantization_report.py --kb <kb_id> --limit 50000
+    python scripts/quantization_report.py --synthetic 20000 --dim 384
+
+Held-out rows serve as queries. Recall@k is the share of the exact top k
+(brute force over float32) that each setting returns.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.embeddings import numpy_index  # noqa: E402
+from app.embeddings.numpy_index import NumpyIndex  # noqa: E402
+
+
+def load_vectors(args):
+    if args.synthetic:
+        rng = np.random.default_rng(args.seed)
+        # clustered data looks more like real embeddings than isotropic noise
+        centers = rng.normal(size=(max(1, args.synthetic // 200), args.dim))
+        X = centers[rng.integers(len(centers), size=args.synthetic)] + 0.3 * rng.normal(size=(args.synthetic, args.dim))
+        return X.astype(np.float32)
+    from app.embeddings import vector_store
+
+    got = vector_store._get_collection().get(where={"kb_id": args.kb} if args.kb else None, include=["embeddings"])
+    X = np.asarray(got.get("embeddings") or [], dtype=np.float32)
+    if args.limit and len(X) > args.limit:
+        X = X[: args.limit]
+    return X
+
+
+def settings(args):
+    yield "none", {}
+    for factor in args.rescore:
+        yield "int8", {"rescore_factor": factor}
+    for m in args.pq_m:
+        for factor in args.rescore:
+            yield "pq", {"rescore_factor": factor, "m": m}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--kb", help="only this KB's vectors")
+    ap.add_argument("--limit", type=int, default=0, help="cap on vectors read from the store")
+    ap.add_argument("--synthetic", type=int, default=0, help="use N random clustered vectors instead of the store")
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("-k", type=int, default=10)
+    ap.add_argument("--rescore", type=int, nargs="+", default=[1, 4, 10], help="NUMPY_RESCORE_FACTOR values to try")
+    ap.add_argument("--pq-m", type=int, nargs="+", default=[16, 32, 64], help="NUMPY_PQ_M values to try")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    X = load_vectors(args)
+    if len(X) <= args.queries:
+        print(f"need more than {args.queries} vectors, found {len(X)}")
+        return 1
+    rng = np.random.default_rng(args.seed)
+    perm = rng.permutation(len(X))
+    Q, base = X[perm[: args.queries]], X[perm[args.queries :]]
+    ids = [str(i) for i in range(len(base))]
+    k = min(args.k, len(base))
+
+    sq = np.einsum("ij,ij->i", base, base)
+    exact = [set(np.argsort(sq - 2.0 * (base @ q))[:k].astype(str)) for q in Q]
+
+    print(f"{len(base)} vectors x {base.shape[1]} dims, {len(Q)} queries, k={k}")
+    print(f"{'setting':<22}{'scanned MB':>12}{'vs f32':>8}{'recall@k':>10}{'p50 ms':>9}{'build s':>9}")
+    built = {}
+    for mode, opts in settings(args):
+        key = (mode, opts.get("m"))
+        if key not in built:
+            tmp = tempfile.mkdtemp(prefix=f"quant-{mode}-")
+            numpy_index.NUMPY_PQ_M = opts.get("m", numpy_index.NUMPY_PQ_M)
+            t0 = time.perf_counter()
+            idx = NumpyIndex(tmp, quantization=mode)
+            idx.add(ids, [""] * len(ids), base, [{"kb_id": "report"}] * len(ids))
+            idx.count()  # loads (and for quantized modes encodes) the segment
+            built[key] = (tmp, time.perf_counter() - t0)
+        tmp, build_s = built[key]
+        idx = NumpyIndex(tmp, quantization=mode, rescore_factor=opts.get("rescore_factor"))
+        mem = idx.memory()
+
+        hits, lat = 0, []
+        for q, truth in zip(Q, exact):
+            t0 = time.perf_counter()
+            res = idx.query([q], n_results=k)
+            lat.append((time.perf_counter() - t0) * 1000)
+            hits += len(truth.intersection(res["ids"][0]))
+        label = mode if mode == "none" else f"{mode}" + (f" m={opts['m']}" if "m" in opts else "") + f" x{opts['rescore_factor']}"
+        print(
+            f"{label:<22}{mem['scanned_bytes'] / 2**20:>12.2f}{mem['float32_bytes'] / max(1, mem['scanned_bytes']):>7.1f}x"
+            f"{hits / (k * len(Q)):>10.3f}{float(np.median(lat)):>9.2f}{build_s:>9.2f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
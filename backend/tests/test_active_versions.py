@@ -0,0 +1,44 @@
+import numpy as np
+
+from app.embeddings import vector_store
+from app.embeddings.numpy_index import NumpyIndex
+
+
+def _store(tmp_path, monkeypatch, current):
+    """Two documents: d1 with versions a (old), b (current); d2 with one version c. Old vectors sit nearest."""
+    idx = NumpyIndex(str(tmp_path))
+    rows = [("d1", "a")] * 6 + [("d1", "b")] * 3 + [("d2", "c")] * 3
+    X = np.array([[0.1 * i, 0.0] for i in range(len(rows))], dtype=np.float32)
+    idx.add(
+        [f"{v}{i}" for i, (_, v) in enumerate(rows)],
+        [""] * len(rows),
+        X,
+        [{"kb_id": "kb", "document_id": d, "version_id": v} for d, v in rows],
+    )
+    monkeypatch.setattr(vector_store, "_collection", idx)
+    monkeypatch.setattr(vector_store, "_encode_query", lambda q: [0.0, 0.0])
+    monkeypatch.setattr(vector_store, "_current_versions", lambda ids: {d: current.get(d) for d in ids if d})
+
+
+def test_kb_search_prunes_superseded_versions(tmp_path, monkeypatch):
+    _store(tmp_path, monkeypatch, {"d1": "b", "d2": "c"})
+    monkeypatch.setattr(vector_store, "VERSION_OVERFETCH", 1)
+
+    # the 6 nearest are all superseded; pruning re-queries with more candidates
+    res = vector_store.query_documents("q", n_results=4, kb_id="kb")
+    assert [m["version_id"] for m in res["metadatas"][0]] == ["b", "b", "b", "c"]
+    assert len(res["distances"][0]) == 4
+
+    history = vector_store.query_documents("q", n_results=4, kb_id="kb", include_history=True)
+    assert {m["version_id"] for m in history["metadatas"][0]} == {"a"}
+
+
+def test_document_scoped_search_filters_on_current_version(tmp_path, monkeypatch):
+    _store(tmp_path, monkeypatch, {"d1": "b", "d2": None})
+    res = vector_store.query_documents("q", n_results=10, document_ids=["d1", "d2"], per_doc_quota=5)
+    # d2 has no current version recorded, so all its versions count as active
+    assert sorted({m["version_id"] for m in res["metadatas"][0]}) == ["b", "c"]
+    assert len(res["ids"][0]) == 6
+
+    one = vector_store.query_documents("q", n_results=10, document_id="d1", include_history=True)
+    assert len(one["ids"][0]) == 9
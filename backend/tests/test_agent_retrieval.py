@@ -0,0 +1,68 @@
+from app.agent import orchestrator
+from app.agent.orchestrator import AgentOrchestrator
+from app.agent.tools import VectorSearchResult
+from app.embeddings.vector_store import apply_quota
+
+
+def _raw(docs):
+    return {
+        "ids": [[f"c{i}" for i in range(len(docs))]],
+        "documents": [[f"text {i}" for i in range(len(docs))]],
+        "metadatas": [[{"document_id": d} if d else {} for d in docs]],
+        "distances": [[0.1 * i for i in range(len(docs))]],
+    }
+
+
+def test_apply_quota_keeps_rank_order_and_caps_each_document():
+    out = apply_quota(_raw(["a", "a", "a", "b", None, "b", "b", None]), n_results=5, per_doc_quota=2)
+    assert out["ids"] == [["c0", "c1", "c3", "c4", "c5"]]
+    assert [m.get("document_id") for m in out["metadatas"][0]] == ["a", "a", "b", None, "b"]
+    assert out["distances"][0] == sorted(out["distances"][0])
+
+    # fewer eligible hits than n_results: everything within quota, nothing padded
+    assert apply_quota(_raw(["a", "a", "b"]), n_results=10, per_doc_quota=1)["ids"] == [["c0", "c2"]]
+    assert apply_quota({"ids": [], "documents": []}, n_results=3, per_doc_quota=1) == {"ids": [], "documents": []}
+
+
+class _Search:
+    def __init__(self):
+        self.calls = []
+
+    def search(self, query, *, top_k, **kwargs):
+        self.calls.append({"top_k": top_k, **kwargs})
+        doc = kwargs.get("document_id") or "all"
+        # distances grow with rank; doc "d2" is closer than "d1"
+        base = {"d1": 0.5, "d2": 0.1}.get(doc, 0.0)
+        return [VectorSearchResult(f"{doc}-{i}", "t", base + i, {"document_id": doc}) for i in range(top_k)]
+
+
+def _retrieve(tool, **kwargs):
+    agent = AgentOrchestrator(search_tool=tool)
+    return agent._retrieve(
+        "q", top_k=3, kb_id="kb", document_id=None, routed_doc_ids=["d1", "d2"], retrieval_mode="vector", **kwargs
+    )
+
+
+def test_single_pass_issues_one_query_over_the_routed_documents(monkeypatch):
+    monkeypatch.setattr(orchestrator, "AGENT_RETRIEVAL_MODE", "single_pass")
+    monkeypatch.setattr(orchestrator, "AGENT_PER_DOC_QUOTA", 0)
+    tool = _Search()
+    _retrieve(tool)
+    assert len(tool.calls) == 1
+    call = tool.calls[0]
+    assert call["top_k"] == 3 and call["document_ids"] == ["d1", "d2"] and call["kb_id"] == "kb"
+    # ceil(3 / 2) hits per routed document unless AGENT_PER_DOC_QUOTA is set
+    assert call["per_doc_quota"] == 2
+
+    monkeypatch.setattr(orchestrator, "AGENT_PER_DOC_QUOTA", 1)
+    _retrieve(tool)
+    assert tool.calls[1]["per_doc_quota"] == 1
+
+
+def test_fanout_queries_each_document_and_merges_by_distance(monkeypatch):
+    monkeypatch.setattr(orchestrator, "AGENT_RETRIEVAL_MODE", "fanout")
+    tool = _Search()
+    hits = _retrieve(tool)
+    assert [(c["document_id"], c["top_k"]) for c in tool.calls] == [("d1", 2), ("d2", 2)]
+    assert all("document_ids" not in c for c in tool.calls)
+    assert [h.chunk_id for h in hits] == ["d2-0", "d1-0", "d2-1"]
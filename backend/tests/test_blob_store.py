@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import io
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api import documents
+from app.db import models
+from app.db.session import get_session
+from app.storage import blob_store
+from app.storage.blob_store import UploadTooLarge, store_stream
+from app.storage.uploads import BadUpload, receive_upload
+
+BODY = b"0123456789" * 10
+
+
+@pytest.fixture
+def blob_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(blob_store, "BLOB_DIR", str(tmp_path / "blobs"))
+    # several reads per upload
+    monkeypatch.setattr(blob_store, "COPY_CHUNK_BYTES", 16)
+    return tmp_path / "blobs"
+
+
+def test_blobs_are_keyed_by_sha256_in_sharded_directories(blob_dir):
+    sha = hashlib.sha256(BODY).hexdigest()
+    blob = store_stream(io.BytesIO(BODY))
+    assert blob.sha256 == sha and blob.size == len(BODY)
+    assert blob.path == str(blob_dir / sha[:2] / sha[2:4] / sha)
+    with open(blob.path, "rb") as fh:
+        assert fh.read() == BODY
+
+    # identical bytes map to the same file; the second temp file is discarded
+    again = store_stream(io.BytesIO(BODY))
+    assert again.path == blob.path
+    assert os.listdir(blob_dir / "tmp") == []
+
+
+def test_oversized_upload_is_rejected_and_leaves_no_partial_file(blob_dir):
+    with pytest.raises(UploadTooLarge):
+        store_stream(io.BytesIO(BODY), max_bytes=40)
+    assert os.listdir(blob_dir / "tmp") == []
+    assert sorted(os.listdir(blob_dir)) == ["tmp"]
+    # exactly at the limit is fine
+    assert store_stream(io.BytesIO(BODY), max_bytes=len(BODY)).size == len(BODY)
+
+
+def test_upload_endpoint_answers_413_past_max_upload(blob_dir, monkeypatch):
+    engine = create_engine("sqlite://", future=True, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine, future=True)()
+    doc = models.Document(title="big")
+    db.add(doc)
+    db.commit()
+    app = FastAPI()
+    app.include_router(documents.router)
+    app.dependency_overrides[get_session] = lambda: db
+    monkeypatch.setattr(blob_store, "MAX_UPLOAD_BYTES", 40)
+
+    r = TestClient(app).post(f"/documents/{doc.id}/upload", files={"file": ("big.txt", BODY, "text/plain")})
+    assert r.status_code == 413
+    assert os.listdir(blob_dir / "tmp") == []
+    assert db.query(models.DocumentVersion).count() == 0
+
+
+def _multipart(body, boundary=b"xyz"):
+    return (
+        b"--" + boundary + b"\r\n"
+        b'Content-Disposition: form-data; name="note"\r\n\r\nhello\r\n'
+        b"--" + boundary + b"\r\n"
+        b'Content-Disposition: form-data; name="file"; filename="r.txt"\r\n'
+        b"Content-Type: text/plain\r\n\r\n" + body + b"\r\n"
+        b"--" + boundary + b"--\r\n"
+    )
+
+
+def _request(chunks, length=None):
+    from starlette.requests import Request
+
+    headers = [(b"content-type", b"multipart/form-data; boundary=xyz")]
+    if length is not None:
+        headers.append((b"content-length", str(length).encode()))
+    pending = list(chunks)
+    reads = []
+
+    async def receive():
+        reads.append(1)
+        body = pending.pop(0) if pending else b""
+        return {"type": "http.request", "body": body, "more_body": bool(pending)}
+
+    return Request({"type": "http", "method": "POST", "headers": headers}, receive), reads
+
+
+def test_receive_upload_streams_the_file_part_in_small_pieces(blob_dir):
+    payload = _multipart(BODY)
+    # 7-byte reads split the boundary and headers across chunks
+    request, _ = _request([payload[i : i + 7] for i in range(0, len(payload), 7)])
+    upload = asyncio.run(receive_upload(request))
+    assert upload.filename == "r.txt" and upload.fields == {"note": "hello"}
+    assert upload.blob.sha256 == hashlib.sha256(BODY).hexdigest() and upload.blob.size == len(BODY)
+
+
+def test_receive_upload_rejects_before_reading_or_while_streaming(blob_dir):
+    # declared too large: refused without reading the body or creating a temp file
+    request, reads = _request([_multipart(BODY)], length=10_000_000)
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(receive_upload(request, max_bytes=40))
+    assert reads == [] and not blob_dir.exists()
+
+    # no Content-Length (chunked): the limit applies as bytes arrive
+    payload = _multipart(BODY)
+    request, reads = _request([payload[i : i + 16] for i in range(0, len(payload), 16)])
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(receive_upload(request, max_bytes=40))
+    assert len(reads) < len(payload) // 16
+    assert os.listdir(blob_dir / "tmp") == []
+
+    # a body cut off before the closing boundary is not stored
+    request, _ = _request([_multipart(BODY)[:-20]])
+    with pytest.raises(BadUpload):
+        asyncio.run(receive_upload(request))
+    assert os.listdir(blob_dir / "tmp") == [] and sorted(os.listdir(blob_dir)) == ["tmp"]
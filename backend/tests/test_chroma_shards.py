@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+from chromadb.config import Settings
+
+from app.embeddings import chroma_shards
+from app.embeddings.chroma_shards import LEGACY_COLLECTION, ShardedChromaCollection, collection_name
+
+
+@pytest.fixture
+def client(tmp_path):
+    return chromadb.PersistentClient(path=str(tmp_path), settings=Settings(anonymized_telemetry=False))
+
+
+def _add(col, kb, n, offset=0.0):
+    col.add(
+        [f"{kb or 'none'}-{i}" for i in range(n)],
+        [f"text {i}" for i in range(n)],
+        [[offset + i, 0.0] for i in range(n)],
+        [{"kb_id": kb, "document_id": f"d{i}"} if kb else {"document_id": f"d{i}"} for i in range(n)],
+    )
+
+
+def test_vectors_are_routed_to_one_collection_per_kb(client):
+    col = ShardedChromaCollection(client)
+    _add(col, "a", 3)
+    _add(col, "b", 2, offset=0.5)
+    _add(col, None, 1, offset=10.0)
+    assert sorted(c.name for c in client.list_collections()) == sorted([collection_name("a"), collection_name("b"), LEGACY_COLLECTION])
+    assert client.get_collection(collection_name("b")).count() == 2
+
+    # pinned to a KB: only that collection is searched
+    res = col.query([[0.0, 0.0]], n_results=10, where={"kb_id": "b"})
+    assert res["ids"] == [["b-0", "b-1"]]
+    # unscoped: every collection, merged by distance
+    res = col.query([[0.0, 0.0]], n_results=3)
+    assert res["ids"] == [["a-0", "b-0", "a-1"]]
+    assert res["distances"][0] == sorted(res["distances"][0])
+    assert col.count() == 6
+    assert col.get(where={"$and": [{"kb_id": "a"}, {"document_id": "d1"}]})["ids"] == ["a-1"]
+    assert col.query([[0.0, 0.0]], n_results=3, where={"kb_id": "missing"})["ids"] == [[]]
+
+
+def test_handle_lru_and_drop_kb(client, monkeypatch):
+    monkeypatch.setattr(chroma_shards, "CHROMA_SHARD_CACHE_SIZE", 2)
+    col = ShardedChromaCollection(client)
+    for kb in ("a", "b", "c"):
+        _add(col, kb, 1)
+    assert list(col._handles) == [collection_name("b"), collection_name("c")]
+    # an evicted handle is reopened on demand
+    assert col.get(where={"kb_id": "a"}, include=[])["ids"] == ["a-0"]
+    assert list(col._handles) == [collection_name("c"), collection_name("a")]
+
+    col.drop_kb("a")
+    col.drop_kb("never-existed")
+    assert collection_name("a") not in col._handles
+    assert collection_name("a") not in [c.name for c in client.list_collections()]
+    assert col.query([[0.0, 0.0]], n_results=5, where={"kb_id": "a"})["ids"] == [[]]
+    assert col.count() == 2
+
+
+@pytest.mark.skipif(int(np.__version__.split(".")[0]) >= 2, reason="chromadb 0.4 deletes fail on numpy 2 (requirements pin numpy<2)")
+def test_migrate_legacy_moves_kb_vectors_out_of_the_shared_collection(client):
+    legacy = client.get_or_create_collection(LEGACY_COLLECTION)
+    legacy.add(
+        ids=["x1", "x2", "y1", "orphan"],
+        documents=["x1", "x2", "y1", "orphan"],
+        embeddings=[[1.0, 0.0], [2.0, 0.0], [3.0, 0.0], [4.0, 0.0]],
+        metadatas=[{"kb_id": "x"}, {"kb_id": "x"}, {"kb_id": "y"}, {"kb_id": ""}],
+    )
+    col = ShardedChromaCollection(client)
+    assert col.migrate_legacy(batch_size=2) == 3
+    assert legacy.get()["ids"] == ["orphan"]
+    assert sorted(client.get_collection(collection_name("x")).get()["ids"]) == ["x1", "x2"]
+    got = client.get_collection(collection_name("y")).get(include=["embeddings", "metadatas"])
+    assert got["embeddings"] == [[3.0, 0.0]] and got["metadatas"] == [{"kb_id": "y"}]
+    assert col.migrate_legacy() == 0
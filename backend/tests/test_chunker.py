@@ -0,0 +1,27 @@
+import random
+
+from app.parsers.chunker import chunk_text
+
+
+def _lines(n, seed=0):
+    rnd = random.Random(seed)
+    words = ["alpha", "beta", "gamma", "delta", "lorem", "ipsum"]
+    return [" ".join(rnd.choice(words) for _ in range(rnd.randint(3, 20))) for _ in range(n)]
+
+
+def test_default_chunking_uses_fixed_windows():
+    text = "x" * 2500
+    chunks = chunk_text(text)
+    assert [(c["start_pos"], c["end_pos"]) for c in chunks] == [(0, 1000), (800, 1800), (1600, 2500)]
+    assert all(text[c["start_pos"]:c["end_pos"]] == c["text"] for c in chunks)
+
+
+def test_snapped_chunking_resyncs_after_local_edit():
+    lines = _lines(3000)
+    before = {c["text"] for c in chunk_text("\n".join(lines), snap_window=200)}
+    lines[100] += " edited"
+    after = chunk_text("\n".join(lines), snap_window=200)
+
+    changed = [c for c in after if c["text"] not in before]
+    assert 0 < len(changed) <= 4
+    assert len(after) > 100
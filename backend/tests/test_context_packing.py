@@ -0,0 +1,46 @@
+from app.parsers.chunker import chunk_text
+from app.retrieval.context import approx_tokens, pack_contexts
+
+
+def _hits(text, version, ids):
+    chunks = chunk_text(text, chunk_size=100, overlap=20)
+    return [
+        {
+            "chunk_id": f"{version}-{i}",
+            "text": chunks[i]["text"],
+            "score": 0.1 * n,
+            "metadata": {"version_id": version, "start_pos": chunks[i]["start_pos"], "end_pos": chunks[i]["end_pos"]},
+        }
+        for n, i in enumerate(ids)
+    ]
+
+
+def test_overlapping_chunks_merge_and_duplicates_drop():
+    text = " ".join(f"word{i}" for i in range(120))
+    # hits 2, 1 and 3 are consecutive overlapping chunks of v1; 6 stands alone
+    hits = _hits(text, "v1", [2, 6, 1, 3])
+    # the same passage in another version (e.g. a re-upload) is a near-duplicate
+    hits.append({**hits[0], "chunk_id": "v2-2", "metadata": {**hits[0]["metadata"], "version_id": "v2"}})
+
+    packed, info = pack_contexts(hits, token_budget=0)
+    assert [p["chunk_ids"] for p in packed] == [["v1-2", "v1-1", "v1-3"], ["v1-6"]]
+    first = packed[0]
+    start, end = first["metadata"]["start_pos"], first["metadata"]["end_pos"]
+    assert first["text"] == text[start:end]
+    assert info["merged"] == 2 and info["duplicates"] == 1
+    assert info["tokens_out"] < info["tokens_in"]
+
+
+def test_token_budget_keeps_best_ranked_blocks():
+    hits = [
+        {"chunk_id": f"c{i}", "text": " ".join(f"t{i}w{j}" for j in range(40)), "score": i, "metadata": {}}
+        for i in range(4)
+    ]
+    one = approx_tokens(hits[0]["text"])
+    packed, info = pack_contexts(hits, token_budget=2 * one + 1)
+    assert [p["chunk_id"] for p in packed] == ["c0", "c1"]
+    assert info["over_budget"] == 2 and info["tokens_out"] <= 2 * one + 1
+
+    # a single block over budget is cut down instead of dropped
+    packed, info = pack_contexts(hits[:1], token_budget=one // 2)
+    assert info["truncated"] == 1 and packed[0]["tokens"] <= one // 2 + 1
@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.agent.orchestrator import AgentOrchestrator, AgentScope
+from app.api.documents import get_document_profile
+from app.db import catalog, models
+
+
+def test_kb_catalog_is_one_cached_query(monkeypatch):
+    engine = create_engine("sqlite://", future=True)
+    models.Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine, future=True)()
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    kb = models.KnowledgeBase(name="kb")
+    db.add(kb)
+    db.flush()
+    t0 = datetime(2024, 1, 1)
+    first_versions = {}
+    for n in range(20):
+        doc = models.Document(kb_id=kb.id, title=f"doc{n}", created_at=t0 + timedelta(days=n))
+        db.add(doc)
+        db.flush()
+        for v in (1, 2):
+            ver = models.DocumentVersion(document_id=doc.id, version_number=v)
+            db.add(ver)
+            db.flush()
+            first_versions.setdefault(doc, ver)
+            for p in (1, 2):
+                db.add(
+                    models.DocumentProfile(
+                        document_id=doc.id,
+                        version_id=ver.id,
+                        doc_type=f"v{v}p{p}",
+                        tags=["t"],
+                        summary=f"summary {n}",
+                        created_at=t0 + timedelta(hours=p),
+                    )
+                )
+    db.add(models.Document(kb_id=kb.id, title="empty", created_at=t0 - timedelta(days=1)))
+    # doc18's v2 never became current (e.g. its ingestion failed): its catalog entry stays on v1
+    doc18 = next(d for d in first_versions if d.title == "doc18")
+    doc18.current_version_id = first_versions[doc18].id
+    db.commit()
+    kb_id = kb.id
+
+    monkeypatch.setattr(catalog, "_cache", catalog.OrderedDict())
+    statements.clear()
+    answer, cites = AgentOrchestrator()._answer_list_documents("list documents", scope=AgentScope(kb_id=kb_id), db=db)
+    assert len(statements) == 1
+    lines = answer.splitlines()
+    assert lines[0].endswith("(21):")
+    # newest document first; its current (else newest) version's newest profile
+    assert lines[1].startswith("- doc19 — v2p2 · t (document_id=")
+    assert lines[2].startswith("- doc18 — v1p2 · t (document_id=")
+    assert lines[-1].startswith("- empty (document_id=")
+    assert cites[-1].metadata["version_id"] is None
+
+    statements.clear()
+    cached = catalog.kb_catalog(db, kb_id)
+    assert len(cached) == 21 and statements == []
+    # the cached rows are shared between requests, so they are immutable
+    assert isinstance(cached, tuple) and cached[0].tags == ("t",)
+
+    catalog.invalidate(kb_id)
+    catalog.kb_catalog(db, kb_id)
+    assert len(statements) == 1
+
+
+def test_document_profile_follows_the_current_version():
+    engine = create_engine("sqlite://", future=True)
+    models.Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine, future=True)()
+    doc = models.Document(title="doc")
+    db.add(doc)
+    db.flush()
+    versions = []
+    for v in (1, 2):
+        ver = models.DocumentVersion(document_id=doc.id, version_number=v)
+        db.add(ver)
+        db.flush()
+        db.add(models.DocumentProfile(document_id=doc.id, version_id=ver.id, doc_type=f"v{v}"))
+        versions.append(ver)
+    db.commit()
+
+    # documents from before current_version_id: the newest version
+    assert get_document_profile(doc.id, db=db)["doc_type"] == "v2"
+    # v2 is still being ingested: the profile stays on the served v1
+    doc.current_version_id = versions[0].id
+    db.commit()
+    got = get_document_profile(doc.id, db=db)
+    assert got["doc_type"] == "v1" and got["version_id"] == versions[0].id
@@ -0,0 +1,40 @@
+from app.embeddings import embedding_cache
+from app.embeddings.embedding_cache import EmbeddingCache, text_hash
+
+
+def test_hits_misses_and_lru_eviction_under_the_byte_budget(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: clock[0])
+    # four float32 values are 16 bytes per row; 40 bytes hold two rows
+    cache = EmbeddingCache(str(tmp_path / "emb.sqlite3"), max_bytes=40)
+    a, b, c = text_hash("a"), text_hash("b"), text_hash("c")
+
+    cache.put_many("m", [(a, [1.0, 2.0, 3.0, 4.0]), (b, [0.5] * 4)])
+    clock[0] += 1
+    assert cache.get_many("m", [a, a, c]) == {a: [1.0, 2.0, 3.0, 4.0]}
+    assert (cache.hits, cache.misses) == (2, 1)
+    # the same hash under another embedder is a different entry
+    assert cache.get_many("other", [a]) == {}
+
+    clock[0] += 1
+    cache.put_many("m", [(c, [0.0] * 4)])
+    # "b" was read least recently, so it goes first
+    assert set(cache.get_many("m", [a, b, c])) == {a, c}
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["bytes"] == 32 and stats["writes"] == 3
+
+    # overwriting a row does not count its bytes twice
+    cache.put_many("m", [(a, [9.0] * 4)])
+    assert cache.stats()["bytes"] == 32
+
+
+def test_reopening_the_file_keeps_vectors_and_size(tmp_path):
+    path = str(tmp_path / "emb.sqlite3")
+    cache = EmbeddingCache(path, max_bytes=0)
+    cache.put_many("m", [(text_hash("x"), [0.25, -1.0])])
+    cache.close()
+
+    reopened = EmbeddingCache(path, max_bytes=0)
+    assert reopened.get_many("m", [text_hash("x")]) == {text_hash("x"): [0.25, -1.0]}
+    assert reopened.stats()["bytes"] == 8
+    assert reopened.stats()["hit_rate"] == 1.0
@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+
+from app.embeddings.batching import EmbeddingService
+
+
+def _service(encode_fn, **kwargs):
+    opts = {"max_batch": 32, "window_ms": 50, "threads": 1, **kwargs}
+    return EmbeddingService(encode_fn, **opts)
+
+
+def test_concurrent_requests_share_one_batch_up_to_the_cap():
+    batches = []
+
+    def encode(texts):
+        batches.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+    svc = _service(encode, window_ms=100)
+    futures = [svc.submit("x" * n) for n in range(1, 6)]
+    assert [f.result(5) for f in futures] == [[float(n)] for n in range(1, 6)]
+    # all five arrived inside one window
+    assert batches == [["x", "xx", "xxx", "xxxx", "xxxxx"]]
+
+    batches.clear()
+    capped = _service(encode, max_batch=2, window_ms=100)
+    assert capped.encode(["a", "b", "c", "d", "e"]) == [[1.0]] * 5
+    assert [len(b) for b in batches] == [2, 2, 1]
+    assert capped.stats()["batch_size"]["count"] == 3
+
+
+def test_encoder_errors_and_short_results_fail_every_caller():
+    def boom(texts):
+        raise RuntimeError("model unavailable")
+
+    svc = _service(boom)
+    futures = [svc.submit(t) for t in ("a", "b")]
+    for f in futures:
+        with pytest.raises(RuntimeError, match="model unavailable"):
+            f.result(5)
+
+    # one vector for two texts: the second caller must not hang
+    short = _service(lambda texts: [[0.0]])
+    futures = [short.submit(t) for t in ("a", "b")]
+    for f in futures:
+        with pytest.raises(ValueError, match="1 vectors for 2 texts"):
+            f.result(5)
+
+
+def test_encode_times_out_and_skips_abandoned_texts():
+    started, release = threading.Event(), threading.Event()
+    seen = []
+
+    def slow(texts):
+        seen.append(list(texts))
+        started.set()
+        release.wait(5)
+        return [[0.0] for _ in texts]
+
+    svc = _service(slow, window_ms=0)
+    blocker = svc.submit("first")
+    assert started.wait(5)
+    with pytest.raises(TimeoutError):
+        svc.encode(["late"], timeout=0.05)
+    assert svc.stats()["timeouts"] == 1
+
+    release.set()
+    assert blocker.result(5) == [0.0]
+    assert svc.encode(["next"], timeout=5) == [[0.0]]
+    # "late" was cancelled while queued and never reached the encoder
+    assert seen == [["first"], ["next"]]
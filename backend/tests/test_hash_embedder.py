@@ -0,0 +1,29 @@
+import numpy as np
+
+from app.embeddings import hash_embedder
+from app.embeddings.hash_embedder import _hash_embed, hash_embed_batch
+
+TEXTS = ["", "hello world", "naïve café ✓", "x" * 5000]
+
+
+def test_batch_matches_reference_bit_for_bit():
+    for dim in (1, 7, 8, 384, 1000):
+        batch64 = hash_embed_batch(TEXTS, dim, dtype=np.float64)
+        batch32 = hash_embed_batch(TEXTS, dim)
+        ref = np.array([_hash_embed(t, dim) for t in TEXTS], dtype=np.float64)
+        assert batch32.dtype == np.float32
+        assert batch64.tobytes() == ref.tobytes()
+        assert batch32.tobytes() == ref.astype(np.float32).tobytes()
+
+
+def test_process_pool_path_matches_local(monkeypatch):
+    texts = [f"chunk {i}" for i in range(40)]
+    monkeypatch.setattr(hash_embedder, "HASH_EMBED_PROCESSES", 2)
+    monkeypatch.setattr(hash_embedder, "HASH_EMBED_MP_MIN_BATCH", 10)
+    try:
+        pooled = hash_embed_batch(texts, 64)
+    finally:
+        if hash_embedder._pool is not None:
+            hash_embedder._pool.shutdown()
+            hash_embedder._pool = None
+    assert pooled.tobytes() == hash_embedder._hash_embed_local(texts, 64, np.float32).tobytes()
@@ -0,0 +1,128 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db import models
+from app.db.bulk import bulk_insert_chunks
+from app.embeddings import vector_store
+from app.retrieval import hybrid, lexical
+from app.retrieval.hybrid import rrf_fuse
+
+
+def test_rrf_prefers_hits_found_by_both_legs():
+    fused = rrf_fuse([["a", "b", "c"], ["d", "b"]], k=60)
+    assert [vid for vid, _ in fused][:2] == ["b", "a"]
+    assert dict(fused)["b"] == 1 / 62 + 1 / 62
+
+
+def test_hybrid_search_survives_a_failed_vector_leg(monkeypatch):
+    def vector_down(*args, **kwargs):
+        raise RuntimeError("embedding provider unavailable")
+
+    lex_hits = [{"id": f"c{i}", "text": f"hit {i}", "metadata": {"document_id": "d"}} for i in range(3)]
+    monkeypatch.setattr(vector_store, "query_documents", vector_down)
+    monkeypatch.setattr(hybrid, "_lexical_leg", lambda query, **kwargs: lex_hits)
+
+    res = hybrid.hybrid_search("INV-2023-0042", n_results=2)
+    assert res["ids"] == [["c0", "c1"]]
+    assert res["sources"] == [[["lexical"], ["lexical"]]] and res["distances"] == [[None, None]]
+    assert res["degraded"] == {"vector": "embedding provider unavailable"}
+    assert res["timings_ms"]["vector"] is None and res["legs"] == {"vector": 0, "lexical": 3}
+
+    # with both legs down there is nothing to fall back to
+    monkeypatch.setattr(hybrid, "_lexical_leg", vector_down)
+    with pytest.raises(RuntimeError):
+        hybrid.hybrid_search("q")
+
+
+def test_query_terms_keep_identifiers_together():
+    assert lexical.fts5_match("who paid INV-2023-0042?") == '"who" OR "paid" OR "INV 2023 0042"'
+    assert lexical.pg_tsquery("part AB/17") == "('part') | ('AB' & '17')"
+    assert lexical.fts5_match(" ?! ") is None
+
+
+def test_sqlite_fts_index_tracks_chunk_rows():
+    engine = create_engine("sqlite://", future=True)
+    models.Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        assert lexical.ensure_index(conn)
+    db = sessionmaker(bind=engine, future=True)()
+
+    kb = models.KnowledgeBase(name="kb")
+    db.add(kb)
+    db.flush()
+    docs = []
+    for title in ("a", "b"):
+        doc = models.Document(kb_id=kb.id, title=title)
+        db.add(doc)
+        db.flush()
+        ver = models.DocumentVersion(document_id=doc.id, version_number=1)
+        db.add(ver)
+        db.flush()
+        docs.append((doc, ver))
+    db.commit()
+    bulk_insert_chunks(db, [
+        {"version_id": docs[0][1].id, "text": "Invoice INV-2023-0042 was paid late", "start_pos": 0, "end_pos": 35},
+        {"version_id": docs[0][1].id, "text": "quarterly revenue grew", "start_pos": 35, "end_pos": 57},
+        {"version_id": docs[1][1].id, "text": "invoice INV-2023-0099 is open", "start_pos": 0, "end_pos": 29},
+    ])
+
+    hits = lexical.search(db, "status of INV-2023-0042", n_results=5, kb_id=kb.id)
+    assert hits[0]["text"].startswith("Invoice INV-2023-0042")
+    assert hits[0]["metadata"]["document_id"] == docs[0][0].id
+
+    only_b = lexical.search(db, "invoice", n_results=5, document_ids=[docs[1][0].id])
+    assert [h["metadata"]["document_id"] for h in only_b] == [docs[1][0].id]
+
+    # a newer (empty) version of b becomes current: its old chunks are history
+    v2 = models.DocumentVersion(document_id=docs[1][0].id, version_number=2)
+    db.add(v2)
+    db.flush()
+    docs[1][0].current_version_id = v2.id
+    db.commit()
+    assert lexical.search(db, "invoice", n_results=5, document_ids=[docs[1][0].id]) == []
+    assert len(lexical.search(db, "invoice", n_results=5, document_ids=[docs[1][0].id], include_history=True)) == 1
+
+    db.query(models.Chunk).filter(models.Chunk.version_id == docs[0][1].id).delete()
+    db.commit()
+    assert lexical.search(db, "INV-2023-0042", n_results=5) == []
+
+
+def test_sqlite_fts_joins_on_chunk_id_and_upgrades_legacy_index(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fts.db'}", future=True)
+    models.Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine, future=True)()
+    kb = models.KnowledgeBase(name="kb")
+    db.add(kb)
+    db.flush()
+    doc = models.Document(kb_id=kb.id, title="a")
+    db.add(doc)
+    db.flush()
+    ver = models.DocumentVersion(document_id=doc.id, version_number=1)
+    db.add(ver)
+    db.commit()
+    bulk_insert_chunks(db, [{"version_id": ver.id, "text": f"filler {i}", "start_pos": i, "end_pos": i + 1} for i in range(5)])
+    bulk_insert_chunks(db, [{"version_id": ver.id, "text": "alpha beta", "start_pos": 9, "end_pos": 19}])
+
+    # an index from before chunk_id (external content keyed by rowid) is rebuilt and backfilled
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE VIRTUAL TABLE chunks_fts USING fts5(text, content='chunks', content_rowid='rowid')")
+        assert lexical.ensure_index(conn)
+    assert [h["text"] for h in lexical.search(db, "alpha", n_results=5)] == ["alpha beta"]
+
+    # VACUUM may renumber chunks' implicit rowids; the index is keyed by chunk_id
+    db.query(models.Chunk).filter(models.Chunk.text.like("filler%")).delete(synchronize_session=False)
+    db.commit()
+    with engine.connect() as conn:
+        conn.exec_driver_sql("VACUUM")
+    chunk = db.query(models.Chunk).one()
+    chunk.text = "gamma beta"
+    db.commit()
+    assert lexical.search(db, "alpha", n_results=5) == []
+    assert lexical.search(db, "gamma", n_results=5)[0]["id"] == chunk.id
+
+    db.delete(chunk)
+    db.commit()
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT count(*) FROM chunks_fts").scalar() == 0
+        assert conn.exec_driver_sql("SELECT count(*) FROM chunks_fts_rowid").scalar() == 0
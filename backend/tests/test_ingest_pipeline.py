@@ -0,0 +1,133 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db import catalog, models
+from app.embeddings import vector_store
+from app.ingestion import pipeline
+from app.ingestion.pipeline import IngestionContext
+
+
+def _paragraphs(n, edited=None):
+    return "\n".join(("EDITED " if i == edited else "") + f"paragraph {i} " + "x" * 80 for i in range(n))
+
+
+def test_embed_stage_pages_chunks_from_the_db_and_reuses_unchanged_vectors(monkeypatch):
+    engine = create_engine("sqlite://", future=True)
+    models.Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine, future=True)()
+    doc = models.Document(title="notes")
+    job = models.IngestionJob()
+    db.add_all([doc, job])
+    db.flush()
+    item = models.IngestionItem(ingestion_job_id=job.id, document_id=doc.id, detail={})
+    db.add(item)
+    db.commit()
+
+    monkeypatch.setattr(vector_store, "INDEX_BATCH_SIZE", 2)
+    pulled = []
+
+    def add_documents_stream(docs, on_batch=None):
+        pulled.append([])
+        for d in docs:
+            pulled[-1].append(d)
+        return {"encoded": 0, "reused": 0, "batches": 0, "docs_per_s": None}
+
+    monkeypatch.setattr(vector_store, "add_documents_stream", add_documents_stream)
+
+    def ingest(text):
+        ctx = IngestionContext(db=db, job=job, item=item, doc=doc, file_name="n.txt", file_path="n.txt", text=text)
+        pipeline._stage_chunk(ctx)
+        pipeline._stage_embed(ctx)
+        return ctx
+
+    v1 = ingest(_paragraphs(100))
+    assert len(v1.text) == pipeline.SNIPPET_CHARS
+    stored = db.query(models.Chunk.id, models.Chunk.start_pos).filter(models.Chunk.version_id == v1.version.id)
+    assert [d["id"] for d in pulled[0]] == [c.id for c in sorted(stored, key=lambda c: c.start_pos)]
+    assert len(pulled[0]) == v1.chunk_count > 2
+    assert all(d["embedding_from"] is None for d in pulled[0])
+
+    v2 = ingest(_paragraphs(100, edited=80))
+    assert db.get(models.Document, doc.id).current_version_id == v2.version.id
+    old_by_text = {d["text"]: d["id"] for d in pulled[0]}
+    reused = [d for d in pulled[1] if d["embedding_from"]]
+    # with the default line-anchored boundaries only the chunks around the edit are re-embedded
+    assert len(pulled[1]) - len(reused) <= 2
+    assert v2.previous_version.id == v1.version.id and v2.version.meta == {"snap_window": pipeline.CHUNK_SNAP_WINDOW}
+    assert all(old_by_text[d["text"]] == d["embedding_from"] for d in reused)
+    assert all(d["metadata"]["version_id"] == v2.version.id for d in pulled[1])
+
+
+def test_activating_a_version_refreshes_the_catalog_even_when_embedding_fails(monkeypatch):
+    engine = create_engine("sqlite://", future=True)
+    models.Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine, future=True)()
+    kb = models.KnowledgeBase(name="kb")
+    db.add(kb)
+    db.flush()
+    doc = models.Document(title="notes", kb_id=kb.id)
+    job = models.IngestionJob(kb_id=kb.id)
+    db.add_all([doc, job])
+    db.flush()
+    item = models.IngestionItem(ingestion_job_id=job.id, document_id=doc.id, detail={})
+    db.add(item)
+    db.commit()
+    monkeypatch.setattr(catalog, "_cache", catalog.OrderedDict())
+
+    def unavailable(docs, on_batch=None):
+        raise RuntimeError("vector store down")
+
+    monkeypatch.setattr(vector_store, "add_documents_stream", unavailable)
+    versions = []
+    for text in ("first", "second"):
+        ctx = IngestionContext(db=db, job=job, item=item, doc=doc, file_name="n.txt", file_path="n.txt", text=text)
+        pipeline._stage_chunk(ctx)
+        # routed against while ingesting: still the previous current version, if any
+        assert [e.version_id for e in catalog.kb_catalog(db, kb.id)] == [versions[-1] if versions else ctx.version.id]
+        assert pipeline._stage_embed(ctx)["skipped"]
+        versions.append(ctx.version.id)
+        # no profile stage: the cached entry must still follow the new current version
+        assert [e.version_id for e in catalog.kb_catalog(db, kb.id)] == [ctx.version.id]
+    assert versions[0] != versions[1]
+
+
+def test_diff_base_is_the_served_version_and_keeps_its_chunking(monkeypatch):
+    engine = create_engine("sqlite://", future=True)
+    models.Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine, future=True)()
+    doc = models.Document(title="legacy")
+    job = models.IngestionJob()
+    db.add_all([doc, job])
+    db.flush()
+    item = models.IngestionItem(ingestion_job_id=job.id, document_id=doc.id, detail={})
+    # a version from before chunking was recorded: fixed windows, no meta
+    legacy = models.DocumentVersion(document_id=doc.id, version_number=1)
+    db.add_all([item, legacy])
+    db.flush()
+    doc.current_version_id = legacy.id
+    db.commit()
+    monkeypatch.setattr(vector_store, "add_documents_stream", lambda docs, on_batch=None: {
+        "encoded": 0, "reused": 0, "batches": 0, "docs_per_s": None, "docs": list(docs)
+    })
+
+    def ingest(text, embed=True):
+        ctx = IngestionContext(db=db, job=job, item=item, doc=doc, file_name="n.txt", file_path="n.txt", text=text)
+        out = pipeline._stage_chunk(ctx)
+        if embed:
+            pipeline._stage_embed(ctx)
+        return ctx, out
+
+    v2, out = ingest(_paragraphs(30))
+    assert v2.previous_version.id == legacy.id and out["snap_window"] == 0
+    # a version whose ingestion stopped after chunking is neither served nor a diff base
+    v3, _ = ingest(_paragraphs(30, edited=5), embed=False)
+    v4, out = ingest(_paragraphs(30, edited=6))
+    assert v4.previous_version.id == v2.version.id
+    assert v4.version.version_number == 4 and out["snap_window"] == 0
+
+    # the configured window applies to documents ingested for the first time
+    other = models.Document(title="new")
+    db.add(other)
+    db.commit()
+    ctx = IngestionContext(db=db, job=job, item=item, doc=other, file_name="n.txt", file_path="n.txt", text="x")
+    assert pipeline._stage_chunk(ctx)["snap_window"] == pipeline.CHUNK_SNAP_WINDOW == 200
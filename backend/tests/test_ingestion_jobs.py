@@ -0,0 +1,112 @@
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.api import documents, ingestion as ingestion_api
+from app.db import models
+from app.db.session import get_session
+from app.ingestion import pipeline, worker
+from app.storage import blob_store
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", future=True, connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, future=True)
+    monkeypatch.setattr(blob_store, "BLOB_DIR", str(tmp_path / "blobs"))
+    monkeypatch.setattr(pipeline, "get_session", Session)
+    app = FastAPI()
+    app.include_router(documents.router)
+    app.include_router(ingestion_api.router)
+    app.dependency_overrides[get_session] = lambda: Session()
+    db = Session()
+    doc = models.Document(title="report")
+    db.add(doc)
+    db.commit()
+    return TestClient(app), db, doc.id
+
+
+def _upload(client, doc_id, body=b"quarterly numbers"):
+    return client.post(f"/documents/{doc_id}/upload", files={"file": ("r.txt", body, "text/plain")})
+
+
+def _wait(client, job_id, done=("completed", "failed")):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        job = client.get(f"/ingestion/jobs/{job_id}").json()
+        if job["status"] in done:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} still {job['status']}")
+
+
+def test_upload_runs_every_stage_and_reports_progress(env, monkeypatch):
+    client, db, doc_id = env
+    seen, in_embed, release = [], threading.Event(), threading.Event()
+
+    def stage(name):
+        def run(ctx):
+            seen.append((name, ctx.item.status, ctx.item.detail["stage"]))
+            if name == "embed":
+                in_embed.set()
+                release.wait(5)
+            if name == "profile" and ctx.file_name == "broken.txt":
+                raise RuntimeError("profile exploded")
+            return {"ok": name}
+
+        return run
+
+    monkeypatch.setattr(pipeline, "STAGES", [(n, s, stage(n)) for n, s, _ in pipeline.STAGES])
+
+    r = _upload(client, doc_id)
+    assert r.status_code == 202 and r.json()["deduplicated"] is False
+    job_id = r.json()["job_id"]
+    assert in_embed.wait(5)
+    item = client.get(f"/ingestion/jobs/{job_id}").json()["items"][0]
+    assert (item["status"], item["stage"]) == ("embedding", "embed")
+    assert set(item["detail"]["stages"]) == {"parse", "chunk"}
+    release.set()
+
+    job = _wait(client, job_id)
+    assert job["status"] == "completed" and job["started_at"] and job["finished_at"]
+    item = job["items"][0]
+    assert item["status"] == "completed" and item["stage"] is None
+    assert list(item["detail"]["stages"]) == ["parse", "chunk", "embed", "profile"]
+    assert item["detail"]["stages"]["embed"]["ok"] == "embed"
+    assert seen == [
+        ("parse", "parsing", "parse"),
+        ("chunk", "chunking", "chunk"),
+        ("embed", "embedding", "embed"),
+        ("profile", "profiling", "profile"),
+    ]
+
+    # a stage error fails the item and its job
+    r = client.post(f"/documents/{doc_id}/upload", files={"file": ("broken.txt", b"other bytes", "text/plain")})
+    job = _wait(client, r.json()["job_id"])
+    assert job["status"] == "failed"
+    assert job["items"][0]["status"] == "failed" and job["items"][0]["detail"]["error"] == "profile exploded"
+
+
+def test_full_ingestion_queue_answers_503_and_fails_the_job(env, monkeypatch):
+    client, db, doc_id = env
+    monkeypatch.setattr(worker, "INGEST_MAX_CONCURRENT_JOBS", 0)
+    monkeypatch.setattr(worker, "INGEST_MAX_QUEUED_JOBS", 0)
+
+    r = _upload(client, doc_id)
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "5"
+    item = db.query(models.IngestionItem).one()
+    assert item.status == "failed" and item.job.status == "failed"
+    assert "queue is full" in item.detail["error"]
+    # a failed item is no dedup target: the retry is queued once there is room
+    monkeypatch.setattr(worker, "INGEST_MAX_CONCURRENT_JOBS", 1)
+    monkeypatch.setattr(pipeline, "STAGES", [])
+    r = _upload(client, doc_id)
+    assert r.status_code == 202 and r.json()["deduplicated"] is False
+    assert _wait(client, r.json()["job_id"])["status"] == "completed"
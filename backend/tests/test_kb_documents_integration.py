@@ -1,3 +1,5 @@
+import time
+
 import requests
 import pytest
 
@@ -104,10 +106,20 @@ def test_document_upload_and_chunking():
     files = {"file": ("hello.txt", small_text, "text/plain")}
 
     r3 = requests.post(f"{BASE}/documents/{doc_id}/upload", files=files)
-    assert r3.status_code == 200, r3.text
-    j = r3.json()
-    assert j.get("version_id")
-    assert j.get("chunks_created", 0) > 0
+    assert r3.status_code == 202, r3.text
+    job_id = r3.json()["job_id"]
+
+    # ingestion runs on the worker pool; poll the job until it settles
+    job = None
+    for _ in range(100):
+        job = requests.get(f"{BASE}/ingestion/jobs/{job_id}").json()
+        if job["status"] in ("completed", "failed"):
+            break
+        time.sleep(0.1)
+    assert job["status"] == "completed", job
+    item = job["items"][0]
+    assert item.get("version_id")
+    assert item.get("chunks_created", 0) > 0
 
     # cleanup: remove rows via API
     requests.delete(f"{BASE}/documents/{doc_id}")
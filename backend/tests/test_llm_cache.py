@@ -0,0 +1,52 @@
+import httpx
+
+from app.embeddings import llm, llm_cache
+from app.embeddings.llm_clients import ProviderClient
+
+
+def test_chat_caches_deterministic_calls_only(tmp_path, monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json={"choices": [{"message": {"content": f"reply {len(calls)}"}}]})
+
+    client = ProviderClient("local", "http://llm.local/v1", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(llm, "DEFAULT_PROVIDER", "openai")
+    monkeypatch.setattr(llm, "_provider_client", lambda provider: (client, "m"))
+    monkeypatch.setattr(llm_cache, "_cache", llm_cache.LLMResponseCache(str(tmp_path / "llm.sqlite3"), 0, 0))
+    msgs = [{"role": "user", "content": "route this"}]
+
+    first = llm.chat(msgs, temperature=0.0)
+    again = llm.chat(msgs, temperature=0.0)
+    assert (first["content"], first["cached"]) == ("reply 1", False)
+    assert (again["content"], again["cached"]) == ("reply 1", True)
+    # different max_tokens is a different prompt; opt-out and sampled calls always hit the provider
+    assert llm.chat(msgs, temperature=0.0, max_tokens=5)["content"] == "reply 2"
+    assert llm.chat(msgs, temperature=0.0, cache=False)["content"] == "reply 3"
+    assert llm.chat(msgs)["content"] == "reply 4"
+    assert llm.chat(msgs)["content"] == "reply 5"
+    assert llm.chat(msgs, cache=True)["content"] == "reply 6"
+    assert llm.chat(msgs, cache=True)["content"] == "reply 6"
+    assert len(calls) == 6
+
+
+def test_ttl_and_size_cap(tmp_path, monkeypatch):
+    cache = llm_cache.LLMResponseCache(str(tmp_path / "llm.sqlite3"), max_bytes=250, ttl_s=60)
+    clock = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: clock[0])
+
+    for i in range(3):
+        cache.put("openai", "m", 0.0, f"k{i}", "x" * 100)
+        clock[0] += 1
+    # over 250 bytes: the least recently written entry goes
+    assert cache.get("openai", "m", 0.0, "k0") is None
+    assert cache.get("openai", "m", 0.0, "k2") == "x" * 100
+    assert cache.stats()["evictions"] == 1 and cache.stats()["bytes"] == 200
+
+    clock[0] += 60
+    assert cache.get("openai", "m", 0.0, "k2") is None
+    assert cache.stats()["expired"] == 1
+
+    reopened = llm_cache.LLMResponseCache(cache.path, max_bytes=250, ttl_s=60)
+    assert reopened.stats()["bytes"] == 100
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from app.api import streaming
+from app.embeddings import llm, llm_clients
+from app.embeddings.llm_clients import LLMRequestError, ProviderClient
+
+
+def _reply(content):
+    return httpx.Response(200, json={"choices": [{"message": {"role": "assistant", "content": content}}]})
+
+
+def test_retries_transient_errors_then_succeeds(monkeypatch):
+    monkeypatch.setattr(llm_clients, "LLM_BACKOFF_BASE_S", 0.0)
+    seen = []
+
+    def handler(request):
+        seen.append((request.url.path, request.headers.get("authorization")))
+        if len(seen) == 1:
+            return httpx.Response(503)
+        if len(seen) == 2:
+            raise httpx.ConnectError("reset", request=request)
+        return _reply("ok")
+
+    client = ProviderClient("local", "http://llm.local/v1/", "k", transport=httpx.MockTransport(handler))
+    data = client.post("/chat/completions", {"messages": []})
+    assert data["choices"][0]["message"]["content"] == "ok"
+    assert seen == [("/v1/chat/completions", "Bearer k")] * 3
+    assert client.stats == {"requests": 3, "retries": 2, "errors": 0, "streams": 0}
+
+    async def go():
+        return await client.apost("/chat/completions", {"messages": []})
+
+    assert asyncio.run(go())["choices"][0]["message"]["content"] == "ok"
+
+
+def test_client_errors_are_not_retried():
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        return httpx.Response(400, json={"error": "bad model"})
+
+    client = ProviderClient("local", "http://llm.local/v1", transport=httpx.MockTransport(handler))
+    with pytest.raises(LLMRequestError, match="400"):
+        client.post("/chat/completions", {})
+    assert len(calls) == 1
+
+
+def test_registry_reuses_one_client_per_base_url():
+    a = llm_clients.get_client("openai", "http://localhost:8001/v1")
+    assert llm_clients.get_client("openai", "http://localhost:8001/v1/") is a
+    assert llm_clients.get_client("openai", "http://localhost:8002/v1") is not a
+    asyncio.run(llm_clients.aclose_all())
+
+
+def test_rotated_api_key_is_used_by_the_cached_client(monkeypatch):
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get("authorization"))
+        return _reply("ok")
+
+    transport = httpx.MockTransport(handler)
+    real = llm_clients.ProviderClient
+    monkeypatch.setattr(llm_clients, "ProviderClient", lambda *a, **kw: real(*a, transport=transport, **kw))
+
+    async def apost(client):
+        return await client.apost("/chat/completions", {})
+
+    first = llm_clients.get_client("cerebras", "http://keys.local/v1", "old")
+    first.post("/chat/completions", {})
+    asyncio.run(apost(first))
+    rotated = llm_clients.get_client("cerebras", "http://keys.local/v1", "new")
+    assert rotated is first
+    rotated.post("/chat/completions", {})
+    asyncio.run(apost(rotated))
+    llm_clients.get_client("cerebras", "http://keys.local/v1", "").post("/chat/completions", {})
+    assert seen == ["Bearer old", "Bearer old", "Bearer new", "Bearer new", None]
+    assert rotated.stats["requests"] == 5
+    asyncio.run(llm_clients.aclose_all())
+
+
+def test_stream_yields_chunks_and_retries_before_first_byte(monkeypatch):
+    monkeypatch.setattr(llm_clients, "LLM_BACKOFF_BASE_S", 0.0)
+    bodies = []
+
+    def handler(request):
+        bodies.append(request.content)
+        if len(bodies) == 1:
+            return httpx.Response(429, headers={"retry-after": "0"})
+        chunks = [{"choices": [{"delta": {"content": t}}]} for t in ("Hel", "lo")]
+        sse = "".join(f"data: {json.dumps(c)}\n\n" for c in chunks) + "data: [DONE]\n\n"
+        return httpx.Response(200, text=sse, headers={"content-type": "text/event-stream"})
+
+    client = ProviderClient("local", "http://llm.local/v1", transport=httpx.MockTransport(handler))
+
+    async def go():
+        return [c["choices"][0]["delta"]["content"] async for c in client.astream("/chat/completions", {"model": "m"})]
+
+    assert asyncio.run(go()) == ["Hel", "lo"]
+    assert json.loads(bodies[-1]) == {"model": "m", "stream": True}
+    assert client.stats == {"requests": 2, "retries": 1, "errors": 0, "streams": 1}
+
+
+def test_answer_events_stream_tokens_and_record_ttft(monkeypatch):
+    monkeypatch.setattr(llm, "DEFAULT_PROVIDER", "stub")
+    before = streaming.ttft_ms.snapshot()["count"]
+    result = {}
+
+    async def go():
+        return [e async for e in streaming.answer_events("q", [{"text": "ctx"}], started=time.perf_counter(), result=result)]
+
+    events = asyncio.run(go())
+    tokens = [json.loads(e.split("data: ", 1)[1]) for e in events]
+    assert all(e.startswith("event: token\n") for e in events) and len(events) > 1
+    assert "".join(t["text"] for t in tokens) == result["answer"] == llm.generate_answer("q", [{"text": "ctx"}])["answer"]
+    assert result["provider"] == "stub" and result["ttft_ms"] >= 0
+    assert streaming.ttft_ms.snapshot()["count"] == before + 1
+
+
+def test_async_callers_queue_on_the_limit_and_stale_clients_close():
+    state = {"now": 0, "peak": 0}
+
+    async def handler(request):
+        state["now"] += 1
+        state["peak"] = max(state["peak"], state["now"])
+        await asyncio.sleep(0.01)
+        state["now"] -= 1
+        return _reply("ok")
+
+    client = ProviderClient("local", "http://llm.local/v1", max_concurrency=2, transport=httpx.MockTransport(handler))
+
+    async def burst():
+        out = await asyncio.gather(*(client.apost("/chat/completions", {}) for _ in range(6)))
+        return out, client._aclient
+
+    out, first = asyncio.run(burst())
+    assert len(out) == 6 and state["peak"] == 2
+    # a new event loop gets a new pool; the old one is closed, not leaked
+    _, second = asyncio.run(burst())
+    assert second is not first and first.is_closed
+    # every slot was handed back
+    assert all(client._slots.acquire(blocking=False) for _ in range(2))
@@ -0,0 +1,169 @@
+import multiprocessing
+import threading
+
+import numpy as np
+import pytest
+
+from app.embeddings import numpy_index
+from app.embeddings.numpy_index import NumpyIndex
+
+
+def _fill(idx, X, kb="kb1", step=50):
+    for s in range(0, len(X), step):
+        rows = range(s, min(s + step, len(X)))
+        idx.add(
+            [f"v{i}" for i in rows],
+            [f"text {i}" for i in rows],
+            X[s : s + step],
+            [{"kb_id": kb, "document_id": f"d{i % 3}"} for i in rows],
+        )
+
+
+def test_query_matches_brute_force_with_filters(tmp_path):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(300, 16)).astype(np.float32)
+    idx = NumpyIndex(str(tmp_path))
+    _fill(idx, X)
+    q = rng.normal(size=16).astype(np.float32)
+
+    res = idx.query([q], n_results=7, where={"$and": [{"kb_id": "kb1"}, {"$or": [{"document_id": "d0"}, {"document_id": "d2"}]}]})
+    dist = ((X - q) ** 2).sum(axis=1)
+    dist[[i % 3 == 1 for i in range(len(X))]] = np.inf
+    expected = [f"v{i}" for i in np.argsort(dist)[:7]]
+    assert res["ids"][0] == expected
+    assert np.allclose(res["distances"][0], np.sort(dist)[:7], rtol=1e-4)
+    assert all(m["document_id"] != "d1" for m in res["metadatas"][0])
+
+
+def test_kb_shards_are_isolated(tmp_path):
+    rng = np.random.default_rng(1)
+    idx = NumpyIndex(str(tmp_path))
+    _fill(idx, rng.normal(size=(20, 8)).astype(np.float32), kb="a")
+    _fill(idx, rng.normal(size=(20, 8)).astype(np.float32), kb="b")
+    res = idx.query([np.zeros(8, np.float32)], n_results=50, where={"kb_id": "b"})
+    assert len(res["ids"][0]) == 20
+    assert {m["kb_id"] for m in res["metadatas"][0]} == {"b"}
+
+    idx.drop_kb("a")
+    assert not (tmp_path / "a").exists()
+    assert len(idx.query([np.zeros(8, np.float32)], n_results=50)["ids"][0]) == 20
+
+
+def test_readd_delete_and_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(numpy_index, "NUMPY_MAX_SEGMENTS", 2)
+    rng = np.random.default_rng(2)
+    X = rng.normal(size=(200, 8)).astype(np.float32)
+    idx = NumpyIndex(str(tmp_path))
+    _fill(idx, X)
+    assert len(idx._shard("kb1").segments) <= 2
+
+    # re-adding an id replaces its vector and text
+    idx.add(["v5"], ["new"], X[:1], [{"kb_id": "kb1", "document_id": "d2"}])
+    got = idx.get(ids=["v5"], include=["documents", "embeddings"])
+    assert got["documents"] == ["new"]
+    assert np.allclose(got["embeddings"][0], X[0])
+
+    assert idx.delete(where={"document_id": "d0"}) == 67
+    assert idx.count() == 133
+    res = idx.query([X[3]], n_results=200)
+    assert "v3" not in res["ids"][0] and len(res["ids"][0]) == 133
+
+    # a second instance (another worker) sees the same state from disk
+    other = NumpyIndex(str(tmp_path))
+    assert other.count() == 133
+    assert other.compact()["kb1"]["segments_after"] == 1
+    assert idx.count() == 133
+
+
+def test_reader_survives_compaction_between_manifest_and_segments(tmp_path, monkeypatch):
+    rng = np.random.default_rng(5)
+    X = rng.normal(size=(200, 8)).astype(np.float32)
+    writer = NumpyIndex(str(tmp_path))
+    _fill(writer, X[:150])
+    reader = NumpyIndex(str(tmp_path))
+    assert reader.count() == 150
+    writer.add([f"v{i}" for i in range(150, 200)], [f"text {i}" for i in range(150, 200)], X[150:], [{"kb_id": "kb1"}] * 50)
+
+    # the reader sees the new manifest, but its segments are compacted away before it opens them
+    real = numpy_index._Segment
+    raced = {}
+
+    def segment(*args, **kwargs):
+        if not raced:
+            raced["compact"] = None
+            raced["compact"] = writer.compact()
+        return real(*args, **kwargs)
+
+    monkeypatch.setattr(numpy_index, "_Segment", segment)
+    res = reader.query([X[170]], n_results=1)
+    assert raced["compact"]["kb1"]["segments_after"] == 1
+    assert res["ids"][0] == ["v170"]
+    assert reader.count() == 200
+
+
+@pytest.mark.skipif(numpy_index.fcntl is None, reason="needs flock")
+def test_lazy_encoding_waits_for_the_writer_lock(tmp_path):
+    rng = np.random.default_rng(6)
+    X = rng.normal(size=(100, 16)).astype(np.float32)
+    _fill(NumpyIndex(str(tmp_path)), X)
+    shard_dir = tmp_path / numpy_index._shard_name("kb1")
+
+    # another process holds the writer lock: encoding the old segments must wait for it
+    with open(shard_dir / ".writer.lock", "a+") as fh:
+        numpy_index.fcntl.flock(fh, numpy_index.fcntl.LOCK_EX)
+        done = threading.Event()
+        t = threading.Thread(target=lambda: (NumpyIndex(str(tmp_path), quantization="int8").count(), done.set()))
+        t.start()
+        assert not done.wait(0.3)
+        assert not list(shard_dir.glob("*.sq8*"))
+        numpy_index.fcntl.flock(fh, numpy_index.fcntl.LOCK_UN)
+    t.join(5)
+    assert done.is_set()
+    assert list(shard_dir.glob("*.sq8*")) and not list(shard_dir.glob("*.tmp"))
+
+
+def test_quantized_search_rescores_with_full_precision(tmp_path):
+    rng = np.random.default_rng(3)
+    X = rng.normal(size=(400, 32)).astype(np.float32)
+    q = rng.normal(size=32).astype(np.float32)
+    exact = NumpyIndex(str(tmp_path))
+    _fill(exact, X)
+    expected = exact.query([q], n_results=10)
+
+    # segments written unquantized get encoded when loaded in a quantized mode
+    for mode in ("int8", "pq"):
+        idx = NumpyIndex(str(tmp_path), quantization=mode, rescore_factor=15)
+        res = idx.query([q], n_results=10)
+        assert res["ids"] == expected["ids"]
+        assert np.allclose(res["distances"][0], expected["distances"][0], rtol=1e-4)
+        mem = idx.memory()
+        assert mem["rows"] == 400 and mem["scanned_bytes"] < mem["float32_bytes"]
+    assert list(tmp_path.glob("kb1/*.sq8")) and list(tmp_path.glob("kb1/*.pq"))
+
+    # int8 codes alone keep most of the exact top k
+    short = NumpyIndex(str(tmp_path), quantization="int8", rescore_factor=1).query([q], n_results=10)
+    assert len(set(short["ids"][0]) & set(expected["ids"][0])) >= 8
+
+
+def _write_rows(root, prefix, n):
+    idx = NumpyIndex(root)
+    rng = np.random.default_rng(len(prefix))
+    for i in range(n):
+        idx.add([f"{prefix}{i}"], [prefix], rng.normal(size=(1, 4)).astype(np.float32), [{"kb_id": "kb1"}])
+
+
+def test_concurrent_writer_processes_lose_no_rows(tmp_path, monkeypatch):
+    # small segment cap so both processes also compact while the other appends
+    monkeypatch.setattr(numpy_index, "NUMPY_MAX_SEGMENTS", 3)
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_write_rows, args=(str(tmp_path), p, 60)) for p in ("a", "b")]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(60)
+        assert p.exitcode == 0
+
+    idx = NumpyIndex(str(tmp_path))
+    got = idx.get(where={"kb_id": "kb1"}, include=[])["ids"]
+    assert sorted(got) == sorted(f"{p}{i}" for p in "ab" for i in range(60))
+    assert idx.count() == 120
@@ -0,0 +1,54 @@
+import pytest
+
+pytest.importorskip("pypdf")
+
+from app.parsers import engine
+
+
+def _make_pdf(path, n_pages):
+    """Write a minimal multi-page PDF whose page i contains the text `page-<i>`."""
+    objs = []
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(n_pages))
+    objs.append("<< /Type /Catalog /Pages 2 0 R >>")
+    objs.append(f"<< /Type /Pages /Kids [{kids}] /Count {n_pages} >>")
+    font_id = 3 + 2 * n_pages
+    for i in range(n_pages):
+        stream = f"BT /F1 12 Tf 72 720 Td (page-{i}) Tj ET"
+        objs.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {4 + 2 * i} 0 R >>"
+        )
+        objs.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objs.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, body in enumerate(objs, start=1):
+        offsets.append(len(out))
+        out += f"{num} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for off in offsets:
+        out += f"{off:010d} 00000 n \n".encode("latin-1")
+    out += f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    path.write_bytes(bytes(out))
+
+
+def test_pages_come_back_in_order_across_ranges(tmp_path, monkeypatch):
+    pdf = tmp_path / "doc.pdf"
+    _make_pdf(pdf, 7)
+    monkeypatch.setattr(engine, "PARSE_PAGES_PER_TASK", 2)
+    monkeypatch.setattr(engine, "PARSE_POOL_SIZE", 2)
+    try:
+        pages = list(engine.iter_pdf_pages(str(pdf), max_pages=0))
+    finally:
+        engine.shutdown()
+    assert [p.strip() for p in pages] == [f"page-{i}" for i in range(7)]
+
+
+def test_page_cap_limits_extraction(tmp_path, monkeypatch):
+    pdf = tmp_path / "doc.pdf"
+    _make_pdf(pdf, 5)
+    monkeypatch.setattr(engine, "PARSE_POOL_SIZE", 1)
+    pages = list(engine.iter_pdf_pages(str(pdf), max_pages=3))
+    assert [p.strip() for p in pages] == ["page-0", "page-1", "page-2"]
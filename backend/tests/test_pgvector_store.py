@@ -0,0 +1,161 @@
+import csv
+import json
+import os
+import threading
+
+import pytest
+
+from app.embeddings import pgvector_store
+from app.embeddings.pgvector_store import PgVectorIndex, copy_payload, where_sql
+
+
+def test_where_sql_columns_meta_and_combinators():
+    assert where_sql(None) == ("TRUE", [], False)
+    assert where_sql({"kb_id": "k1"}) == ("cv.kb_id = %s", ["k1"], False)
+
+    sql, params, join = where_sql({"$and": [{"kb_id": "k1"}, {"document_id": {"$in": ["d1", "d2"]}}]})
+    assert sql == "(cv.kb_id = %s AND (dv.document_id = ANY(%s)))"
+    assert params == ["k1", ["d1", "d2"]] and join is True
+
+    # other keys compare the JSON metadata as text, or as a number for range operators
+    sql, params, join = where_sql({"$or": [{"lang": "en"}, {"page": {"$gte": 3}}, {"draft": {"$nin": [True]}}]})
+    assert sql == (
+        "((cv.meta ->> %s) = %s OR (cv.meta ->> %s)::double precision >= %s OR NOT ((cv.meta ->> %s) = ANY(%s)))"
+    )
+    assert params == ["lang", "en", "page", 3.0, "draft", ["true"]] and join is False
+
+    with pytest.raises(ValueError):
+        where_sql({"kb_id": {"$like": "k%"}})
+
+
+class _Cursor:
+    def __init__(self, log):
+        self.log = log
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.log.append(("execute", sql, params))
+
+    def copy_expert(self, sql, buf):
+        self.log.append(("copy", sql, buf.read()))
+
+    def fetchall(self):
+        return [("v1", "text", {"kb_id": "k1"}, 0.5)]
+
+
+class _Conn:
+    def __init__(self, log):
+        self.log = log
+
+    def cursor(self):
+        return _Cursor(self.log)
+
+    def commit(self):
+        self.log.append(("commit",))
+
+    def rollback(self):
+        self.log.append(("rollback",))
+
+    def close(self):
+        pass
+
+
+def _index(log):
+    idx = PgVectorIndex.__new__(PgVectorIndex)
+    idx.engine = type("Engine", (), {"raw_connection": lambda self: _Conn(log)})()
+    idx.dim = 2
+    idx._lock = threading.Lock()
+    return idx
+
+
+def test_add_copies_into_temp_table_and_upserts():
+    log = []
+    _index(log).add(
+        ["v1", "v2"],
+        ["first \x00text", 'quote " and, comma'],
+        [[0.5, 1.0], [2.0, -1.0]],
+        [{"kb_id": "k1", "version_id": "ver1", "page": 1}, {}],
+    )
+    kinds = [entry[0] for entry in log]
+    assert kinds == ["execute", "copy", "execute", "commit"]
+    assert log[0][1] == "CREATE TEMP TABLE chunks_vector_load (LIKE chunks_vector INCLUDING DEFAULTS) ON COMMIT DROP"
+    assert log[1][1].startswith("COPY chunks_vector_load (id, version_id, kb_id, text, embedding, meta) FROM STDIN")
+    assert "FORCE_NULL (version_id, kb_id)" in log[1][1]
+    upsert = log[2][1]
+    assert upsert.startswith("INSERT INTO chunks_vector (id, version_id, kb_id, text, embedding, meta) SELECT")
+    assert "ON CONFLICT (id) DO UPDATE SET" in upsert and "embedding = EXCLUDED.embedding" in upsert
+
+    rows = list(csv.reader(log[1][2].splitlines()))
+    assert rows[0][:5] == ["v1", "ver1", "k1", "first text", "[0.5,1]"]
+    assert json.loads(rows[0][5]) == {"kb_id": "k1", "version_id": "ver1", "page": 1}
+    # missing ids are empty fields, which FORCE_NULL loads as NULL
+    assert rows[1][:5] == ["v2", "", "", 'quote " and, comma', "[2,-1]"]
+
+
+def test_query_orders_by_distance_with_filter(monkeypatch):
+    monkeypatch.setattr(pgvector_store, "PGVECTOR_INDEX", "hnsw")
+    log = []
+    res = _index(log).query([[1.0, 0.0]], n_results=500, where={"document_id": "d1"})
+    assert res["ids"] == [["v1"]] and res["distances"] == [[0.25]]
+    assert log[0] == ("execute", "SET LOCAL hnsw.ef_search = %s", (500,))
+    _, sql, params = log[1]
+    assert "LEFT JOIN document_versions dv ON dv.id = cv.version_id" in sql
+    assert "WHERE dv.document_id = %s ORDER BY cv.embedding <-> %s::vector LIMIT %s" in sql
+    assert params == ["[1,0]", "d1", "[1,0]", 500]
+
+
+def test_copy_payload_is_valid_csv_for_odd_text():
+    buf = copy_payload(["a"], ["line\nbreak"], [[1.0]], [None])
+    assert list(csv.reader(buf)) == [["a", "", "", "line\nbreak", "[1]", "{}"]]
+
+
+PGVECTOR_TEST_URL = os.environ.get("PGVECTOR_TEST_URL")
+
+
+@pytest.mark.skipif(not PGVECTOR_TEST_URL, reason="set PGVECTOR_TEST_URL to a disposable Postgres database with pgvector")
+def test_pgvector_roundtrip_against_postgres():
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.orm import sessionmaker
+
+    from app.db import models
+
+    engine = create_engine(PGVECTOR_TEST_URL, future=True)
+    models.Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine, future=True)()
+    try:
+        kb = models.KnowledgeBase(name="pgvector-test")
+        db.add(kb)
+        db.flush()
+        doc = models.Document(kb_id=kb.id, title="d")
+        db.add(doc)
+        db.flush()
+        ver = models.DocumentVersion(document_id=doc.id, version_number=1)
+        db.add(ver)
+        db.commit()
+
+        idx = PgVectorIndex(engine)
+        meta = {"kb_id": kb.id, "version_id": ver.id, "document_id": doc.id}
+        idx.add(["p1", "p2"], ["near", "far"], [[0.0, 0.0, 1.0], [5.0, 5.0, 5.0]], [meta, meta])
+        idx.add(["p1"], ["near, updated"], [[0.0, 0.0, 1.0]], [meta])
+
+        res = idx.query([[0.0, 0.0, 0.0]], n_results=2, where={"document_id": doc.id})
+        assert res["ids"] == [["p1", "p2"]]
+        assert res["documents"][0][0] == "near, updated"
+        assert res["distances"][0][0] == pytest.approx(1.0)
+        assert idx.get(where={"$and": [{"kb_id": kb.id}, {"document_id": {"$in": [doc.id]}}]}, include=[])["ids"]
+
+        # vectors cascade with their version
+        db.delete(ver)
+        db.commit()
+        assert idx.get(ids=["p1", "p2"], include=[])["ids"] == []
+    finally:
+        db.rollback()
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {pgvector_store.TABLE}"))
+        models.Base.metadata.drop_all(engine)
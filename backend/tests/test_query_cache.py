@@ -0,0 +1,66 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.embeddings import query_cache
+from app.embeddings.query_cache import QueryEmbeddingCache
+
+
+def test_ttl_expiry_and_lru_eviction(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(query_cache.time, "monotonic", lambda: clock[0])
+    calls = []
+
+    def encode(q):
+        calls.append(q)
+        return [float(len(calls))]
+
+    cache = QueryEmbeddingCache(max_entries=2, ttl_s=10)
+    assert cache.get_or_compute("m", "what is  FTS?", encode) == [1.0]
+    # whitespace differences normalise to the same key
+    assert cache.get_or_compute("m", " what is FTS? ", encode) == [1.0]
+    assert cache.get_or_compute("other", "what is FTS?", encode) == [2.0]
+
+    # capacity 2: reading "m" makes "other" the least recently used, so "q2" evicts it
+    cache.get_or_compute("m", "what is FTS?", encode)
+    cache.get_or_compute("m", "q2", encode)
+    assert cache.stats()["entries"] == 2 and cache.stats()["evictions"] == 1
+    assert cache.get_or_compute("other", "what is FTS?", encode) == [4.0]
+
+    clock[0] += 10
+    assert cache.get_or_compute("other", "what is FTS?", encode) == [5.0]
+    assert cache.stats()["expired"] == 1
+    assert calls == ["what is  FTS?", "what is FTS?", "q2", "what is FTS?", "what is FTS?"]
+
+
+def test_concurrent_misses_share_one_computation():
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow(q):
+        calls.append(q)
+        started.set()
+        release.wait(5)
+        return [0.5]
+
+    cache = QueryEmbeddingCache(max_entries=8, ttl_s=0)
+    with ThreadPoolExecutor(4) as pool:
+        first = pool.submit(cache.get_or_compute, "m", "same", slow)
+        assert started.wait(5)
+        waiters = [pool.submit(cache.get_or_compute, "m", "same", slow) for _ in range(3)]
+        release.set()
+        assert [f.result(5) for f in [first, *waiters]] == [[0.5]] * 4
+    assert calls == ["same"]
+    assert cache.stats()["misses"] == 1 and cache.stats()["hits"] == 3
+
+
+def test_failed_computation_reaches_waiters_and_is_not_cached():
+    cache = QueryEmbeddingCache(max_entries=8, ttl_s=0)
+
+    def boom(q):
+        raise RuntimeError("encoder down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute("m", "q", boom)
+    assert cache.get_or_compute("m", "q", lambda q: [1.0]) == [1.0]
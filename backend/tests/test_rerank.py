@@ -0,0 +1,74 @@
+import time
+
+from app.retrieval import rerank
+
+
+class _LengthModel:
+    """Scores by text length; records how many pairs it saw."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.pairs = 0
+
+    def predict(self, pairs, **_):
+        time.sleep(self.delay)
+        self.pairs += len(pairs)
+        return [float(len(t)) for _, t in pairs]
+
+
+def _use(monkeypatch, model):
+    monkeypatch.setattr(rerank, "_model", model)
+    monkeypatch.setattr(rerank, "_model_error", None)
+    monkeypatch.setattr(rerank, "_cache", rerank.OrderedDict())
+    monkeypatch.setattr(rerank, "_overrunning", None)
+
+
+def test_rerank_orders_by_cross_encoder_and_caches(monkeypatch):
+    model = _LengthModel()
+    _use(monkeypatch, model)
+    ids = ["a", "b", "c", "d"]
+    texts = ["xx", "xxxx", "x", "xxx"]
+
+    order, scores, info = rerank.rerank("q", ids, texts, 2, budget_ms=5000)
+    assert order == [1, 3]
+    assert scores == [4.0, 3.0]
+    assert info["applied"] and info["cached"] == 0
+
+    order, _, info = rerank.rerank("  q ", ids, texts, 2, budget_ms=5000)
+    assert order == [1, 3]
+    assert info["cached"] == 4
+    assert model.pairs == 4
+
+
+def test_rerank_falls_back_to_vector_order_past_budget(monkeypatch):
+    model = _LengthModel(delay=0.2)
+    _use(monkeypatch, model)
+    order, scores, info = rerank.rerank("slow", ["a", "b", "c"], ["x", "xxx", "xx"], 2, budget_ms=20)
+    assert order == [0, 1]
+    assert scores is None
+    assert info == {"applied": False, "reason": "budget exceeded", "budget_ms": 20, "candidates": 3}
+
+    # the late scores still land in the cache for the next request
+    rerank._executor.submit(lambda: None).result()
+    order, _, info = rerank.rerank("slow", ["a", "b", "c"], ["x", "xxx", "xx"], 2, budget_ms=20)
+    assert order == [1, 2] and info["cached"] == 3
+
+
+def test_requests_skip_the_reranker_while_a_job_overruns(monkeypatch):
+    model = _LengthModel(delay=0.3)
+    _use(monkeypatch, model)
+    busy_before = rerank.stats()["busy"]
+    order, _, info = rerank.rerank("first", ["a", "b"], ["x", "xx"], 2, budget_ms=20)
+    assert info["reason"] == "budget exceeded" and order == [0, 1]
+
+    # a new question does not queue behind the overrunning job
+    t0 = time.perf_counter()
+    order, scores, info = rerank.rerank("second", ["a", "b"], ["x", "xx"], 2, budget_ms=1000)
+    assert (time.perf_counter() - t0) < 0.1
+    assert info == {"applied": False, "reason": "busy", "candidates": 2} and scores is None
+    assert rerank.stats()["busy"] == busy_before + 1
+
+    # once it has finished, scoring is attempted again
+    rerank._executor.submit(lambda: None).result()
+    _, _, info = rerank.rerank("second", ["a", "b"], ["x", "xx"], 2, budget_ms=1000)
+    assert info["applied"] and model.pairs == 4
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.agent import router as agent_router
+from app.agent.orchestrator import AgentOrchestrator
+from app.agent.schemas import AgentQueryRequest
+from app.agent.tools import AnswerTool, VectorSearchResult
+from app.api import chat, streaming
+from app.db import models
+
+
+def _db():
+    engine = create_engine("sqlite://", future=True, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine, future=True)()
+
+
+async def _slow_answer(query, contexts, meta=None):
+    if meta is not None:
+        meta.update(provider="fake", model="m")
+    for word in ("one ", "two ", "three ", "four"):
+        await asyncio.sleep(0.01)
+        yield word
+
+
+def _disconnect_after(tokens):
+    """ASGI send/receive for a client that goes away after `tokens` token events."""
+    seen = asyncio.Event()
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+        if sum(b"event: token" in m.get("body", b"") for m in sent) >= tokens:
+            seen.set()
+
+    async def receive():
+        await seen.wait()
+        return {"type": "http.disconnect"}
+
+    return send, receive, sent
+
+
+class _SearchTool:
+    def search(self, query, **kwargs):
+        return [VectorSearchResult(chunk_id="c1", text="one two three four", score=0.1, metadata={})]
+
+
+class _AnswerTool(AnswerTool):
+    def astream(self, query, contexts, meta=None):
+        return _slow_answer(query, contexts, meta)
+
+
+def test_agent_stream_disconnect_stores_partial_answer(monkeypatch):
+    db = _db()
+    monkeypatch.setattr(agent_router, "_orchestrator", AgentOrchestrator(search_tool=_SearchTool(), answer_tool=_AnswerTool()))
+
+    async def scenario():
+        resp = await agent_router.agent_query_stream(AgentQueryRequest(message="count"), db=db, user={"id": None})
+        send, receive, sent = _disconnect_after(2)
+        await resp({"type": "http"}, receive, send)
+        return sent
+
+    sent = asyncio.run(scenario())
+    assert not any(b"event: done" in m.get("body", b"") for m in sent)
+    run = db.query(models.AgentRun).one()
+    assert run.status == "aborted"
+    assert run.final_answer == "one two "
+    steps = {s.kind: s.payload for s in db.query(models.AgentStep).all()}
+    assert steps["synthesize"]["aborted"] is True and steps["verify"]["ok"] is False
+
+
+def test_chat_stream_disconnect_stores_partial_reply(monkeypatch):
+    db = _db()
+    session = models.ChatSession(user_id="u1")
+    db.add(session)
+    db.commit()
+    monkeypatch.setattr(streaming, "astream_answer", _slow_answer)
+    monkeypatch.setattr(chat, "_retrieve_contexts", lambda *args: ([{"chunk_id": "c1", "text": "x", "metadata": {}}], {}, None))
+
+    async def scenario():
+        resp = await chat.post_message_stream(session.id, {"query": "count"}, db=db, user={"id": "u1", "email": "u@x"})
+        send, receive, _ = _disconnect_after(3)
+        await resp({"type": "http"}, receive, send)
+
+    asyncio.run(scenario())
+    replies = [(m.role, m.content) for m in db.query(models.ChatMessage).order_by(models.ChatMessage.created_at).all()]
+    assert replies == [("user", "count"), ("assistant", "one two three ")]
+
+
+def test_chat_message_runs_no_queries_on_the_event_loop(monkeypatch):
+    db = _db()
+    session = models.ChatSession(user_id="u1", meta={"title": "t"})
+    db.add(session)
+    db.commit()
+    session_id = session.id
+
+    async def fake_rag(payload, db=None):
+        return {"answer": "hi"}
+
+    monkeypatch.setattr(chat, "rag_query", fake_rag)
+    loop_thread, on_loop = [], []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: on_loop.append(threading.get_ident() in loop_thread))
+
+    async def scenario():
+        loop_thread.append(threading.get_ident())
+        return await chat.post_message(session_id, {"query": "q"}, db=db, user={"id": "u1", "email": "u@x"})
+
+    body = asyncio.run(scenario())
+    assert on_loop and not any(on_loop)
+    assert body["session"]["meta"] == {"title": "t"}
+    assert body["question"]["content"] == "q" and body["answer"]["content"] == "hi"
@@ -0,0 +1,75 @@
+import hashlib
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import ingestion
+from app.api import documents
+from app.db import models
+from app.db.session import get_session
+from app.storage import blob_store
+
+BODY = b"quarterly report, final"
+SHA = hashlib.sha256(BODY).hexdigest()
+
+
+def _setup(tmp_path, monkeypatch):
+    engine = create_engine("sqlite://", future=True, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine, future=True)()
+    monkeypatch.setattr(blob_store, "BLOB_DIR", str(tmp_path / "blobs"))
+    queued = []
+    monkeypatch.setattr(ingestion, "submit", lambda fn, item_id, **kw: queued.append(item_id))
+    app = FastAPI()
+    app.include_router(documents.router)
+    app.dependency_overrides[get_session] = lambda: db
+    return db, TestClient(app), queued
+
+
+def _doc_with_version(db, content_hash):
+    doc = models.Document(title="report")
+    db.add(doc)
+    db.flush()
+    ver = models.DocumentVersion(document_id=doc.id, version_number=1, content_hash=content_hash)
+    db.add(ver)
+    db.commit()
+    return doc, ver
+
+
+def _upload(client, doc):
+    return client.post(f"/documents/{doc.id}/upload", files={"file": ("r.txt", BODY, "text/plain")})
+
+
+def test_reupload_of_current_version_is_unchanged(tmp_path, monkeypatch):
+    db, client, queued = _setup(tmp_path, monkeypatch)
+    doc, ver = _doc_with_version(db, SHA)
+    doc.current_version_id = ver.id
+    db.commit()
+
+    r = _upload(client, doc)
+    assert r.status_code == 200
+    assert r.json()["status"] == "unchanged" and r.json()["version_id"] == ver.id
+    assert queued == []
+
+
+def test_version_from_unfinished_ingestion_is_not_a_dedup_target(tmp_path, monkeypatch):
+    db, client, queued = _setup(tmp_path, monkeypatch)
+    # the version row exists, but its ingestion failed before it became current
+    doc, ver = _doc_with_version(db, SHA)
+    db.add(models.IngestionItem(document_id=doc.id, status="failed", detail={"sha256": SHA, "version_id": ver.id}))
+    db.commit()
+
+    r = _upload(client, doc)
+    assert r.status_code == 202
+    assert r.json()["deduplicated"] is False
+    assert queued == [r.json()["item_id"]]
+
+    # a document from before current_version_id: a completed ingestion makes the version a target
+    legacy, legacy_ver = _doc_with_version(db, SHA)
+    db.add(models.IngestionItem(document_id=legacy.id, status="completed", detail={"version_id": legacy_ver.id}))
+    db.commit()
+    r = _upload(client, legacy)
+    assert r.status_code == 200 and r.json()["version_id"] == legacy_ver.id
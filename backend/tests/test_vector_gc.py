@@ -0,0 +1,59 @@
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db import models
+from app.db.bulk import bulk_insert_chunks, delete_documents
+from app.embeddings import gc, vector_store
+from app.embeddings.numpy_index import NumpyIndex
+
+
+def test_document_delete_cascades_to_rows_and_vectors(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "_collection", NumpyIndex(str(tmp_path)))
+    engine = create_engine("sqlite://", future=True)
+    models.Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine, future=True)()
+
+    kb = models.KnowledgeBase(name="kb")
+    db.add(kb)
+    db.flush()
+    docs = []
+    for title in ("keep", "drop"):
+        doc = models.Document(kb_id=kb.id, title=title)
+        db.add(doc)
+        db.flush()
+        vers = []
+        for n in (1, 2):
+            ver = models.DocumentVersion(document_id=doc.id, version_number=n)
+            db.add(ver)
+            db.flush()
+            db.add(models.DocumentProfile(document_id=doc.id, version_id=ver.id))
+            vers.append(ver)
+        docs.append((doc, vers))
+    db.commit()
+
+    rows, vectors = [], []
+    for doc, vers in docs:
+        for ver in vers:
+            for i in range(3):
+                rows.append({"version_id": ver.id, "text": f"{doc.title} v{ver.version_number} #{i}", "start_pos": i, "end_pos": i + 1})
+                vectors.append({"kb_id": kb.id, "document_id": doc.id, "version_id": ver.id})
+    ids = bulk_insert_chunks(db, rows)
+    vector_store._collection.add(ids, [r["text"] for r in rows], np.eye(len(ids), dtype=np.float32), vectors)
+
+    drop_id = docs[1][0].id
+    removed = delete_documents(db, [drop_id])
+    assert removed == {"chunks": 6, "document_profiles": 2, "document_versions": 2, "documents": 1}
+    assert db.query(models.Chunk).count() == 6
+    assert vector_store.delete_vectors(document_id=drop_id, kb_id=kb.id, batch_size=4) == 6
+    assert vector_store._collection.count() == 6
+
+    # superseded version of the kept document, keyed on version_id
+    assert vector_store.delete_vectors(version_id=docs[0][1][0].id) == 3
+
+    # a vector written after its chunk was gone (e.g. a late ingest) is left for vacuum
+    vector_store._collection.add(["ghost"], ["late"], np.ones((1, len(ids)), np.float32), [{"kb_id": kb.id}])
+    assert gc.vacuum(db, dry_run=True)["sample"] == ["ghost"]
+    out = gc.vacuum(db, batch_size=2)
+    assert out["deleted"] == 1 and out["vectors_after"] == 3
+    assert sorted(vector_store._collection.get(include=[])["ids"]) == sorted(ids[3:6])